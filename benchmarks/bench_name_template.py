@@ -0,0 +1,162 @@
+"""
+命名模板的微基准测试：比较旧版（逐个 str.replace）与预编译模板的单个作品渲染耗时
+
+用法：python benchmarks/bench_name_template.py [作品数] [重复次数]
+"""
+import os
+import re
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from name_template import (NameCompiler,
+                           WINDOWS_RESERVED_CHARACTER_PATTERN,
+                           WINDOWS_RESERVED_CHARACTER_PATTERN_str,
+                           WINDOWS_RESERVED_CHARACTER_PATTERN_replace_str)
+
+OPTIONS = {
+    'release_date_format': '%y%m%d',
+    'delimiter': ' ',
+    'cv_list_left': '(CV ',
+    'cv_list_right': ')',
+    'exclude_square_brackets_in_work_name_flag': True,
+    'illegal_character_to_full_width_flag': True,
+    'tags_option': {'ordered_list': ['标签1', ['标签2', '替换2'], '标签3'], 'max_number': 5},
+    'age_cat_map_gen': '全年龄',
+    'age_cat_map_r15': 'R15',
+    'age_cat_map_r18': 'R18',
+    'age_cat_left': '(',
+    'age_cat_right': ')',
+    'age_cat_ignore_r18': False,
+    'series_name_left': '[',
+    'series_name_right': ']',
+}
+TEMPLATE = 'age_cat[maker_name][rjcode] series_name work_name release_date cv_list_str tags_list_str'
+
+
+def legacy_compile_new_name(template: str, metadata: dict, options: dict):
+    """
+    旧版 Renamer.__compile_new_name（RENAME 模式）的实现
+    """
+    def format_filename_str(name: str):
+        if name:
+            if options['illegal_character_to_full_width_flag']:
+                name = name.translate(name.maketrans(
+                    WINDOWS_RESERVED_CHARACTER_PATTERN_str, WINDOWS_RESERVED_CHARACTER_PATTERN_replace_str))
+            else:
+                name = WINDOWS_RESERVED_CHARACTER_PATTERN.sub('', name)
+            return name.strip()
+        else:
+            return name
+
+    template = format_filename_str(template)
+    work_name = format_filename_str(metadata['work_name'])
+    if options['exclude_square_brackets_in_work_name_flag']:
+        work_name = re.sub(r'【.*?】', '', work_name).strip()
+    maker_name = format_filename_str(metadata['maker_name'])
+    series_name = format_filename_str(metadata['series_name'])
+
+    new_name = template.replace('rjcode', metadata['rjcode'])
+    new_name = new_name.replace('work_name', work_name)
+    new_name = new_name.replace('maker_id', metadata['maker_id'])
+    new_name = new_name.replace('maker_name', maker_name)
+    if 'age_cat' in template:
+        if options['age_cat_ignore_r18'] and metadata['age_category'] == 'R18':
+            new_name = new_name.replace('age_cat', "")
+        else:
+            if metadata['age_category'] == 'GEN':
+                age_cat = options['age_cat_map_gen']
+            elif metadata['age_category'] == 'R15':
+                age_cat = options['age_cat_map_r15']
+            else:
+                age_cat = options['age_cat_map_r18']
+            new_name = new_name.replace('age_cat', options['age_cat_left'] + age_cat + options['age_cat_right'])
+    if 'series_name' in template:
+        if series_name:
+            new_name = new_name.replace('series_name', options['series_name_left'] + series_name + options['series_name_right'])
+        else:
+            new_name = new_name.replace('series_name', '')
+    if 'release_date' in template:
+        release_date_obj = datetime.strptime(metadata['release_date'], '%Y-%m-%d').date()
+        new_name = new_name.replace('release_date', release_date_obj.strftime(options['release_date_format']))
+
+    cv_list = list(map(format_filename_str, metadata['cvs']))
+    cv_list_str = options['cv_list_left'] + options['delimiter'].join(cv_list) + options['cv_list_right'] if len(cv_list) > 0 else ''
+    new_name = new_name.replace('cv_list_str', cv_list_str)
+
+    if "tags_list_str" in template:
+        tags_list = []
+        tags_list_flag = []
+        for i in options['tags_option']['ordered_list']:
+            if isinstance(i, str) and i in metadata['tags']:
+                tags_list.append(i)
+                tags_list_flag.append(i)
+            elif isinstance(i, list) and i[0] in metadata['tags']:
+                tags_list.append(i[1])
+                tags_list_flag.append(i[0])
+        for i in metadata['tags']:
+            if not i in tags_list_flag:
+                tags_list.append(i)
+        tags_list = tags_list[: options['tags_option']['max_number']]
+        tags_list = list(map(format_filename_str, tags_list))
+        new_name = new_name.replace('tags_list_str', options['delimiter'].join(tags_list))
+
+    if options['illegal_character_to_full_width_flag']:
+        new_name = new_name.translate(new_name.maketrans(
+            WINDOWS_RESERVED_CHARACTER_PATTERN_str, WINDOWS_RESERVED_CHARACTER_PATTERN_replace_str))
+    else:
+        new_name = WINDOWS_RESERVED_CHARACTER_PATTERN.sub('', new_name)
+    return new_name.strip()
+
+
+def make_metadata(n: int):
+    metadata_list = []
+    for i in range(n):
+        metadata_list.append({
+            'rjcode': f'RJ{i:08d}',
+            'work_name': f'【お耳かき】作品名 No.{i} ～副題？～【ASMR】',
+            'maker_id': f'RG{i % 1000:05d}',
+            'maker_name': f'サークル/{i % 1000}',
+            'release_date': f'20{i % 20 + 5:02d}-{i % 12 + 1:02d}-{i % 28 + 1:02d}',
+            'series_id': '',
+            'series_name': f'シリーズ{i % 50}' if i % 3 else '',
+            'age_category': ('GEN', 'R15', 'R18')[i % 3],
+            'tags': ['标签3', '耳かき', '标签2', '癒し', 'バイノーラル/ダミヘ', '标签1'],
+            'cvs': ['声優A', '声優B'],
+            'cover_url': '',
+        })
+    return metadata_list
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    metadata_list = make_metadata(n)
+    compiler = NameCompiler(template=TEMPLATE, keep_slash=False, **OPTIONS)
+    legacy_options = {**OPTIONS}
+
+    # 两种实现的输出应当一致（此模板不会触发旧版的重复替换问题）
+    for metadata in metadata_list[:100]:
+        assert compiler.compile(metadata) == legacy_compile_new_name(TEMPLATE, metadata, legacy_options)
+
+    def run_compiled():
+        # 每次都新建 NameCompiler（与每次运行编译一次模板一致），不沿用上一次重复中缓存的日期
+        run_compiler = NameCompiler(template=TEMPLATE, keep_slash=False, **OPTIONS)
+        return [run_compiler.compile(m) for m in metadata_list]
+
+    # 两种实现轮流执行，取各自的最短耗时，减少机器负载波动的影响
+    legacy = compiled = float('inf')
+    for _ in range(repeat):
+        legacy = min(legacy, timeit.timeit(
+            lambda: [legacy_compile_new_name(TEMPLATE, m, legacy_options) for m in metadata_list], number=1))
+        compiled = min(compiled, timeit.timeit(run_compiled, number=1))
+    print(f'works: {n}')
+    print(f'legacy   : {legacy / n * 1e6:8.2f} us/work')
+    print(f'compiled : {compiled / n * 1e6:8.2f} us/work')
+    print(f'speedup  : {legacy / compiled:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
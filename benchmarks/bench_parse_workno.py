@@ -0,0 +1,83 @@
+"""
+workno 提取的微基准测试：比较旧版（复制大写字符串后 WORKNO_PATTERN.search）与预过滤 + 不区分大小写的正则
+语料模拟扫描时遇到的文件夹名称：大部分是音轨、CD 等不含 RJ 号的子文件夹，少部分是作品文件夹
+
+用法：python benchmarks/bench_parse_workno.py [--names 1000000] [--work-ratio 0.05] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper import Dlsite
+
+# 不含 RJ 号的子文件夹名称
+SUB_DIR_NAMES = ['CD1', 'CD2', 'Disc 2', '01. オープニング', '02_track', 'mp3', 'wav', 'flac', 'SE無し', 'SE有り',
+                 '音声', 'イラスト', 'bonus', 'Bonus Track', 'おまけ', 'テキスト', 'jpg', 'Japanese', 'ver1.1']
+# 作品文件夹名称的模板
+WORK_NAME_FORMATS = ['{workno}', '{workno} 作品名', '[サークル名][{workno}] 作品名', '{lower} 作品名',
+                     '【作品名】{workno}', '{workno} 作品名 (CV 声優) {other}']
+
+
+def legacy_parse_workno(string: str):
+    """
+    旧版 Dlsite.parse_workno 的实现
+    """
+    match = Dlsite.WORKNO_PATTERN.search(string.upper())
+    if match:
+        return match.group()
+    else:
+        return None
+
+
+def make_corpus(size: int, work_ratio: float, seed: int = 0) -> list[str]:
+    rnd = random.Random(seed)
+    names = []
+    for i in range(size):
+        if rnd.random() < work_ratio:
+            number = rnd.randrange(10 ** 6) if rnd.random() < 0.7 else rnd.randrange(10 ** 8)
+            workno = rnd.choice('RBV') + 'J' + (f'{number:06d}' if number < 10 ** 6 else f'{number:08d}')
+            other = 'RJ' + f'{rnd.randrange(10 ** 6):06d}'
+            names.append(rnd.choice(WORK_NAME_FORMATS).format(workno=workno, lower=workno.lower(), other=other))
+        else:
+            names.append(f'{rnd.choice(SUB_DIR_NAMES)} {i % 100}')
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description='workno 提取的微基准测试')
+    parser.add_argument('--names', type=int, default=1000000, help='文件夹名称的数量')
+    parser.add_argument('--work-ratio', type=float, default=0.05, help='含 workno 的名称的比例')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    names = make_corpus(args.names, args.work_ratio)
+    expected = [legacy_parse_workno(name) for name in names]
+    assert [Dlsite.parse_workno(name) for name in names] == expected
+    assert Dlsite.parse_worknos(names) == expected
+    assert [found[0] if found else None for found in Dlsite.parse_worknos(names, find_all=True)] == expected
+    assert Dlsite.parse_worknos(names, find_all=True) == [Dlsite.find_worknos(name) for name in names]
+
+    cases = [
+        ('legacy (upper + search)', lambda: [legacy_parse_workno(name) for name in names]),
+        ('Dlsite.parse_workno', lambda: [Dlsite.parse_workno(name) for name in names]),
+        ('Dlsite.parse_worknos', lambda: Dlsite.parse_worknos(names)),
+        ('Dlsite.parse_worknos(find_all)', lambda: Dlsite.parse_worknos(names, find_all=True)),
+    ]
+    print(f'{len(names)} 个名称，其中 {sum(1 for workno in expected if workno)} 个含 workno')
+    # 各实现轮流执行，取每个实现的最短耗时，减少机器负载波动的影响
+    best = [float('inf')] * len(cases)
+    for _ in range(args.repeat):
+        for i, (_, func) in enumerate(cases):
+            best[i] = min(best[i], timeit.timeit(func, number=1))
+    baseline = best[0]
+    for (label, _), seconds in zip(cases, best):
+        print(f'{label:<32}: {seconds * 1000:8.1f} ms {seconds / len(names) * 1e9:8.1f} ns/name '
+              f'{baseline / seconds:6.2f}x')
+
+
+if __name__ == '__main__':
+    main()
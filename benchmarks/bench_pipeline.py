@@ -0,0 +1,282 @@
+"""
+端到端基准测试：在本地的 dlsite.com 模拟服务器（benchmarks/fake_dlsite.py）上测量 Scaner、Scraper、CachedScraper 与
+Renamer 各工作模式的吞吐量，不访问真实网站
+
+每一项测试都在新生成的合成作品库（N 个带 RJ/BJ/VJ 号的文件夹）上进行，输出：
+- 吞吐量（作品/秒）
+- 单个作品延迟的 p50/p99（Renamer 为从取出作品到处理结束；Scraper 为所在批次的请求耗时）
+- 峰值内存（每项测试在独立的子进程中运行，取子进程的最大常驻内存）
+
+用法：python benchmarks/bench_pipeline.py [--works 2000] [--modes RENAME,MOVE,LINK] [--latency 0.02]
+                                          [--error-rate 0] [--throttle-rate 0] [--icons] [--json report.json]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_dlsite import FakeDlsiteServer
+
+RENAMER_OPTIONS = {
+    'template': 'age_cat[maker_name][rjcode] work_name cv_list_str',
+    'release_date_format': '%y%m%d',
+    'delimiter': ' ',
+    'cv_list_left': '(CV ',
+    'cv_list_right': ')',
+    'exclude_square_brackets_in_work_name_flag': True,
+    'renamer_illegal_character_to_full_width_flag': True,
+    'remove_jpg_file': True,
+    'tags_option': {'ordered_list': [], 'max_number': 5},
+    'age_cat_map_gen': '全年龄',
+    'age_cat_map_r15': 'R15',
+    'age_cat_map_r18': 'R18',
+    'age_cat_left': '(',
+    'age_cat_right': ')',
+    'age_cat_ignore_r18': False,
+    'series_name_left': '[',
+    'series_name_right': ']',
+    'move_template': 'maker_id/[rjcode] work_name',
+}
+LOG_MESSAGE_PATTERN = re.compile(r'^\[(?P<rjcode>[^\]]+)\] -> (?P<message>.*)$', re.DOTALL)
+
+
+def make_library(root: str, works: int, files_per_work: int = 3, file_size: int = 4096, seed: int = 0):
+    """
+    生成合成作品库：约 70% RJ、20% BJ、10% VJ，编号为 6 位或 8 位；部分作品放在 1~2 层的分组文件夹中
+    :return: 作品的 workno 列表
+    """
+    rand = random.Random(seed)
+    payload = bytes(file_size)
+    worknos = []
+    for i in range(works):
+        prefix = rand.choices(['RJ', 'BJ', 'VJ'], [7, 2, 1])[0]
+        workno = f'{prefix}{i + 1:06d}' if rand.random() < 0.8 else f'{prefix}{i + 1:08d}'
+        style = rand.random()
+        if style < 0.5:
+            name = workno
+        elif style < 0.8:
+            name = f'[サークル] {workno} 作品名'
+        else:
+            name = f'作品名 ({workno.lower()})'
+        depth = rand.choice([0, 0, 1, 2])
+        parent = root
+        for level in range(depth):
+            parent = os.path.join(parent, f'分组{level}-{i % 20}')
+        work_dir = os.path.join(parent, name)
+        os.makedirs(work_dir, exist_ok=True)
+        for j in range(files_per_work):
+            with open(os.path.join(work_dir, f'track{j:02d}.bin'), 'wb') as f:
+                f.write(payload)
+        worknos.append(workno)
+    return worknos
+
+
+def percentile(values: list[float], q: float):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux 下单位为 KiB
+
+
+class LatencyRecorder(logging.Handler):
+    """
+    根据 Renamer 的日志计算每个作品从取出到处理结束的延迟
+    """
+
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.started: dict[str, float] = {}
+        self.latencies: list[float] = []
+
+    def emit(self, record: logging.LogRecord):
+        match = LOG_MESSAGE_PATTERN.match(record.getMessage())
+        if not match:
+            return
+        rjcode, message = match.group('rjcode'), match.group('message')
+        if message.startswith('发现 RJ 文件夹'):
+            self.started[rjcode] = record.created
+        elif message.startswith('处理结束') and rjcode in self.started:
+            self.latencies.append(record.created - self.started.pop(rjcode))
+
+
+def create_scraper(args, cached=False):
+    from scraper import CachedScraper, Locale, Scraper
+
+    options = dict(locale=Locale.zh_cn, proxies={'http': None, 'https': None}, sleep_interval=args.sleep_interval,
+                   batch_size=args.batch_size, pool_size=args.concurrency)
+    return CachedScraper(negative_ttl=86400, **options) if cached else Scraper(**options)
+
+
+def bench_scan(args, work_dir: str):
+    from scaner import Scaner
+
+    make_library(work_dir, args.works, args.files_per_work)
+    start = time.perf_counter()
+    found = sum(1 for _ in Scaner(max_depth=5, max_workers=8).scan(work_dir))
+    elapsed = time.perf_counter() - start
+    return {'works': found, 'elapsed': elapsed, 'latencies': []}
+
+
+def bench_scrape(args, work_dir: str, cached: bool):
+    """
+    cached 为 True 时先冷启动抓取一遍（写入缓存），再测量命中缓存的抓取
+    """
+    worknos = [workno.upper() for workno in make_library(work_dir, args.works, 0)]
+    scraper = create_scraper(args, cached)
+    batches = [worknos[i: i + args.batch_size] for i in range(0, len(worknos), args.batch_size)]
+    latencies = []
+
+    def run_batch(batch):
+        start = time.perf_counter()
+        try:
+            scraper.scrape_metadata_many(batch)
+        except Exception:
+            return
+        latencies.extend([time.perf_counter() - start] * len(batch))
+
+    if cached:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(run_batch, batches))
+        scraper.flush()
+        latencies.clear()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(run_batch, batches))
+    elapsed = time.perf_counter() - start
+    scraper.close()
+    return {'works': len(latencies), 'elapsed': elapsed, 'latencies': latencies}
+
+
+def bench_renamer(args, work_dir: str, mode: str):
+    from renamer import Renamer
+    from scaner import Scaner
+    from scraper.metrics import metrics
+
+    library = os.path.join(work_dir, 'library')
+    make_library(library, args.works, args.files_per_work)
+    logger = Renamer.logger
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    recorder = LatencyRecorder()
+    logger.addHandler(recorder)
+
+    renamer = Renamer(scaner=Scaner(max_depth=5, max_workers=8), scraper=create_scraper(args), mode=mode,
+                      move_root=os.path.join(work_dir, 'out'), make_folder_icon=args.icons,
+                      concurrency=args.concurrency, batch_size=args.batch_size, cover_workers=args.concurrency,
+                      **RENAMER_OPTIONS)
+    start = time.perf_counter()
+    renamer.rename(library)
+    elapsed = time.perf_counter() - start
+    renamer.close()
+    return {'works': len(recorder.latencies), 'elapsed': elapsed, 'latencies': recorder.latencies,
+            'metrics': metrics.snapshot()['counters']}
+
+
+def run_child(args):
+    """
+    在子进程中运行一项测试，结果以 JSON 写入标准输出
+    """
+    from scraper.dlsite import Dlsite
+
+    Dlsite.set_base_url(args.base_url)
+    work_dir = tempfile.mkdtemp(prefix='bench-')
+    cwd = os.getcwd()
+    os.chdir(work_dir)  # cache.db 等文件写入临时文件夹
+    try:
+        if args.child == 'scan':
+            result = bench_scan(args, work_dir)
+        elif args.child == 'scraper':
+            result = bench_scrape(args, work_dir, cached=False)
+        elif args.child == 'cached_scraper':
+            result = bench_scrape(args, work_dir, cached=True)
+        else:
+            result = bench_renamer(args, work_dir, args.child)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    latencies = result.pop('latencies')
+    result.update({
+        'name': args.child,
+        'works_per_second': result['works'] / result['elapsed'] if result['elapsed'] > 0 else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'peak_rss_mib': peak_rss_mib(),
+    })
+    print(json.dumps(result))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='端到端基准测试（本地模拟服务器）')
+    parser.add_argument('--works', type=int, default=2000, help='合成作品库中的作品数（默认：2000）')
+    parser.add_argument('--files-per-work', type=int, default=3, help='每个作品文件夹中的文件数（默认：3）')
+    parser.add_argument('--modes', default='RENAME,MOVE,LINK', help='测试的工作模式（默认：RENAME,MOVE,LINK）')
+    parser.add_argument('--skip-components', action='store_true', help='只测试 Renamer，不单独测试 Scaner 与刮削器')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发爬取的线程数（默认：4）')
+    parser.add_argument('--batch-size', type=int, default=20, help='每次请求 product api 携带的作品数（默认：20）')
+    parser.add_argument('--sleep-interval', type=float, default=0, help='平均请求间隔（秒，默认：0，不限速）')
+    parser.add_argument('--icons', action='store_true', help='同时下载封面图并生成文件夹图标')
+    parser.add_argument('--latency', type=float, default=0.02, help='模拟服务器每个请求的延迟（秒，默认：0.02）')
+    parser.add_argument('--jitter', type=float, default=0.005, help='延迟的随机波动（秒，默认：0.005）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟服务器返回 500 的概率')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='模拟服务器返回 429 的概率')
+    parser.add_argument('--json', default=None, metavar='FILE', help='将结果保存为 JSON')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    names = [] if args.skip_components else ['scan', 'scraper', 'cached_scraper']
+    names += [mode.strip().upper() for mode in args.modes.split(',') if mode.strip()]
+    results = []
+    with FakeDlsiteServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          throttle_rate=args.throttle_rate, seed=0) as server:
+        print(f'模拟服务器：{server.base_url}，延迟 {args.latency * 1000:.0f}±{args.jitter * 1000:.0f} 毫秒，'
+              f'错误率 {args.error_rate:.1%}，429 比例 {args.throttle_rate:.1%}；作品数 {args.works}')
+        print(f'{"测试":<16}{"作品数":>8}{"耗时(秒)":>10}{"作品/秒":>10}{"p50(毫秒)":>11}{"p99(毫秒)":>11}{"峰值内存(MiB)":>15}')
+        for name in names:
+            argv = [sys.executable, os.path.abspath(__file__), '--child', name, '--base-url', server.base_url,
+                    '--works', str(args.works), '--files-per-work', str(args.files_per_work),
+                    '--concurrency', str(args.concurrency), '--batch-size', str(args.batch_size),
+                    '--sleep-interval', str(args.sleep_interval)] + (['--icons'] if args.icons else [])
+            completed = subprocess.run(argv, stdout=subprocess.PIPE, text=True)
+            if completed.returncode != 0:
+                print(f'{name:<16}失败（退出码 {completed.returncode}）')
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f'{name:<16}{result["works"]:>8}{result["elapsed"]:>10.2f}{result["works_per_second"]:>10.1f}'
+                  f'{result["p50_ms"]:>11.1f}{result["p99_ms"]:>11.1f}{result["peak_rss_mib"]:>15.1f}')
+        server_counters = dict(server.counters)
+    print(f'服务器统计：{server_counters}')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': {key: value for key, value in vars(args).items() if key not in ('child', 'base_url')},
+                       'server': server_counters, 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
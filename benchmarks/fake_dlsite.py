@@ -0,0 +1,188 @@
+"""
+本地的 dlsite.com 模拟服务器，供基准测试使用，不访问真实网站
+
+提供 product api（/maniax/api/=/product.json?workno=RJ000001,RJ000002）与封面图（/img/<workno>.jpg）
+作品信息由 workno 确定性地生成：编号个位为 9 的作品视为不存在，编号能被 7 整除的 RJ 作品是翻译作品（原作为编号减 1 的作品）
+
+用法：python benchmarks/fake_dlsite.py [--port 8000] [--latency 0.05] [--error-rate 0.01] [--throttle-rate 0.01]
+然后在代码中调用 Dlsite.set_base_url('http://127.0.0.1:8000')
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+def _make_cover(size=(560, 420)) -> bytes:
+    """
+    生成一张封面图。没有安装 Pillow 时返回一个最小的 JPEG 文件头（只用于测量下载）
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return b'\xff\xd8\xff\xe0' + bytes(16 * 1024) + b'\xff\xd9'
+    image = Image.new('RGB', size)
+    image.putdata([((x * 7) % 256, (y * 3) % 256, ((x + y) * 5) % 256) for y in range(size[1]) for x in range(size[0])])
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG', quality=85)
+    return buf.getvalue()
+
+
+def product_info(workno: str) -> Optional[dict]:
+    """
+    :return: workno 对应的 product info，作品不存在时返回 None
+    """
+    number = int(workno[2:])
+    if number % 10 == 9:
+        return None
+    info = {
+        'workno': workno,
+        'work_name': f'【合成作品】テスト作品 {workno}',
+        'maker_id': f'RG{number % 1000:05d}',
+        'maker_name': f'サークル{number % 1000}',
+        'regist_date': f'20{10 + number % 14:02d}-{1 + number % 12:02d}-{1 + number % 28:02d} 00:00:00',
+        'series_id': f'SRI{number % 100:010d}' if number % 3 == 0 else None,
+        'series_name': f'シリーズ{number % 100}' if number % 3 == 0 else None,
+        'age_category': 1 + number % 3,
+        'genres': [{'name': f'タグ{(number + i) % 50}'} for i in range(number % 6)],
+        'creaters': {'voice_by': [{'name': f'声優{(number + i) % 200}'} for i in range(number % 3)]}
+        if workno.startswith('RJ') else [],
+        'image_main': {'url': f'/img/{workno}.jpg'},
+        'translation_info': {'original_workno': None},
+    }
+    if workno.startswith('RJ') and number % 7 == 0 and number > 1:
+        info['translation_info']['original_workno'] = f'RJ{number - 1:0{len(workno) - 2}d}'
+    return info
+
+
+class FakeDlsiteServer(object):
+    """
+    在后台线程中运行的模拟服务器
+    - latency/jitter：每个请求的延迟（秒），实际延迟在 latency ± jitter 之间均匀分布
+    - error_rate：返回 500 的概率
+    - throttle_rate：返回 429（带 Retry-After: 0）的概率
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.__random = random.Random(seed)
+        self.__random_lock = threading.Lock()
+        self._cover = _make_cover()
+        self._cover_etag = '"' + hashlib.md5(self._cover).hexdigest() + '"'
+        self.counters = {'product_api': 0, 'cover': 0, 'not_modified': 0, 'errors': 0, 'throttled': 0}
+        self.__counters_lock = threading.Lock()
+        self.__httpd = ThreadingHTTPServer((host, port), self.__make_handler())
+        self.__httpd.daemon_threads = True
+        self.__thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self):
+        host, port = self.__httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__httpd.serve_forever, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__httpd.shutdown()
+        self.__httpd.server_close()
+
+    def _count(self, name: str):
+        with self.__counters_lock:
+            self.counters[name] += 1
+
+    def _roll(self):
+        with self.__random_lock:
+            delay = max(0.0, self.latency + self.__random.uniform(-self.jitter, self.jitter))
+            return delay, self.__random.random()
+
+    def __make_handler(self):
+        server = self  # Handler 中以 server 访问，不能使用双下划线的属性（会按 Handler 改名）
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # 支持 keep-alive
+
+            def log_message(self, format, *args):
+                pass
+
+            def __send(self, status: int, body: bytes = b'', content_type: str = 'application/json', headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                delay, roll = server._roll()
+                if delay:
+                    time.sleep(delay)
+                if roll < server.throttle_rate:
+                    server._count('throttled')
+                    self.__send(429, b'[]', headers={'Retry-After': '0'})
+                    return
+                if roll < server.throttle_rate + server.error_rate:
+                    server._count('errors')
+                    self.__send(500, b'[]')
+                    return
+
+                url = urlsplit(self.path)
+                if url.path == '/maniax/api/=/product.json':
+                    server._count('product_api')
+                    worknos = parse_qs(url.query).get('workno', [''])[0].upper().split(',')
+                    infos = [info for info in map(product_info, filter(None, worknos)) if info]
+                    self.__send(200, json.dumps(infos, ensure_ascii=False).encode('utf-8'))
+                elif url.path.startswith('/img/'):
+                    if self.headers.get('If-None-Match', None) == server._cover_etag:
+                        server._count('not_modified')
+                        self.__send(304)
+                        return
+                    server._count('cover')
+                    self.__send(200, server._cover, 'image/jpeg', {'ETag': server._cover_etag})
+                else:
+                    self.__send(404, b'Not Found', 'text/plain')
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地的 dlsite.com 模拟服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟的随机波动（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 500 的概率')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='返回 429 的概率')
+    args = parser.parse_args()
+    server = FakeDlsiteServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.throttle_rate)
+    server.start()
+    print(f'模拟服务器已启动：{server.base_url}（Ctrl-C 退出）')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+命令行入口，适合在 NAS 等无图形界面的环境中由 cron 定时运行。不依赖 wx 与 win32api
+
+用法：
+  python cli.py rename ROOT [ROOT ...]        重命名
+  python cli.py plan ROOT [ROOT ...] -o FILE  只生成重命名计划
+  python cli.py apply FILE                    执行重命名计划
+  python cli.py resume [RUN_ID]               继续执行被中断的运行
+  python cli.py undo [RUN_ID]                 撤销一次运行
+  python cli.py watch ROOT [ROOT ...]         监视收件文件夹，自动处理新到达的作品
+  python cli.py cache-export FILE             导出元数据缓存
+  python cli.py cache-import FILE             导入元数据缓存（较新的为准）
+  python cli.py fetch-pending                 抓取离线模式下未命中的作品
+
+退出码：0 成功；1 部分作品处理失败；2 参数或配置文件错误；3 意外的异常
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import sys
+
+EXIT_OK = 0
+EXIT_FAILURES = 1  # 日志中有 WARNING 及以上级别的记录
+EXIT_USAGE = 2  # 与 argparse 的参数错误一致
+EXIT_UNEXPECTED = 3
+
+LOG_MESSAGE_PATTERN = re.compile(r'^\[(?P<rjcode>[^\]]+)\] -> (?P<message>.*)$', re.DOTALL)
+
+
+class JsonLinesHandler(logging.Handler):
+    """
+    每条日志输出为一行 JSON：{"time", "level", "rjcode", "message"}
+    """
+
+    def __init__(self, stream=None):
+        super().__init__()
+        self.__stream = stream or sys.stdout
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            message = record.getMessage().strip()
+            match = LOG_MESSAGE_PATTERN.match(message)
+            line = json.dumps({
+                'time': record.created,
+                'level': record.levelname,
+                'rjcode': match.group('rjcode') if match else None,
+                'message': match.group('message') if match else message,
+            }, ensure_ascii=False)
+            self.__stream.write(line + '\n')
+            self.__stream.flush()
+        except Exception:
+            self.handleError(record)
+
+
+class FailureCounter(logging.Handler):
+    """
+    统计 WARNING 及以上级别的日志，用于决定退出码
+    """
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord):
+        self.count += 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='cli.py', description='DLSite 同人作品重命名工具（命令行）')
+    parser.add_argument('-c', '--config', default='config.json', help='配置文件路径（默认：config.json）')
+    parser.add_argument('-j', '--concurrency', type=int, default=None,
+                        help='并发爬取元数据的线程数，覆盖配置中的 renamer_concurrency')
+    parser.add_argument('--report', default=None, metavar='FILE',
+                        help='运行报告（JSON）的保存路径，覆盖配置中的 renamer_report_file')
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], default=None,
+                        help='深入分析，覆盖配置中的 renamer_profile')
+    parser.add_argument('--jsonl', action='store_true', help='以 JSON Lines 格式向标准输出写入日志')
+    parser.add_argument('-q', '--quiet', action='store_true', help='只输出 WARNING 及以上级别的日志')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rename_parser = subparsers.add_parser('rename', help='重命名')
+    rename_parser.add_argument('roots', nargs='+', metavar='ROOT', help='根文件夹')
+
+    plan_parser = subparsers.add_parser('plan', help='只生成重命名计划，不修改文件')
+    plan_parser.add_argument('roots', nargs='+', metavar='ROOT', help='根文件夹')
+    plan_parser.add_argument('-o', '--output', default=None,
+                             help='计划的导出路径（.json 或 .csv），默认为配置中的 renamer_plan_file')
+
+    apply_parser = subparsers.add_parser('apply', help='执行重命名计划')
+    apply_parser.add_argument('plan_file', metavar='FILE', help='plan 命令导出的计划')
+
+    resume_parser = subparsers.add_parser('resume', help='继续执行被中断的运行')
+    resume_parser.add_argument('run_id', nargs='?', default=None, metavar='RUN_ID', help='默认为最近一次运行')
+
+    undo_parser = subparsers.add_parser('undo', help='撤销一次运行')
+    undo_parser.add_argument('run_id', nargs='?', default=None, metavar='RUN_ID', help='默认为最近一次运行')
+
+    watch_parser = subparsers.add_parser('watch', help='监视收件文件夹，自动处理新到达的作品')
+    watch_parser.add_argument('roots', nargs='+', metavar='ROOT', help='收件文件夹')
+    watch_parser.add_argument('--quiet-seconds', type=float, default=3,
+                              help='新到达的文件夹静默多少秒（没有新的写入）后开始处理（默认：3）')
+    watch_parser.add_argument('--poll', action='store_true', help='不使用 inotify，改为轮询（适用于网络共享）')
+    watch_parser.add_argument('--poll-interval', type=float, default=5, help='轮询间隔（秒，默认：5）')
+    watch_parser.add_argument('--initial-scan', action='store_true', help='开始监视前先处理一遍已有的作品')
+
+    export_parser = subparsers.add_parser('cache-export', help='将元数据缓存导出为元数据包（gzip 压缩的 JSON Lines）')
+    export_parser.add_argument('bundle_file', metavar='FILE', help='元数据包的导出路径，如 metadata.jsonl.gz')
+    export_parser.add_argument('--locale', default=None, help='只导出该语言的缓存（默认：全部语言）')
+
+    import_parser = subparsers.add_parser('cache-import', help='导入元数据包，同一作品以抓取时间较新的为准')
+    import_parser.add_argument('bundle_file', metavar='FILE', help='cache-export 导出的元数据包')
+
+    subparsers.add_parser('fetch-pending', help='抓取离线模式下加入待抓取队列的作品')
+
+    args = parser.parse_args(argv)
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error('--concurrency 应不小于 1')
+    return args
+
+
+def run_cache_command(args, config) -> None:
+    """
+    导入、导出元数据缓存，不需要创建 Renamer
+    """
+    from renamer import Renamer
+    from scraper.cache_bundle import export_bundle, import_bundle
+
+    if args.command == 'cache-export':
+        count = export_bundle(args.bundle_file, args.locale, legacy_locale=config['scraper_locale'])
+        Renamer.logger.info(f'已导出 {count} 条元数据缓存："{os.path.abspath(args.bundle_file)}"')
+    elif args.command == 'cache-import':
+        merged, skipped = import_bundle(args.bundle_file, legacy_locale=config['scraper_locale'])
+        Renamer.logger.info(f'已导入 {merged} 条元数据缓存，跳过 {skipped} 条（已有较新的缓存或结构版本不同）')
+
+
+def run(args, config) -> None:
+    if args.command in ('cache-export', 'cache-import'):
+        run_cache_command(args, config)
+        return
+
+    # 延迟导入：requests、peewee、PIL 等只在真正执行命令时导入
+    from factory import create_renamer
+    from rename_plan import load_plan, save_plan
+    from renamer import Renamer
+
+    renamer, cached_scraper = create_renamer(config)
+    try:
+        if renamer.run_id and args.command in ('rename', 'apply'):
+            Renamer.logger.info(f'运行 ID：{renamer.run_id}')
+        if args.command == 'rename':
+            for root_path in args.roots:
+                if not os.path.isdir(root_path):
+                    Renamer.logger.warning(f'文件夹不存在："{os.path.normpath(root_path)}"')
+                    continue
+                renamer.rename(root_path)
+        elif args.command == 'plan':
+            plan_file = args.output or config['renamer_plan_file']
+            save_plan(renamer.plan(*args.roots), plan_file)
+            Renamer.logger.info(f'重命名计划已导出："{os.path.abspath(plan_file)}"')
+        elif args.command == 'apply':
+            renamer.apply(load_plan(args.plan_file))
+        elif args.command == 'resume':
+            renamer.resume(args.run_id)
+        elif args.command == 'undo':
+            renamer.undo(args.run_id)
+        elif args.command == 'watch':
+            from watcher import FolderWatchService
+
+            if args.initial_scan:
+                for root_path in args.roots:
+                    renamer.rename(root_path)
+            service = FolderWatchService(renamer, args.roots, quiet_seconds=args.quiet_seconds,
+                                         use_inotify=not args.poll, poll_interval=args.poll_interval)
+            signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+            try:
+                service.run()
+            except KeyboardInterrupt:
+                pass
+        elif args.command == 'fetch-pending':
+            resolved, remaining = cached_scraper.fetch_pending()
+            Renamer.logger.info(f'已抓取 {resolved} 个待抓取的作品')
+            if remaining:
+                Renamer.logger.warning(f'抓取失败，{remaining} 个作品仍在待抓取队列中')
+    finally:
+        renamer.close()
+        cached_scraper.close()
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    from config_file import ConfigFile
+
+    config_file = ConfigFile(args.config)
+    try:
+        config_file.load_config_dict()
+    except (ValueError, OSError) as err:  # JSONDecodeError 是 ValueError 的子类
+        print(f'配置文件加载失败："{os.path.normpath(args.config)}"\n{type(err).__name__}: {str(err)}', file=sys.stderr)
+        return EXIT_USAGE
+    strerror_list = config_file.verify_config()
+    if strerror_list:
+        print(f'配置文件验证失败："{os.path.normpath(args.config)}"\n' + '\n\n'.join(strerror_list), file=sys.stderr)
+        return EXIT_USAGE
+    config = dict(config_file.config)
+    if args.concurrency is not None:
+        config['renamer_concurrency'] = args.concurrency
+    if args.report is not None:
+        config['renamer_report_file'] = args.report
+    if args.profile is not None:
+        config['renamer_profile'] = args.profile
+    if args.command == 'watch':
+        # 重命名本身也会产生文件夹事件，依靠文件夹索引跳过已处理过的文件夹
+        config['scaner_incremental'] = True
+    if args.command in ('resume', 'undo'):
+        # 读取之前记录的操作日志（即使当前配置未启用）
+        config['renamer_journal'] = True
+
+    from renamer import Renamer
+
+    logger = Renamer.logger
+    level = logging.WARNING if args.quiet else logging.INFO
+    if args.jsonl:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)  # 只输出 JSON
+        logger.addHandler(JsonLinesHandler())
+    for handler in logger.handlers:
+        handler.setLevel(level)
+    failure_counter = FailureCounter()
+    logger.addHandler(failure_counter)
+
+    try:
+        run(args, config)
+    except Exception as err:
+        logger.exception(f'[Unexpected exception] {str(err)}')
+        return EXIT_UNEXPECTED
+    return EXIT_FAILURES if failure_counter.count else EXIT_OK
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -5,7 +5,7 @@ from typing import Annotated, Optional, Union, Literal
 from pydantic import Field
 from typing_extensions import TypedDict
 from pydantic import TypeAdapter, ConfigDict, ValidationError
-from scraper import Locale
+from scraper.locale import Locale
 
 FilenameStr = Annotated[str, Field(pattern=r'^[^\/:*?"<>|]*$', description="""不能含有系统保留字[^\/:*?`<>|]*""")]
 RjcodeStr = Annotated[str, Field(pattern=re.compile(r".*rjcode.*"), description='template 应是一个包含 "rjcode" 的字符串')]
@@ -15,12 +15,25 @@ class Config(TypedDict):
 
     # scaner
     scaner_max_depth: int
+    scaner_max_workers: Annotated[int, Field(ge=1)]  # 并发读取文件夹的线程数
+    scaner_incremental: bool  # 是否增量扫描
     # scraper
     scraper_locale: Locale
     scraper_connect_timeout: int
     scraper_read_timeout: int
-    scraper_sleep_interval: int
+    scraper_sleep_interval: Annotated[float, Field(ge=0)]  # 平均请求间隔
+    scraper_burst: Annotated[int, Field(ge=1)]  # 允许连续突发的请求数
     scraper_http_proxy: Optional[str]
+    scraper_batch_size: Annotated[int, Field(ge=1)]  # 每次请求 product api 携带的作品数
+    scraper_pool_size: Annotated[int, Field(ge=1)]  # 连接池大小
+    scraper_max_retries: Annotated[int, Field(ge=0)]  # 暂时性网络错误的重试次数
+    scraper_keep_alive: bool  # 是否复用连接
+    scraper_cache_ttl_days: Annotated[float, Field(ge=0)]  # 缓存有效期
+    scraper_cache_negative_ttl_days: Annotated[float, Field(ge=0)]  # “作品不存在”的缓存有效期
+    scraper_cache_background_refresh: bool  # 是否在后台刷新过期的缓存
+    scraper_offline: bool  # 离线模式，只使用缓存的元数据
+    scraper_backend: Literal["requests", "aiohttp"]  # 访问 dlsite.com 的方式
+    scraper_max_in_flight: Annotated[int, Field(ge=1)]  # aiohttp 同时进行的请求数上限
     # renamer
     renamer_template: RjcodeStr
     renamer_release_date_format: str # https://docs.python.org/3/library/datetime.html#strftime-and-strptime-format-codes
@@ -41,9 +54,18 @@ class Config(TypedDict):
     renamer_age_cat_ignore_r18: bool
     renamer_series_name_left: FilenameStr
     renamer_series_name_right: FilenameStr
-    renamer_mode: Literal["RENAME", "MOVE", "LINK"]
+    renamer_mode: Literal["RENAME", "MOVE", "LINK", "HARDLINK"]
     renamer_move_root: str
     renamer_move_template: RjcodeStr
+    renamer_concurrency: Annotated[int, Field(ge=1)]  # 并发爬取元数据的线程数上限
+    renamer_dry_run: bool  # 是否只生成重命名计划，不修改文件
+    renamer_plan_file: str  # 重命名计划的导出路径（.json 或 .csv）
+    renamer_journal: bool  # 是否记录操作日志
+    renamer_cover_cache_max_mb: Annotated[int, Field(ge=0)]  # 封面图缓存的大小上限，为 0 时不缓存
+    renamer_report_file: str  # 运行报告（JSON）的保存路径，为空时不保存
+    renamer_profile: Literal["none", "cprofile", "tracemalloc"]  # 深入分析
+    renamer_retry_attempts: Annotated[int, Field(ge=1)]  # 暂时性的爬取失败时，每个作品最多尝试的次数
+    renamer_retry_backoff: Annotated[float, Field(ge=0)]  # 第一次重试前等待的秒数
 
 
 ta = TypeAdapter(Config)
@@ -52,12 +74,25 @@ ta = TypeAdapter(Config)
 DEFAULT_CONFIG: Config = {
     # scaner
     'scaner_max_depth': 5,
+    'scaner_max_workers': 8,
+    'scaner_incremental': False,
     # scraper
     'scraper_locale': 'ja_jp',
     'scraper_connect_timeout': 10,
     'scraper_read_timeout': 10,
     'scraper_sleep_interval': 3,
+    'scraper_burst': 1,
     'scraper_http_proxy': None,
+    'scraper_batch_size': 20,
+    'scraper_pool_size': 10,
+    'scraper_max_retries': 3,
+    'scraper_keep_alive': True,
+    'scraper_cache_ttl_days': 90,
+    'scraper_cache_negative_ttl_days': 7,
+    'scraper_cache_background_refresh': True,
+    'scraper_offline': False,
+    'scraper_backend': 'requests',
+    'scraper_max_in_flight': 100,
     # renamer
     'renamer_template': 'age_cat[maker_name][rjcode] work_name cv_list_str',
     'renamer_release_date_format': '%y%m%d',
@@ -80,7 +115,16 @@ DEFAULT_CONFIG: Config = {
     'renamer_series_name_right': "",
     'renamer_mode': 'RENAME',
     'renamer_move_root': 'RENAMER_MOVE_ROOT',
-    'renamer_move_template': 'maker_name/series_name/age_cat[rjcode] work_name cv_list_str'
+    'renamer_move_template': 'maker_name/series_name/age_cat[rjcode] work_name cv_list_str',
+    'renamer_concurrency': 4,
+    'renamer_dry_run': False,
+    'renamer_plan_file': 'rename_plan.csv',
+    'renamer_journal': False,
+    'renamer_cover_cache_max_mb': 512,
+    'renamer_report_file': '',
+    'renamer_profile': 'none',
+    'renamer_retry_attempts': 3,
+    'renamer_retry_backoff': 2
 }
 
 
@@ -98,7 +142,8 @@ class ConfigFile(object):
         """
         with open(self.__file_path, encoding='UTF-8') as file:
             config_dict = json.load(file)
-            self.__config_dict = config_dict
+            # 旧版配置文件中缺失的配置项使用默认值
+            self.__config_dict = {**DEFAULT_CONFIG, **config_dict}
 
     def save_config(self, config: Config):
         """
@@ -0,0 +1,91 @@
+from config_file import Config
+from journal import Journal
+from renamer import Renamer
+from scaner import Scaner, DirIndex
+from scraper import Locale, CachedScraper, CoverCache
+
+
+def create_renamer(config: Config):
+    """
+    根据配置创建 Renamer 及其使用的组件，供 GUI 与命令行共用
+    :return: (renamer, cached_scraper)。使用完毕后应调用 renamer.close() 与 cached_scraper.close()
+    """
+    # 配置 scaner
+    dir_index = DirIndex() if config['scaner_incremental'] else None
+    scaner = Scaner(max_depth=config['scaner_max_depth'], max_workers=config['scaner_max_workers'], index=dir_index)
+
+    # 配置 scraper
+    scraper_locale = config['scraper_locale']
+    scraper_http_proxy = config['scraper_http_proxy']
+    if scraper_http_proxy:
+        proxies = {
+            'http': scraper_http_proxy,
+            'https': scraper_http_proxy
+        }
+    else:
+        proxies = None
+    scraper_connect_timeout = config['scraper_connect_timeout']
+    scraper_read_timeout = config['scraper_read_timeout']
+    scraper_sleep_interval = config['scraper_sleep_interval']
+    scraper_batch_size = config['scraper_batch_size']
+    cached_scraper = CachedScraper(
+        locale=Locale[scraper_locale],
+        connect_timeout=scraper_connect_timeout,
+        read_timeout=scraper_read_timeout,
+        sleep_interval=scraper_sleep_interval,
+        burst=config['scraper_burst'],
+        batch_size=scraper_batch_size,
+        pool_size=max(config['scraper_pool_size'], config['renamer_concurrency']),
+        max_retries=config['scraper_max_retries'],
+        keep_alive=config['scraper_keep_alive'],
+        ttl=config['scraper_cache_ttl_days'] * 86400,
+        negative_ttl=config['scraper_cache_negative_ttl_days'] * 86400,
+        background_refresh=config['scraper_cache_background_refresh'],
+        offline=config['scraper_offline'],
+        backend=config['scraper_backend'],
+        max_in_flight=config['scraper_max_in_flight'],
+        proxies=proxies)
+    tags_option = {
+        'ordered_list': config['renamer_tags_ordered_list'],
+        'max_number': 999999 if config['renamer_tags_max_number'] == 0 else config['renamer_tags_max_number'],
+    }
+
+    # 配置 renamer
+    renamer = Renamer(
+        scaner=scaner,
+        scraper=cached_scraper,
+        template=config['renamer_template'],
+        release_date_format=config['renamer_release_date_format'],
+        delimiter=config['renamer_delimiter'],
+        cv_list_left=config['renamer_cv_list_left'],
+        cv_list_right=config['renamer_cv_list_right'],
+        exclude_square_brackets_in_work_name_flag=config['renamer_exclude_square_brackets_in_work_name_flag'],
+        renamer_illegal_character_to_full_width_flag=config['renamer_illegal_character_to_full_width_flag'],
+        make_folder_icon=config['renamer_make_folder_icon'],
+        remove_jpg_file=config['renamer_remove_jpg_file'],
+        tags_option=tags_option,
+        age_cat_map_gen=config['renamer_age_cat_map_gen'],
+        age_cat_map_r15=config['renamer_age_cat_map_r15'],
+        age_cat_map_r18=config['renamer_age_cat_map_r18'],
+        age_cat_left=config['renamer_age_cat_left'],
+        age_cat_right=config['renamer_age_cat_right'],
+        age_cat_ignore_r18=config['renamer_age_cat_ignore_r18'],
+        mode=config['renamer_mode'],
+        move_root=config['renamer_move_root'],
+        move_template=config['renamer_move_template'],
+        series_name_left=config['renamer_series_name_left'],
+        series_name_right=config['renamer_series_name_right'],
+        concurrency=config['renamer_concurrency'],
+        batch_size=scraper_batch_size,
+        dir_index=dir_index,
+        journal=Journal() if config['renamer_journal'] else None,
+        cover_workers=config['renamer_concurrency'],
+        cover_cache=CoverCache(max_bytes=config['renamer_cover_cache_max_mb'] * 2 ** 20)
+        if config['renamer_cover_cache_max_mb'] > 0 else None,
+        report_file=config['renamer_report_file'],
+        profile=config['renamer_profile'],
+        retry_attempts=config['renamer_retry_attempts'],
+        retry_backoff=config['renamer_retry_backoff']
+    )
+
+    return renamer, cached_scraper
@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Iterable, Optional
+
+from peewee import *
+
+from ostool import is_copy_complete, is_partial_copy
+from scraper.db import db
+
+# 操作的状态
+OP_PENDING = 'pending'  # 已记录意图，尚未确认完成
+OP_DONE = 'done'
+OP_FAILED = 'failed'
+OP_UNDONE = 'undone'  # 已撤销
+
+
+class JournalEntry(Model):
+    id = AutoField()  # 自增，即操作的执行顺序
+    run_id = CharField(index=True)  # 一次运行中的所有操作共享同一个 run_id
+    rjcode = CharField()
+    mode = CharField()  # RENAME/MOVE/LINK/HARDLINK
+    old_path = TextField()  # 源文件夹
+    new_path = TextField()  # 重命名后的文件夹。LINK 模式下为放置符号链接的文件夹
+    target_path = TextField()  # 实际写入的路径。LINK 模式下为符号链接本身
+    target_existed = BooleanField(null=True)  # 记录意图时 target_path 是否已存在。旧版本的记录为 None（未知）
+    cover_url = TextField(default='')
+    status = CharField(default=OP_PENDING)
+    message = TextField(default='')
+    created_files = TextField(default='')  # HARDLINK 模式下本次创建的文件（json 列表，相对于 target_path），撤销时只删除这些文件
+    updated_at = FloatField(default=time.time)
+
+    class Meta:
+        database = db
+
+
+class Journal(object):
+    """
+    只追加的操作日志，保存在 cache.db 中，用于中断后继续执行和整体撤销
+    - 执行操作之前先写入意图（pending）。数据库为 WAL 模式且 synchronous=normal，提交事务不会逐条 fsync
+    - 操作完成（done/failed）的状态先缓冲，攒够一批后在一个事务中写入。进程崩溃时丢失的状态可由 reconcile() 根据文件系统恢复
+    """
+    WRITE_BUFFER_SIZE = 200
+
+    def __init__(self):
+        db.connect(reuse_if_open=True)
+        table_name = JournalEntry._meta.table_name
+        if table_name in db.get_tables():
+            columns = {column.name for column in db.get_columns(table_name)}
+            if 'created_files' not in columns:
+                db.execute_sql(f'ALTER TABLE "{table_name}" ADD COLUMN created_files TEXT NOT NULL DEFAULT \'\'')
+            if 'target_existed' not in columns:
+                db.execute_sql(f'ALTER TABLE "{table_name}" ADD COLUMN target_existed INTEGER')
+        db.create_tables([JournalEntry])
+        self.__lock = threading.Lock()
+        self.__status_buffer: dict[int, tuple[str, str, float, str]] = {}  # {id: (状态, 信息, 时间, 创建的文件)}
+
+    @staticmethod
+    def new_run_id():
+        return time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+
+    def record(self, run_id: str, ops: Iterable[dict]) -> list[int]:
+        """
+        在一个事务中记录一批操作的意图，同时记录各操作的 target_path 此时是否已存在
+        :param ops: [{rjcode, mode, old_path, new_path, target_path, cover_url}]
+        :return: 各操作的 id
+        """
+        ids = []
+        with db.atomic():
+            for op in ops:
+                ids.append(JournalEntry.insert(run_id=run_id, status=OP_PENDING, updated_at=time.time(),
+                                               target_existed=os.path.lexists(op['target_path']), **op).execute())
+        return ids
+
+    def mark(self, entry_id: int, status: str, message: str = '', created_files: Optional[list[str]] = None):
+        """
+        :param created_files: HARDLINK 模式下本次创建的文件
+        """
+        created_files = json.dumps(created_files, ensure_ascii=False) if created_files is not None else ''
+        with self.__lock:
+            self.__status_buffer[entry_id] = (status, message, time.time(), created_files)
+            full = len(self.__status_buffer) >= Journal.WRITE_BUFFER_SIZE
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        将缓冲的状态在一个事务中写入数据库
+        """
+        with self.__lock:
+            updates = list(self.__status_buffer.items())
+            self.__status_buffer.clear()
+        if not updates:
+            return
+        with db.atomic():
+            for entry_id, (status, message, updated_at, created_files) in updates:
+                fields = {'status': status, 'message': message, 'updated_at': updated_at}
+                if created_files:
+                    fields['created_files'] = created_files
+                JournalEntry.update(**fields).where(JournalEntry.id == entry_id).execute()
+
+    def last_run_id(self) -> Optional[str]:
+        self.flush()
+        entry = JournalEntry.select(JournalEntry.run_id).order_by(JournalEntry.id.desc()).first()
+        return entry.run_id if entry else None
+
+    def entries(self, run_id: str, statuses: Iterable[str], reverse: bool = False) -> list[JournalEntry]:
+        """
+        :return: 该次运行中处于指定状态的操作，按执行顺序（reverse 为 True 时逆序）排列
+        """
+        self.flush()
+        order = JournalEntry.id.desc() if reverse else JournalEntry.id
+        return list(JournalEntry.select()
+                    .where((JournalEntry.run_id == run_id) & (JournalEntry.status.in_(list(statuses))))
+                    .order_by(order))
+
+    @staticmethod
+    def reconcile(entry: JournalEntry) -> bool:
+        """
+        根据文件系统判断一个 pending 操作是否其实已经完成，并清理 MOVE 模式下中断的跨设备移动
+        （shutil.move 跨设备时先复制整个文件夹，再删除源文件夹）
+        只清理本次运行创建的 target_path：操作前已存在的 target_path 属于用户，例如重名导致操作失败、但失败状态未写入
+        :return: 操作已完成时返回 True；返回 False 时应重新执行该操作
+        """
+        old_exists = os.path.lexists(entry.old_path)
+        target_exists = os.path.lexists(entry.target_path)
+        if entry.mode == 'HARDLINK':
+            return False  # 重新执行是幂等的，只会补充缺失的文件
+        if entry.mode == 'LINK':
+            return os.path.islink(entry.target_path) \
+                and os.path.realpath(entry.target_path) == os.path.realpath(entry.old_path)
+        if not target_exists:
+            return False
+        if entry.target_existed:
+            return False  # 操作不可能已完成，重新执行时会再次失败并记录
+        if not old_exists:
+            return True
+        if entry.mode == 'MOVE' and entry.target_existed is False and os.path.isdir(entry.target_path):
+            if is_copy_complete(entry.old_path, entry.target_path):
+                shutil.rmtree(entry.old_path)  # 复制已完成，删除源文件夹时中断
+                return True
+            if is_partial_copy(entry.old_path, entry.target_path):
+                shutil.rmtree(entry.target_path)  # 复制时中断，源文件夹完好，删除不完整的副本
+        return False
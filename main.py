@@ -1,5 +1,7 @@
 from __future__ import annotations
 import logging
+import logging.handlers
+import multiprocessing
 import os
 import sys
 from json import JSONDecodeError
@@ -10,14 +12,19 @@ import traceback
 import wx
 
 from config_file import ConfigFile, Config
+from factory import create_renamer
+from rename_plan import load_plan, save_plan
 from renamer import Renamer
-from scaner import Scaner
-from scraper import Locale, CachedScraper
 from my_frame import MyFrame
-from wx_log_handler import EVT_WX_LOG_EVENT, WxLogHandler
+from wx_log_handler import WxLogHandler
 
 VERSION = '0.3.2'
 
+LOG_FILE = 'renamer.log'  # 完整的日志，窗口中只保留最近的 LOG_MAX_LINES 行
+LOG_FILE_MAX_BYTES = 10 * 2 ** 20
+LOG_FILE_BACKUP_COUNT = 3
+LOG_MAX_LINES = 5000
+
 
 class MyFileDropTarget(wx.FileDropTarget):
     def __init__(self, window):
@@ -26,9 +33,10 @@ class MyFileDropTarget(wx.FileDropTarget):
 
     def OnDropFiles(self, x, y, filenames):
         """
-        当接收到用户拖拽的文件时，运行 renamer
+        当接收到用户拖拽的文件时，运行 renamer。拖拽重命名计划文件（.json/.csv）时执行该计划
         """
-        dirname_list = [filename for filename in filenames if os.path.isdir(filename)]
+        dirname_list = [filename for filename in filenames
+                        if os.path.isdir(filename) or os.path.splitext(filename)[1].lower() in ('.json', '.csv')]
         self.window.thread_it(self.window.run_renamer, dirname_list)
         return True
 
@@ -48,14 +56,23 @@ class AppFrame(MyFrame):
         # 工作线程。耗时长的任务应放在工作线程执行，避免阻塞 GUI 线程
         self.__worker_thread: Optional[Thread] = None
 
-        # 为 logger 添加 wxLogHandler
-        self.text_ctrl.Bind(EVT_WX_LOG_EVENT, self.on_log_event)
-        wx_log_handler = WxLogHandler(self.text_ctrl)
-        wx_log_handler.setLevel(logging.INFO)
-        wx_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-        Renamer.logger.addHandler(wx_log_handler)
+        # 为 logger 添加 wxLogHandler。日志先进入队列，由定时器分批写入 wx.TextCtrl 组件
+        self.__wx_log_handler = WxLogHandler(self.text_ctrl, max_lines=LOG_MAX_LINES)
+        self.__wx_log_handler.setLevel(logging.INFO)
+        self.__wx_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+        Renamer.logger.addHandler(self.__wx_log_handler)
+
+        # 完整的日志写入文件，超过大小上限后轮转
+        try:
+            file_handler = logging.handlers.RotatingFileHandler(
+                LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT, encoding='utf-8')
+            file_handler.setLevel(logging.DEBUG)
+            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            Renamer.logger.addHandler(file_handler)
+        except OSError as err:
+            self.__print_warning(f'日志文件创建失败："{os.path.abspath(LOG_FILE)}"\n{type(err).__name__}: {str(err)}')
 
-        self.text_ctrl.AppendText('源代码 ' + 'https://github.com/yodhcn/dlsite-doujin-renamer' + '\n')
+        self.__print_info('源代码 ' + 'https://github.com/yodhcn/dlsite-doujin-renamer')
 
     def thread_it(self, func: Callable, *args):
         """
@@ -66,21 +83,6 @@ class AppFrame(MyFrame):
         self.__worker_thread = Thread(target=func, args=args)
         self.__worker_thread.start()
 
-    def on_log_event(self, event):
-        """
-        转发日志到 wx.TextCtrl 组件
-        """
-        if event.levelno <= logging.INFO:
-            text_color = wx.BLACK
-        elif event.levelno <= logging.WARNING:
-            text_color = wx.BLUE
-        else:
-            text_color = wx.RED
-        self.text_ctrl.SetDefaultStyle(wx.TextAttr(text_color))
-        msg = event.message.strip("\r") + "\n"
-        self.text_ctrl.AppendText(msg)
-        event.Skip()
-
     def on_dir_changed_event(self, event):
         """
         当 wx.DirPickerCtrl 组件接收到用户选择的文件夹时，运行 renamer
@@ -88,17 +90,15 @@ class AppFrame(MyFrame):
         root_path = self.dir_picker.GetPath()
         self.thread_it(self.run_renamer, [root_path])
 
+    # 与日志经过同一个队列，保证显示顺序，也可以在工作线程中调用
     def __print_info(self, message: str):
-        self.text_ctrl.SetDefaultStyle(wx.TextAttr(wx.BLACK))
-        self.text_ctrl.AppendText(message + '\n')
+        self.__wx_log_handler.write(logging.INFO, message)
 
     def __print_warning(self, message: str):
-        self.text_ctrl.SetDefaultStyle(wx.TextAttr(wx.BLUE))
-        self.text_ctrl.AppendText(message + '\n')
+        self.__wx_log_handler.write(logging.WARNING, message)
 
     def __print_error(self, message: str):
-        self.text_ctrl.SetDefaultStyle(wx.TextAttr(wx.RED))
-        self.text_ctrl.AppendText(message + '\n')
+        self.__wx_log_handler.write(logging.ERROR, message)
 
     def __before_worker_thread_start(self):
         thread_id = self.__worker_thread.native_id  # 线程 ID
@@ -139,70 +139,55 @@ class AppFrame(MyFrame):
 
         config: Config = self.__config_file.config
 
-        # 配置 scaner
-        scaner = Scaner(max_depth=config['scaner_max_depth'])
-
-        # 配置 scraper
-        scraper_locale = config['scraper_locale']
-        scraper_http_proxy = config['scraper_http_proxy']
-        if scraper_http_proxy:
-            proxies = {
-                'http': scraper_http_proxy,
-                'https': scraper_http_proxy
-            }
-        else:
-            proxies = None
-        scraper_connect_timeout = config['scraper_connect_timeout']
-        scraper_read_timeout = config['scraper_read_timeout']
-        scraper_sleep_interval = config['scraper_sleep_interval']
-        cached_scraper = CachedScraper(
-            locale=Locale[scraper_locale],
-            connect_timeout=scraper_connect_timeout,
-            read_timeout=scraper_read_timeout,
-            sleep_interval=scraper_sleep_interval,
-            proxies=proxies)
-        tags_option = {
-            'ordered_list': config['renamer_tags_ordered_list'],
-            'max_number': 999999 if config['renamer_tags_max_number'] == 0 else config['renamer_tags_max_number'],
-        }
-
-        # 配置 renamer
-        renamer = Renamer(
-            scaner=scaner,
-            scraper=cached_scraper,
-            template=config['renamer_template'],
-            release_date_format=config['renamer_release_date_format'],
-            delimiter=config['renamer_delimiter'],
-            cv_list_left=config['renamer_cv_list_left'],
-            cv_list_right=config['renamer_cv_list_right'],
-            exclude_square_brackets_in_work_name_flag=config['renamer_exclude_square_brackets_in_work_name_flag'],
-            renamer_illegal_character_to_full_width_flag=config['renamer_illegal_character_to_full_width_flag'],
-            make_folder_icon=config['renamer_make_folder_icon'],
-            remove_jpg_file=config['renamer_remove_jpg_file'],
-            tags_option=tags_option,
-            age_cat_map_gen=config['renamer_age_cat_map_gen'],
-            age_cat_map_r15=config['renamer_age_cat_map_r15'],
-            age_cat_map_r18=config['renamer_age_cat_map_r18'],
-            age_cat_left=config['renamer_age_cat_left'],
-            age_cat_right=config['renamer_age_cat_right'],
-            age_cat_ignore_r18=config['renamer_age_cat_ignore_r18'],
-            mode=config['renamer_mode'],
-            move_root=config['renamer_move_root'],
-            move_template=config['renamer_move_template'],
-            series_name_left=config['renamer_series_name_left'],
-            series_name_right=config['renamer_series_name_right']
-        )
-
-        # 执行重命名
-        for root_path in root_path_list:
-            try:
-                renamer.rename(root_path)
-            except Exception as err:
-                Renamer.logger.error(f'[Unexpected exception] {str(err)}\n')
-                traceback.print_exc()
-                break
-
-        self.__before_worker_thread_end()
+        renamer = cached_scraper = None
+        try:
+            renamer, cached_scraper = create_renamer(config)
+            if renamer.run_id:
+                Renamer.logger.info(f'运行 ID：{renamer.run_id}\n')
+
+            # 执行重命名计划
+            plan_file_list = [path for path in root_path_list if os.path.isfile(path)]
+            root_path_list = [path for path in root_path_list if not os.path.isfile(path)]
+            for plan_file in plan_file_list:
+                try:
+                    Renamer.logger.info(f'执行重命名计划："{os.path.normpath(plan_file)}"\n')
+                    renamer.apply(load_plan(plan_file))
+                except Exception as err:
+                    Renamer.logger.error(f'[Unexpected exception] {str(err)}\n')
+                    traceback.print_exc()
+                    break
+
+            if config['renamer_dry_run']:
+                # 只生成重命名计划
+                if root_path_list:
+                    try:
+                        plan = renamer.plan(*root_path_list)
+                        save_plan(plan, config['renamer_plan_file'])
+                        Renamer.logger.info(f'重命名计划已导出："{os.path.abspath(config["renamer_plan_file"])}"\n')
+                    except Exception as err:
+                        Renamer.logger.error(f'[Unexpected exception] {str(err)}\n')
+                        traceback.print_exc()
+                root_path_list = []
+
+            # 执行重命名
+            for root_path in root_path_list:
+                try:
+                    renamer.rename(root_path)
+                except Exception as err:
+                    Renamer.logger.error(f'[Unexpected exception] {str(err)}\n')
+                    traceback.print_exc()
+                    break
+        except Exception as err:
+            # 创建 Renamer 失败（如无法打开 cache.db）
+            Renamer.logger.error(f'[Unexpected exception] {str(err)}\n')
+            traceback.print_exc()
+        finally:
+            # 异常退出时也要写入缓存的写缓冲区，并恢复界面
+            if renamer is not None:
+                renamer.close()
+            if cached_scraper is not None:
+                cached_scraper.close()
+            self.__before_worker_thread_end()
 
 
 def get_application_path():
@@ -219,6 +204,9 @@ def get_application_path():
 
 
 if __name__ == '__main__':
+    # 打包后的程序中，生成文件夹图标的子进程需要由此进入
+    multiprocessing.freeze_support()
+
     app_path = get_application_path()
     icon_path = os.path.join(app_path, 'Letter_R_blue.ico')
 
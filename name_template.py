@@ -0,0 +1,190 @@
+import re
+from datetime import date
+from typing import Optional
+
+from ostool import normalize_path
+from scraper import WorkMetadata
+
+# Windows 系统的保留字符
+# https://docs.microsoft.com/zh-cn/windows/win32/fileio/naming-a-file
+# <（小于）
+# >（大于）
+# ： (冒号)
+# "（双引号）
+# /（正斜杠）
+# \ (反反)
+# | (竖线或竖线)
+# ? （问号）
+# * (星号)
+WINDOWS_RESERVED_CHARACTER_PATTERN = re.compile(r'[\\/*?:"<>|]')
+WINDOWS_RESERVED_CHARACTER_PATTERN_str = r'\/:*?"<>|'  # 半角字符，原
+WINDOWS_RESERVED_CHARACTER_PATTERN_replace_str = '＼／：＊？＂＜＞｜'  # 全角字符，替
+WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN = re.compile(r'[*?:"<>|]')
+WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_str = r':*?"<>|'  # 半角字符，原
+WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_replace_str = '：＊？＂＜＞｜'  # 全角字符，替
+
+# 转换表只需构建一次
+_TO_FULL_WIDTH = str.maketrans(WINDOWS_RESERVED_CHARACTER_PATTERN_str,
+                               WINDOWS_RESERVED_CHARACTER_PATTERN_replace_str)
+_REMOVE = str.maketrans('', '', WINDOWS_RESERVED_CHARACTER_PATTERN_str)
+_TO_FULL_WIDTH_IGNORE_SLASH = str.maketrans(WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_str,
+                                            WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_replace_str)
+_REMOVE_IGNORE_SLASH = str.maketrans('', '', WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_str)
+
+SQUARE_BRACKETS_PATTERN = re.compile(r'【.*?】')
+
+# 模板中的关键字
+PLACEHOLDERS = (
+    'rjcode',
+    'work_name',
+    'maker_id',
+    'maker_name',
+    'age_cat',
+    'series_name',
+    'release_date',
+    'cv_list_str',
+    'tags_list_str',
+)
+PLACEHOLDER_PATTERN = re.compile('|'.join(sorted(PLACEHOLDERS, key=len, reverse=True)))
+
+
+class NameTemplate(object):
+    """
+    预先编译的命名模板。模板只解析一次，渲染时单遍拼接，替换进来的值不会被再次替换
+    """
+
+    def __init__(self, template: str):
+        self.__tokens: list[tuple[bool, str]] = []  # [(是否为关键字, 文本)]
+        pos = 0
+        for match in PLACEHOLDER_PATTERN.finditer(template):
+            if match.start() > pos:
+                self.__tokens.append((False, template[pos: match.start()]))
+            self.__tokens.append((True, match.group()))
+            pos = match.end()
+        if pos < len(template):
+            self.__tokens.append((False, template[pos:]))
+        self.__placeholders = frozenset(text for is_placeholder, text in self.__tokens if is_placeholder)
+
+    @property
+    def placeholders(self):
+        """
+        模板中出现的关键字
+        """
+        return self.__placeholders
+
+    def render(self, values: dict[str, str]):
+        return ''.join(values[text] if is_placeholder else text for is_placeholder, text in self.__tokens)
+
+
+class NameCompiler(object):
+    """
+    根据作品的元数据编写出新的文件名
+    """
+
+    def __init__(
+            self,
+            template: str,
+            keep_slash: bool,  # 为 True 时保留模板中的 "/"，用于 MOVE/LINK 模式下生成多级目录
+            release_date_format: str,
+            delimiter: str,
+            cv_list_left: str,
+            cv_list_right: str,
+            exclude_square_brackets_in_work_name_flag: bool,
+            illegal_character_to_full_width_flag: bool,
+            tags_option: dict,
+            age_cat_map_gen: str,
+            age_cat_map_r15: str,
+            age_cat_map_r18: str,
+            age_cat_left: str,
+            age_cat_right: str,
+            age_cat_ignore_r18: bool,
+            series_name_left: str,
+            series_name_right: str
+    ):
+        self.__keep_slash = keep_slash
+        self.__release_date_format = release_date_format
+        self.__delimiter = delimiter
+        self.__cv_list_left = cv_list_left
+        self.__cv_list_right = cv_list_right
+        self.__exclude_square_brackets_in_work_name_flag = exclude_square_brackets_in_work_name_flag
+        self.__tags_option = tags_option
+        self.__age_cat_map = {'GEN': age_cat_map_gen, 'R15': age_cat_map_r15, 'R18': age_cat_map_r18}
+        self.__age_cat_left = age_cat_left
+        self.__age_cat_right = age_cat_right
+        self.__age_cat_ignore_r18 = age_cat_ignore_r18
+        self.__series_name_left = series_name_left
+        self.__series_name_right = series_name_right
+
+        # 元数据中的字段：半角转全角，或直接移除
+        self.__field_table = _TO_FULL_WIDTH if illegal_character_to_full_width_flag else _REMOVE
+        # 完整的文件名（路径）：MOVE/LINK 模式下保留 "/"
+        if keep_slash:
+            self.__name_table = _TO_FULL_WIDTH_IGNORE_SLASH if illegal_character_to_full_width_flag else _REMOVE_IGNORE_SLASH
+        else:
+            self.__name_table = self.__field_table
+        self.__template = NameTemplate(template.translate(self.__name_table).strip())
+        self.__release_date_cache: dict[str, str] = {}
+
+    def __format_filename_str(self, name: Optional[str]):
+        if name:
+            return name.translate(self.__field_table).strip()
+        else:
+            return name
+
+    def __format_release_date(self, release_date: str):
+        formatted = self.__release_date_cache.get(release_date, None)
+        if formatted is None:
+            formatted = date.fromisoformat(release_date).strftime(self.__release_date_format)
+            self.__release_date_cache[release_date] = formatted
+        return formatted
+
+    def __compile_tags_list_str(self, tags: list[str]):
+        tags_list = []
+        tags_list_flag = []
+        for i in self.__tags_option['ordered_list']:  # ordered_list中存在的标签
+            if isinstance(i, str) and i in tags:
+                tags_list.append(i)
+                tags_list_flag.append(i)
+            elif isinstance(i, list) and i[0] in tags:
+                tags_list.append(i[1])  # 替换新标签
+                tags_list_flag.append(i[0])
+        for i in tags:  # 剩余的标签
+            if not i in tags_list_flag:
+                tags_list.append(i)
+        tags_list = tags_list[: self.__tags_option['max_number']]  # 数量限制
+        tags_list = list(map(self.__format_filename_str, tags_list))
+        return self.__delimiter.join(tags_list)  # 转字符串，加分隔符
+
+    def compile(self, metadata: WorkMetadata):
+        placeholders = self.__template.placeholders
+        values = {'rjcode': metadata['rjcode'], 'maker_id': metadata['maker_id']}
+
+        if 'work_name' in placeholders:
+            work_name = self.__format_filename_str(metadata['work_name'])
+            if self.__exclude_square_brackets_in_work_name_flag:
+                work_name = SQUARE_BRACKETS_PATTERN.sub('', work_name).strip()
+            values['work_name'] = work_name
+        if 'maker_name' in placeholders:
+            values['maker_name'] = self.__format_filename_str(metadata['maker_name'])
+        if 'age_cat' in placeholders:
+            if self.__age_cat_ignore_r18 and metadata['age_category'] == 'R18':
+                values['age_cat'] = ''
+            else:
+                age_cat = self.__age_cat_map.get(metadata['age_category'], self.__age_cat_map['R18'])
+                values['age_cat'] = self.__age_cat_left + age_cat + self.__age_cat_right
+        if 'series_name' in placeholders:
+            series_name = self.__format_filename_str(metadata['series_name'])
+            values['series_name'] = self.__series_name_left + series_name + self.__series_name_right if series_name else ''
+        if 'release_date' in placeholders:
+            values['release_date'] = self.__format_release_date(metadata['release_date'])
+        if 'cv_list_str' in placeholders:
+            cv_list = list(map(self.__format_filename_str, metadata['cvs']))  # cv列表
+            values['cv_list_str'] = self.__cv_list_left + self.__delimiter.join(cv_list) + self.__cv_list_right if len(cv_list) > 0 else ''
+        if 'tags_list_str' in placeholders:  # 标签列表
+            values['tags_list_str'] = self.__compile_tags_list_str(metadata['tags'])
+
+        # 文件名中不能包含 Windows 系统的保留字符
+        new_name = self.__template.render(values).translate(self.__name_table)
+        if self.__keep_slash:
+            return normalize_path(new_name)
+        return new_name.strip()
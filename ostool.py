@@ -1,7 +1,12 @@
 import os
 import errno
+import json
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Callable, Iterable, Optional
 
 
 def force_symlink(src_path: Path, dst_path: Path, target_is_directory: bool = False):
@@ -43,11 +48,122 @@ def copy_with_symlink(src: str, dst: str):
     force_symlink(src_path, dst_path, target_is_directory=True)
 
 
-def move_folder(src: str, dst: str) -> None:
+COPY_BUFFER_SIZE = 8 * 1024 * 1024  # 跨设备复制时每次读写的字节数
+PROGRESS_INTERVAL = 1.0  # 跨设备复制时报告进度的最小间隔（秒）
+
+
+def _is_same_device(src: str, dst: str) -> bool:
+    """
+    dst 尚不存在，与其最近的已存在的上级文件夹比较
     """
-    移动或硬链接复制文件夹
+    parent = os.path.dirname(os.path.abspath(dst))
+    while not os.path.exists(parent):
+        parent = os.path.dirname(parent)
+    return os.stat(src).st_dev == os.stat(parent).st_dev
+
+
+def _copy_file_data(fsrc, fdst, size: int, on_copied: Callable[[int], None]):
+    """
+    复制文件内容。优先使用内核态复制（copy_file_range/sendfile），数据不经过用户空间
+    """
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    offset = 0
+    fast_copies = []  # [fast_copy(源文件偏移, 字节数) -> 已复制字节数]，写入目标文件的当前位置
+    if hasattr(os, 'copy_file_range'):
+        fast_copies.append(lambda pos, count: os.copy_file_range(in_fd, out_fd, count, pos))
+    if hasattr(os, 'sendfile'):
+        fast_copies.append(lambda pos, count: os.sendfile(out_fd, in_fd, pos, count))
+    for fast_copy in fast_copies:
+        try:
+            while offset < size:
+                copied = fast_copy(offset, min(COPY_BUFFER_SIZE, size - offset))
+                if copied == 0:
+                    break
+                offset += copied
+                on_copied(copied)
+            if offset >= size:
+                return
+        except OSError as err:
+            # 文件系统或平台不支持时换用下一种方式；已复制的部分无需重新复制
+            if err.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSOCK,
+                                 errno.EBADF):
+                raise
+    fsrc.seek(offset)
+    fdst.seek(offset)
+    while True:
+        buf = fsrc.read(COPY_BUFFER_SIZE)
+        if not buf:
+            return
+        fdst.write(buf)
+        on_copied(len(buf))
+
+
+def _copy_file(src: str, dst: str, on_copied: Callable[[int], None]):
+    size = os.stat(src).st_size
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        _copy_file_data(fsrc, fdst, size, on_copied)
+    shutil.copystat(src, dst)
+    if os.stat(dst).st_size != size:
+        raise OSError(errno.EIO, f'复制后的文件大小不一致（{size} -> {os.stat(dst).st_size}）', dst)
+
+
+def _copy_tree_parallel(src: str, dst: str, max_workers: int,
+                        progress: Optional[Callable[[int, int, float], None]]):
+    """
+    并发复制文件夹。文件夹与符号链接在当前线程中创建，文件交由线程池复制
+    """
+    files = []  # [(源文件, 目标文件)]
+    dirs = []  # [(源文件夹, 目标文件夹)]
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(src):
+        dst_dirpath = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(dst_dirpath, exist_ok=True)
+        dirs.append((dirpath, dst_dirpath))
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), os.path.join(dst_dirpath, name),
+                           target_is_directory=os.path.isdir(path))
+            elif name in filenames:
+                files.append((path, os.path.join(dst_dirpath, name)))
+                total += os.stat(path).st_size
+        dirnames[:] = [name for name in dirnames if not os.path.islink(os.path.join(dirpath, name))]
+
+    lock = threading.Lock()
+    start = time.monotonic()
+    state = {'copied': 0, 'reported': start}
+
+    def on_copied(n: int):
+        with lock:
+            state['copied'] += n
+            now = time.monotonic()
+            if progress is None or now - state['reported'] < PROGRESS_INTERVAL:
+                return
+            state['reported'] = now
+            copied = state['copied']
+        progress(copied, total, now - start)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='Copy') as executor:
+        futures = [executor.submit(_copy_file, src_file, dst_file, on_copied) for src_file, dst_file in files]
+        for future in futures:
+            future.result()
+    # 文件写入完成后再复制文件夹的时间戳，否则会被写入操作覆盖
+    for src_dirpath, dst_dirpath in reversed(dirs):
+        shutil.copystat(src_dirpath, dst_dirpath)
+    if progress:
+        progress(state['copied'], total, time.monotonic() - start)
+
+
+def move_folder(src: str, dst: str, max_workers: int = 4,
+                progress: Optional[Callable[[int, int, float], None]] = None) -> None:
+    """
+    移动文件夹
+    - 同一设备上直接 os.rename（原子操作）
+    - 跨设备时并发复制全部文件，校验大小后才删除源文件夹；复制失败时删除不完整的副本，源文件夹保持不变
     :param src: 源路径
     :param dst: 目标路径
+    :param max_workers: 跨设备复制时的并发线程数
+    :param progress: 跨设备复制时的进度回调 progress(已复制字节数, 总字节数, 已用秒数)
     """
     if not os.path.exists(src):
         raise FileNotFoundError(f"源路径不存在: {src}")
@@ -60,7 +176,203 @@ def move_folder(src: str, dst: str) -> None:
         err.filename2 = dst
         raise err
 
-    shutil.move(src, dst)
+    if _is_same_device(src, dst):
+        try:
+            os.rename(src, dst)
+            return
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+
+    try:
+        _copy_tree_parallel(src, dst, max_workers, progress)
+    except BaseException:
+        shutil.rmtree(dst, ignore_errors=True)
+        raise
+    shutil.rmtree(src)
+
+
+FICLONE = 0x40049409  # Linux ioctl：创建共享数据块的副本（reflink），用于 Btrfs/XFS 等文件系统
+
+
+def _reflink(src: str, dst: str):
+    """
+    创建 reflink 副本。平台或文件系统不支持时引发 OSError
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.EOPNOTSUPP, '当前平台不支持 reflink', dst)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+MIRROR_MARKER = '.dlsite-doujin-renamer-mirror'  # 镜像文件夹中记录源文件夹的文件，用于检测不同源文件夹的冲突
+
+
+def _link_file(src: str, dst: str, src_stat: os.stat_result) -> str:
+    """
+    为单个文件创建硬链接，失败时（跨设备、文件系统不支持等）依次换用 reflink 与复制
+    目标已存在且与源文件相同（同一 inode，或大小与修改时间相同）时跳过
+    :return: 'linked'/'reflinked'/'copied'/'skipped'
+    """
+    try:
+        dst_stat = os.lstat(dst)
+    except FileNotFoundError:
+        dst_stat = None
+    if dst_stat:
+        if (dst_stat.st_ino, dst_stat.st_dev) == (src_stat.st_ino, src_stat.st_dev) \
+                or (dst_stat.st_size == src_stat.st_size and int(dst_stat.st_mtime) == int(src_stat.st_mtime)):
+            return 'skipped'
+        os.unlink(dst)  # 源文件已改变，重新链接
+    try:
+        os.link(src, dst)
+        return 'linked'
+    except OSError:
+        pass
+    try:
+        _reflink(src, dst)
+        return 'reflinked'
+    except OSError:
+        pass
+    _copy_file(src, dst, lambda n: None)
+    return 'copied'
+
+
+def _link_symlink(src: str, dst: str) -> str:
+    """
+    按源符号链接的目标重建符号链接（与跨设备移动时的处理相同）
+    :return: 'symlinked'/'skipped'
+    """
+    target = os.readlink(src)
+    if os.path.islink(dst):
+        if os.readlink(dst) == target:
+            return 'skipped'
+        os.unlink(dst)
+    os.symlink(target, dst, target_is_directory=os.path.isdir(src))
+    return 'symlinked'
+
+
+def _claim_mirror(src: str, dst: str):
+    """
+    确认 dst 是 src 的镜像（或尚不存在、为空），并在 dst 中记录源文件夹
+    dst 是其它文件夹的镜像或含有其它文件时，引发 FileExistsError，不合并
+    """
+    source = os.path.normcase(os.path.realpath(src))
+    marker_path = os.path.join(dst, MIRROR_MARKER)
+    if os.path.isdir(dst) and os.listdir(dst):
+        try:
+            with open(marker_path, encoding='utf-8') as f:
+                claimed_source = json.load(f).get('source', None)
+        except (OSError, ValueError):
+            claimed_source = None
+        if claimed_source != source:
+            err = FileExistsError(errno.EEXIST, '目标路径已存在，且不是该文件夹的镜像')
+            err.filename = src
+            err.filename2 = dst
+            raise err
+        return
+    os.makedirs(dst, exist_ok=True)
+    with open(marker_path, 'w', encoding='utf-8') as f:
+        json.dump({'source': source}, f, ensure_ascii=False)
+
+
+def mirror_with_hardlinks(src: str, dst: str, max_workers: int = 8) -> tuple[dict[str, int], list[str]]:
+    """
+    在 dst 位置以逐个文件的硬链接镜像 src 文件夹。跨设备时换用 reflink 或复制，符号链接按原目标重建
+    重复执行是幂等的：只补充缺失或已改变的文件，不删除 dst 中多出的文件
+    dst 已是其它文件夹的镜像（例如两个文件夹含有相同的 RJ 号）时引发 FileExistsError
+    :return: (各种处理方式的文件数 {'linked': n, 'reflinked': n, 'copied': n, 'symlinked': n, 'skipped': n},
+              本次创建的文件的相对路径，用于 remove_mirror)
+    """
+    if not os.path.isdir(src):
+        raise FileNotFoundError(f"源路径不存在: {src}")
+    _claim_mirror(src, dst)
+
+    files = []  # [(源文件, 目标文件, 源文件的 stat)]
+    symlinks = []  # [(源符号链接, 目标符号链接)]
+    for dirpath, dirnames, filenames in os.walk(src):
+        dst_dirpath = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(dst_dirpath, exist_ok=True)
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                if entry.is_symlink():
+                    symlinks.append((entry.path, os.path.join(dst_dirpath, entry.name)))
+                elif entry.is_file(follow_symlinks=False) and not (dirpath == src and entry.name == MIRROR_MARKER):
+                    files.append((entry.path, os.path.join(dst_dirpath, entry.name), entry.stat(follow_symlinks=False)))
+
+    counts = {'linked': 0, 'reflinked': 0, 'copied': 0, 'symlinked': 0, 'skipped': 0}
+    created = []
+    for src_path, dst_path in symlinks:
+        result = _link_symlink(src_path, dst_path)
+        counts[result] += 1
+        if result != 'skipped':
+            created.append(os.path.relpath(dst_path, dst))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='Link') as executor:
+        for (_, dst_path, _), result in zip(files, executor.map(lambda args: _link_file(*args), files)):
+            counts[result] += 1
+            if result != 'skipped':
+                created.append(os.path.relpath(dst_path, dst))
+    return counts, created
+
+
+def remove_mirror(dst: str, created: Iterable[str]):
+    """
+    撤销 mirror_with_hardlinks：只删除由它创建的文件（created 为其返回的相对路径），再删除变为空的文件夹
+    dst 中只剩下源文件夹的记录时一并删除
+    """
+    for path in created:
+        try:
+            os.unlink(os.path.join(dst, path))
+        except FileNotFoundError:
+            pass
+    for dirpath, _, _ in sorted(os.walk(dst), key=lambda item: len(item[0]), reverse=True):
+        if dirpath == dst:
+            continue
+        try:
+            os.rmdir(dirpath)
+        except OSError:
+            pass  # 文件夹不为空
+    if os.path.isdir(dst) and os.listdir(dst) == [MIRROR_MARKER]:
+        os.unlink(os.path.join(dst, MIRROR_MARKER))
+    try:
+        os.rmdir(dst)
+    except OSError:
+        pass
+
+
+def _list_files(root: str) -> dict[str, int]:
+    """
+    :return: {相对路径: 文件大小}
+    """
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            files[os.path.relpath(path, root)] = os.lstat(path).st_size
+    return files
+
+
+def is_copy_complete(src: str, dst: str) -> bool:
+    """
+    dst 中是否已有 src 的全部文件（相对路径与大小均相同）
+    """
+    dst_files = _list_files(dst)
+    return all(dst_files.get(path, None) == size for path, size in _list_files(src).items())
+
+
+def is_partial_copy(src: str, dst: str) -> bool:
+    """
+    dst 是否只含有 src 的（可能未复制完的）文件，即中断的复制留下的副本
+    """
+    src_files = _list_files(src)
+    return all(path in src_files and size <= src_files[path] for path, size in _list_files(dst).items())
 
 
 def normalize_path(path: str) -> str:
@@ -0,0 +1,83 @@
+import csv
+import json
+import os
+from collections import Counter
+from typing import TypedDict
+
+# 计划条目的状态
+PLAN_OK = 'ok'  # 可以执行
+PLAN_UNCHANGED = 'unchanged'  # 新旧路径相同，无需执行
+PLAN_COLLISION = 'collision'  # 与计划中的其它作品目标路径相同
+PLAN_EXISTS = 'exists'  # 目标路径已存在
+PLAN_NOT_FOUND = 'not_found'  # dlsite.com 上不存在该作品
+PLAN_ERROR = 'error'  # 爬取元数据失败
+
+
+# 重命名计划中的一项
+class PlanItem(TypedDict):
+    rjcode: str
+    mode: str  # RENAME/MOVE/LINK/HARDLINK
+    old_path: str  # 源文件夹
+    new_path: str  # 重命名后的文件夹。LINK 模式下为放置符号链接的文件夹
+    target_path: str  # 实际写入的路径。LINK 模式下为符号链接本身
+    cover_url: str
+    status: str
+    duplicate: bool  # 计划中是否有其它文件夹含有相同的 RJ 号
+    message: str
+
+
+PLAN_FIELDS = list(PlanItem.__annotations__)
+
+
+def _path_key(path: str):
+    return os.path.normcase(os.path.normpath(path))
+
+
+def check_plan(plan: list[PlanItem]):
+    """
+    检查整个计划：目标路径冲突、重复的 RJ 号、目标路径已存在
+    """
+    rjcode_counter = Counter(item['rjcode'] for item in plan)
+    target_counter = Counter(_path_key(item['target_path']) for item in plan if item['status'] == PLAN_OK)
+    for item in plan:
+        item['duplicate'] = rjcode_counter[item['rjcode']] > 1
+        if item['status'] != PLAN_OK:
+            continue
+        target_key = _path_key(item['target_path'])
+        if target_key == _path_key(item['old_path']):
+            item['status'] = PLAN_UNCHANGED
+        elif target_counter[target_key] > 1:
+            item['status'] = PLAN_COLLISION
+            item['message'] = f'与计划中其它 {target_counter[target_key] - 1} 个作品的目标路径相同'
+        elif item['mode'] != 'HARDLINK' and os.path.lexists(item['target_path']):  # HARDLINK 模式会补充已存在的镜像
+            item['status'] = PLAN_EXISTS
+            item['message'] = '目标路径已存在'
+    return plan
+
+
+def save_plan(plan: list[PlanItem], file_path: str):
+    """
+    导出计划。根据扩展名选择格式：.csv 为 CSV（带 BOM，可直接用 Excel 打开），其它为 JSON
+    """
+    if os.path.splitext(file_path)[1].lower() == '.csv':
+        with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=PLAN_FIELDS)
+            writer.writeheader()
+            writer.writerows(plan)
+    else:
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, ensure_ascii=False, indent=2)
+
+
+def load_plan(file_path: str) -> list[PlanItem]:
+    """
+    读取 save_plan 导出的计划。审阅时可以修改 status 跳过某些作品，或同时修改 new_path 与 target_path
+    """
+    if os.path.splitext(file_path)[1].lower() == '.csv':
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            plan = list(csv.DictReader(f))
+        for item in plan:
+            item['duplicate'] = item['duplicate'] == 'True'
+        return plan
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -1,36 +1,35 @@
+import contextlib
+import errno
+import hashlib
+import heapq
+import json
 import logging
 import os
-import re
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
-from datetime import datetime
+from typing import Optional
 
-from requests.exceptions import RequestException, ConnectionError, HTTPError, Timeout
+from requests.exceptions import RequestException, ChunkedEncodingError, ConnectionError, HTTPError, Timeout
 
-from scaner import Scaner
+from scaner import Scaner, DirIndex
 from scraper import WorkMetadata, Scraper
-from ostool import move_folder, copy_with_symlink, normalize_path
+from scraper.cover_cache import CoverCache
+from scraper.icon import make_icon
+from scraper.metrics import (metrics, profile_session, build_report, format_summary, PROFILE_NONE,
+                             STAGE_SCAN, STAGE_NAME_COMPILE, STAGE_FILESYSTEM, STAGE_COVER_DOWNLOAD,
+                             STAGE_ICON_GENERATE, COUNTER_WORKS, COUNTER_RENAMED, COUNTER_FAILED, COUNTER_RETRIED)
+from journal import Journal, JournalEntry, OP_DONE, OP_FAILED, OP_PENDING, OP_UNDONE
+from name_template import NameCompiler
+from rename_plan import PlanItem, check_plan, PLAN_OK, PLAN_COLLISION, PLAN_EXISTS, PLAN_ERROR, PLAN_NOT_FOUND
+from ostool import move_folder, copy_with_symlink, mirror_with_hardlinks, remove_mirror
 
 import stat
 
-import win32api
-# Windows 系统的保留字符
-# https://docs.microsoft.com/zh-cn/windows/win32/fileio/naming-a-file
-# <（小于）
-# >（大于）
-# ： (冒号)
-# "（双引号）
-# /（正斜杠）
-# \ (反反)
-# | (竖线或竖线)
-# ? （问号）
-# * (星号)
-WINDOWS_RESERVED_CHARACTER_PATTERN = re.compile(r'[\\/*?:"<>|]')
-WINDOWS_RESERVED_CHARACTER_PATTERN_str = r'\/:*?"<>|'  # 半角字符，原
-WINDOWS_RESERVED_CHARACTER_PATTERN_replace_str = '＼／：＊？＂＜＞｜'  # 全角字符，替
-WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN = re.compile(r'[*?:"<>|]')
-WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_str = r':*?"<>|'  # 半角字符，原
-WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_replace_str = '：＊？＂＜＞｜'  # 全角字符，替
-
 
 def _get_logger():
     # create logger
@@ -51,8 +50,19 @@ def _get_logger():
     return logger
 
 
+def _is_transient(err: RequestException):
+    """
+    超时、连接错误、5xx 与 429 是暂时性的错误，稍后重试可能成功
+    """
+    if isinstance(err, HTTPError):
+        status_code = err.response.status_code if err.response is not None else 0
+        return status_code >= 500 or status_code == 429
+    return isinstance(err, (Timeout, ConnectionError, ChunkedEncodingError))
+
+
 class Renamer(object):
     logger = _get_logger()
+    RETRY_MAX_BACKOFF = 60  # 单次重试前等待的最长时间（秒）
 
     def __init__(
             self,
@@ -78,133 +88,125 @@ class Renamer(object):
             age_cat_ignore_r18: bool,
             series_name_left: str,
             series_name_right: str,
-            mode: str,  # RENAME/MOVE/LINK
+            mode: str,  # RENAME/MOVE/LINK/HARDLINK
             move_root: str,
-            move_template: str
+            move_template: str,
+            concurrency: int = 1,  # 并发爬取元数据的线程数上限
+            batch_size: int = 1,  # 每个爬取任务批量请求的作品数
+            dir_index: Optional[DirIndex] = None,  # 文件夹索引。配置不变时，跳过已处理过的 RJ 文件夹
+            journal: Optional[Journal] = None,  # 操作日志。用于中断后继续执行和撤销
+            cover_workers: int = 4,  # 并发下载封面图的线程数
+            cover_cache: Optional[CoverCache] = None,  # 封面图缓存
+            report_file: str = '',  # 运行报告（JSON）的保存路径，为空时只在日志中输出摘要
+            profile: str = PROFILE_NONE,  # none/cprofile/tracemalloc
+            retry_attempts: int = 3,  # 暂时性的爬取失败时，每个作品最多尝试的次数（含第一次）
+            retry_backoff: float = 2  # 第一次重试前等待的秒数，之后每次加倍
     ):
         if 'rjcode' not in template:
             raise ValueError  # 重命名不能丢失 rjcode
         self.__scaner = scaner
         self.__scraper = scraper
-        self.__template = template
-        self.__release_date_format = release_date_format
-        self.__delimiter = delimiter
-        self.__cv_list_left = cv_list_left
-        self.__cv_list_right = cv_list_right
-        self.__exclude_square_brackets_in_work_name_flag = exclude_square_brackets_in_work_name_flag
-        self.__renamer_illegal_character_to_full_width_flag = renamer_illegal_character_to_full_width_flag
         self.__make_folder_icon = make_folder_icon
         self.__remove_jpg_file = remove_jpg_file
-        self.__tags_option = tags_option
-        self.__age_cat_map_gen = age_cat_map_gen
-        self.__age_cat_map_r15 = age_cat_map_r15
-        self.__age_cat_map_r18 = age_cat_map_r18
-        self.__age_cat_left = age_cat_left
-        self.__age_cat_right = age_cat_right
-        self.__age_cat_ignore_r18 = age_cat_ignore_r18
-        self.__series_name_left = series_name_left
-        self.__series_name_right = series_name_right
         self.__mode = mode
         self.__move_root = move_root
-        self.__move_template = move_template
-
-    def __format_filename_str(self, name: str):
-        if name:
-            if self.__renamer_illegal_character_to_full_width_flag:  # 半角转全角
-                name = name.translate(name.maketrans(
-                    WINDOWS_RESERVED_CHARACTER_PATTERN_str, WINDOWS_RESERVED_CHARACTER_PATTERN_replace_str))
-            else:  # 直接移除
-                name = WINDOWS_RESERVED_CHARACTER_PATTERN.sub('', name)
-            return name.strip()
-        else:
-            return name
+        # 模板只编译一次
+        self.__name_compiler = NameCompiler(
+            template=template if mode == 'RENAME' else move_template,
+            keep_slash=mode != 'RENAME',
+            release_date_format=release_date_format,
+            delimiter=delimiter,
+            cv_list_left=cv_list_left,
+            cv_list_right=cv_list_right,
+            exclude_square_brackets_in_work_name_flag=exclude_square_brackets_in_work_name_flag,
+            illegal_character_to_full_width_flag=renamer_illegal_character_to_full_width_flag,
+            tags_option=tags_option,
+            age_cat_map_gen=age_cat_map_gen,
+            age_cat_map_r15=age_cat_map_r15,
+            age_cat_map_r18=age_cat_map_r18,
+            age_cat_left=age_cat_left,
+            age_cat_right=age_cat_right,
+            age_cat_ignore_r18=age_cat_ignore_r18,
+            series_name_left=series_name_left,
+            series_name_right=series_name_right)
+        self.__concurrency = max(1, concurrency)
+        self.__batch_size = max(1, batch_size)
+        self.__dir_index = dir_index
+        self.__journal = journal
+        self.__run_id = Journal.new_run_id() if journal else None  # 同一个 Renamer 执行的所有操作属于同一次运行
+        # 封面阶段：下载封面图的线程池与生成 .ico 的进程池，与重命名并行执行
+        self.__cover_workers = max(1, cover_workers)
+        self.__cover_executor: Optional[ThreadPoolExecutor] = None
+        self.__image_executor: Optional[ProcessPoolExecutor] = None
+        self.__image_executor_lock = threading.Lock()
+        self.__cover_futures: set[Future] = set()
+        self.__cover_cache = cover_cache
+        self.__report_file = report_file
+        self.__profile = profile
+        self.__retry_attempts = max(1, retry_attempts)
+        self.__retry_backoff = max(0.0, retry_backoff)
+        self.__unresolved: list[tuple[str, str]] = []
+        # 命名器配置的指纹。配置（或刮削器的语言）改变后，已处理过的文件夹需要重新处理
+        locale = getattr(scraper, 'locale', None)
+        self.__fingerprint = hashlib.sha1(json.dumps([
+            locale.name if locale else None,
+            template, release_date_format, delimiter, cv_list_left, cv_list_right,
+            exclude_square_brackets_in_work_name_flag, renamer_illegal_character_to_full_width_flag,
+            make_folder_icon, tags_option, age_cat_map_gen, age_cat_map_r15, age_cat_map_r18,
+            age_cat_left, age_cat_right, age_cat_ignore_r18, series_name_left, series_name_right,
+            mode, move_root, move_template
+        ], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def close(self):
+        """
+        关闭生成 .ico 的进程池。Renamer 使用完毕后应调用
+        """
+        with self.__image_executor_lock:
+            if self.__image_executor:
+                self.__image_executor.shutdown(wait=True)
+                self.__image_executor = None
 
+    @property
+    def run_id(self):
+        return self.__run_id
+
+    @property
+    def unresolved(self):
+        """
+        最近一次 rename() 中重试后仍未能爬取元数据的作品：[(rjcode, 文件夹路径)]
+        """
+        return list(self.__unresolved)
 
     def __compile_new_name(self, metadata: WorkMetadata):
         """
         根据作品的元数据编写出新的文件名
         """
-        if self.__mode == 'RENAME':
-            template = self.__template
-            template = self.__format_filename_str(template)
-        else:
-            template = self.__move_template
-            if self.__renamer_illegal_character_to_full_width_flag:  # 半角转全角
-                template = template.translate(template.maketrans(
-                    WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_str, WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_replace_str))
-            else:  # 直接移除
-                template = WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN.sub('', template)
-            template = template.strip()
-
-        work_name = self.__format_filename_str(metadata['work_name'])
-        if self.__exclude_square_brackets_in_work_name_flag:
-            work_name = re.sub(r'【.*?】', '', work_name).strip()
-        maker_name = self.__format_filename_str(metadata['maker_name'])
-        series_name = self.__format_filename_str(metadata['series_name'])
-
-        new_name = template.replace('rjcode', metadata['rjcode'])
-        new_name = new_name.replace('work_name', work_name)
-        new_name = new_name.replace('maker_id', metadata['maker_id'])
-        new_name = new_name.replace('maker_name', maker_name)
-        if 'age_cat' in template:
-            if self.__age_cat_ignore_r18 and metadata['age_category'] == 'R18':
-                new_name = new_name.replace('age_cat', "")
-            else:
-                if metadata['age_category'] == 'GEN':
-                    age_cat = self.__age_cat_map_gen
-                elif metadata['age_category'] == 'R15':
-                    age_cat = self.__age_cat_map_r15
-                else:
-                    age_cat = self.__age_cat_map_r18
-                new_name = new_name.replace('age_cat', self.__age_cat_left + age_cat + self.__age_cat_right)
-        if 'series_name' in template:
-            if series_name:
-                new_name = new_name.replace('series_name', self.__series_name_left + series_name + self.__series_name_right)
-            else:
-                new_name = new_name.replace('series_name', '')
-        if 'release_date' in template:
-            release_date_obj = datetime.strptime(metadata['release_date'], '%Y-%m-%d').date()
-            new_name = new_name.replace('release_date', release_date_obj.strftime(self.__release_date_format))
-
-        cv_list = list(map(self.__format_filename_str, metadata['cvs']))  # cv列表
-        cv_list_str = self.__cv_list_left + self.__delimiter.join(cv_list) + self.__cv_list_right if len(cv_list) > 0 else ''
-        new_name = new_name.replace('cv_list_str', cv_list_str)
-
-        if "tags_list_str" in template:  # 标签列表
-            tags_list = []
-            tags_list_flag = []
-            for i in self.__tags_option['ordered_list']:  # ordered_list中存在的标签
-                if isinstance(i, str) and i in metadata['tags']:
-                    tags_list.append(i)
-                    tags_list_flag.append(i)
-                elif isinstance(i, list) and i[0] in metadata['tags']:
-                    tags_list.append(i[1])  # 替换新标签
-                    tags_list_flag.append(i[0])
-            for i in metadata['tags']:  # 剩余的标签
-                if not i in tags_list_flag:
-                    tags_list.append(i)
-            tags_list = tags_list[: self.__tags_option['max_number']]  # 数量限制
-            tags_list = list(map(self.__format_filename_str, tags_list))
-            tags_list_str = self.__delimiter.join(tags_list)  # 转字符串，加分隔符
-            new_name = new_name.replace('tags_list_str', tags_list_str)
-
-        # 文件名中不能包含 Windows 系统的保留字符
-        if self.__mode == 'RENAME':
-            if self.__renamer_illegal_character_to_full_width_flag:  # 半角转全角
-                new_name = new_name.translate(new_name.maketrans(
-                    WINDOWS_RESERVED_CHARACTER_PATTERN_str, WINDOWS_RESERVED_CHARACTER_PATTERN_replace_str))
-            else:  # 直接移除
-                new_name = WINDOWS_RESERVED_CHARACTER_PATTERN.sub('', new_name)
-            new_name = new_name.strip()
-        else:
-            if self.__renamer_illegal_character_to_full_width_flag:  # 半角转全角
-                new_name = new_name.translate(new_name.maketrans(
-                    WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_str, WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN_replace_str))
-            else:  # 直接移除
-                new_name = WINDOWS_RESERVED_CHARACTER_IGNORE_SLASH_PATTERN.sub('', new_name)
-            new_name = normalize_path(new_name)
+        with metrics.timer(STAGE_NAME_COMPILE):
+            return self.__name_compiler.compile(metadata)
 
-        return new_name
+    @contextlib.contextmanager
+    def __instrumented_run(self, kind: str):
+        """
+        统计一次运行中各阶段的耗时与计数，结束时在日志中输出摘要，并按配置保存 JSON 报告
+        """
+        metrics.reset()
+        start = time.perf_counter()
+        profile = {'mode': PROFILE_NONE}
+        try:
+            with profile_session(self.__profile) as profile:
+                yield
+        finally:
+            report = build_report(kind, time.perf_counter() - start, profile)
+            if self.__run_id:
+                report['run_id'] = self.__run_id
+            Renamer.logger.info(f'运行统计（{kind}）：\n{format_summary(report)}\n')
+            if self.__report_file:
+                try:
+                    with open(self.__report_file, 'w', encoding='utf-8') as f:
+                        json.dump(report, f, ensure_ascii=False, indent=2)
+                except OSError as err:
+                    Renamer.logger.warning(f'运行报告保存失败："{os.path.abspath(self.__report_file)}"\n'
+                                           f'{type(err).__name__}: {str(err)}')
 
     @staticmethod
     def __handle_request_exception(rjcode: str, task: str, err: RequestException):
@@ -222,59 +224,613 @@ class Renamer(object):
             Renamer.logger.error(f'[{rjcode}] -> {task}失败[RequestException]：{str(err)}\n')
 
     def rename(self, root_path: str):
-        work_folders = self.__scaner.scan(root_path)
-        for rjcode, folder_path in work_folders:
+        """
+        流水线：扫描 -> 并发爬取元数据 -> 重命名
+        扫描线程按发现顺序将作品放入有界队列，重命名阶段按相同顺序取出，日志顺序保持稳定
+        """
+        with self.__instrumented_run('rename'):
+            pending = queue.Queue(maxsize=self.__concurrency * self.__batch_size * 2)  # 限制预取的作品数量
+            stop_event = threading.Event()
+            executor = ThreadPoolExecutor(max_workers=self.__concurrency, thread_name_prefix='Scraper')
+            scan_thread = threading.Thread(target=self.__scan_stage,
+                                           args=(root_path, executor, pending, stop_event),
+                                           daemon=True)
+            scan_thread.start()
+            self.__start_cover_stage()
+            self.__unresolved = []
+            try:
+                retries = []
+                if self.__rename_stage(pending, retries):
+                    self.__retry_stage(executor, retries)
+                # 遇到无法继续的错误而中止时，尚未重试的作品同样未能爬取元数据
+                self.__unresolved.extend((rjcode, folder_path) for _, rjcode, folder_path, _ in sorted(retries))
+                self.__log_unresolved()
+            finally:
+                if self.__dir_index:
+                    self.__dir_index.flush()
+                if self.__journal:
+                    self.__journal.flush()
+                stop_event.set()
+                # 清空队列，取消尚未开始的爬取任务，使扫描线程能够退出
+                while scan_thread.is_alive() or not pending.empty():
+                    try:
+                        item = pending.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if item is not None and not isinstance(item, BaseException):
+                        item[2].cancel()
+                scan_thread.join()
+                executor.shutdown(wait=True, cancel_futures=True)
+                self.__finish_cover_stage()
+
+    def __scan_stage(self, root_path: str, executor: ThreadPoolExecutor, pending: queue.Queue,
+                     stop_event: threading.Event):
+        """
+        扫描阶段。每凑满 batch_size 个 RJ 文件夹就提交一个批量爬取任务，以 None 标记扫描结束
+        """
+        def put(item):
+            while not stop_event.is_set():
+                try:
+                    pending.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def submit(batch: list[tuple[str, str]]):
+            # 已处理过的文件夹不必再爬取元数据，以 None 代替爬取任务
+            done = self.__find_done(batch)
+            rjcodes = [rjcode for rjcode, folder_path in batch if folder_path not in done]
+            future = executor.submit(self.__scraper.scrape_metadata_many, rjcodes) if rjcodes else None
+            for rjcode, folder_path in batch:
+                if not put((rjcode, folder_path, None if folder_path in done else future)):
+                    if future:
+                        future.cancel()
+                    return False
+            return True
+
+        batch = []
+        try:
+            for rjcode, folder_path in metrics.timed_iter(STAGE_SCAN, self.__scaner.scan(root_path)):
+                metrics.incr(COUNTER_WORKS)
+                batch.append((rjcode, folder_path))
+                if len(batch) >= self.__batch_size:
+                    if not submit(batch):
+                        return
+                    batch = []
+            if batch and not submit(batch):
+                return
+        except BaseException as err:
+            put(err)  # 扫描时的异常交由重命名阶段抛出
+            return
+        put(None)
+
+    def __find_done(self, works: list[tuple[str, str]]) -> set[str]:
+        """
+        增量扫描时，找出已处理过的作品：
+        - 文件夹索引中记录的、以相同配置处理过的文件夹
+        - 名称已与模板的编写结果一致的文件夹（例如手动或由旧版本重命名过的）。只使用已缓存的元数据，不访问 dlsite.com
+        :return: 已处理过的文件夹路径
+        """
+        if not self.__dir_index:
+            return set()
+        done = {folder_path for rjcode, folder_path in works
+                if self.__dir_index.is_done(folder_path, rjcode, self.__fingerprint)}
+        rest = [(rjcode, folder_path) for rjcode, folder_path in works if folder_path not in done]
+        if not rest:
+            return done
+        cached_metadata = self.__scraper.cached_metadata_many([rjcode for rjcode, _ in rest])
+        for rjcode, folder_path in rest:
+            metadata = cached_metadata.get(rjcode, None)
+            if metadata is None:
+                continue
+            _, target_path = self.__resolve_paths(folder_path, metadata)
+            if os.path.normcase(os.path.abspath(target_path)) == os.path.normcase(os.path.abspath(folder_path)):
+                done.add(folder_path)
+                self.__dir_index.mark_done(folder_path, rjcode, self.__fingerprint)
+        return done
+
+    def __rename_stage(self, pending: queue.Queue, retries: list):
+        """
+        重命名阶段。按扫描顺序等待元数据，然后重命名文件夹
+        暂时性的爬取失败放入重试队列 retries，在扫描完成后由重试阶段处理
+        :return: 遇到无法继续的错误时返回 False
+        """
+        skipped = 0
+        completed = True
+        failed_future = None  # 最近一个失败的爬取任务，同一批作品的错误信息只记录一次
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            rjcode, folder_path, future = item
+            if future is None:
+                skipped += 1
+                Renamer.logger.debug(f'[{rjcode}] -> 已处理过，跳过："{os.path.normpath(folder_path)}"')
+                continue
             Renamer.logger.info(f'[{rjcode}] -> 发现 RJ 文件夹："{os.path.normpath(folder_path)}"')
-            dirname, basename = os.path.split(folder_path)
 
             # 爬取元数据
             try:
-                metadata = self.__scraper.scrape_metadata(rjcode)
+                metadata_dict = future.result()
             except RequestException as err:
-                Renamer.__handle_request_exception(rjcode, '爬取元数据', err)  # 爬取元数据失败
+                if future is not failed_future:
+                    failed_future = future
+                    Renamer.__log_batch_error(err)
+                self.__defer_or_fail(retries, rjcode, folder_path, 1, err)
                 continue
+            if not self.__handle_metadata(rjcode, folder_path, metadata_dict):
+                completed = False
+                break
+        if skipped:
+            Renamer.logger.info(f'跳过 {skipped} 个已处理过的 RJ 文件夹\n')
+        return completed
 
-            # 重命名文件夹
-            new_basename = self.__compile_new_name(metadata)
-            new_folder_path = os.path.join(dirname, new_basename) if self.__mode == 'RENAME' else os.path.join(self.__move_root, new_basename)
-            try:
+    def __handle_metadata(self, rjcode: str, folder_path: str, metadata_dict: dict[str, Optional[WorkMetadata]]):
+        """
+        根据爬取结果重命名单个作品
+        :return: 遇到无法继续的错误时返回 False
+        """
+        if rjcode not in metadata_dict:
+            metrics.incr(COUNTER_FAILED)
+            # 离线模式下缓存未命中，已加入待抓取队列
+            Renamer.logger.warning(f'[{rjcode}] -> 离线模式：元数据未缓存，已加入待抓取队列\n')
+            return True
+        metadata = metadata_dict[rjcode]
+        if metadata is None:
+            # dlsite.com 上不存在该作品
+            metrics.incr(COUNTER_FAILED)
+            Renamer.logger.warning(f'[{rjcode}] -> 爬取元数据失败[HTTPError]：404 Not Found\n')
+            return True
+        return self.__rename_work(rjcode, folder_path, metadata)
+
+    @staticmethod
+    def __log_batch_error(err: RequestException):
+        """
+        记录一批作品爬取失败的原因。批量请求的 url 含有整批的 RJ 号，只记录一次，不在每个作品的日志中重复
+        """
+        Renamer.logger.warning(f'批量爬取元数据失败[{type(err).__name__}]：{str(err)}')
+
+    def __defer_or_fail(self, retries: list, rjcode: str, folder_path: str, attempt: int, err: RequestException):
+        """
+        第 attempt 次爬取失败。暂时性的错误在尝试次数用尽前放入重试队列，按带抖动的指数退避安排下一次尝试
+        错误信息已由 __log_batch_error 记录，此处只记录错误类型
+        """
+        reason = type(err).__name__
+        if isinstance(err, HTTPError) and err.response is not None:
+            reason = f'{reason}：{err.response.status_code} {err.response.reason}'
+        if _is_transient(err) and attempt < self.__retry_attempts:
+            backoff = min(Renamer.RETRY_MAX_BACKOFF, self.__retry_backoff * 2 ** (attempt - 1))
+            delay = backoff / 2 + random.uniform(0, backoff / 2)  # 抖动，避免重试同时到达
+            heapq.heappush(retries, (time.monotonic() + delay, rjcode, folder_path, attempt + 1))
+            metrics.incr(COUNTER_RETRIED)
+            Renamer.logger.info(f'[{rjcode}] -> 爬取元数据失败[{reason}]，'
+                                f'{delay:.1f} 秒后重试（第 {attempt + 1}/{self.__retry_attempts} 次尝试）\n')
+            return
+        metrics.incr(COUNTER_FAILED)
+        Renamer.logger.warning(f'[{rjcode}] -> 爬取元数据失败[{reason}]\n')
+        if _is_transient(err):
+            self.__unresolved.append((rjcode, folder_path))
+
+    def __retry_stage(self, executor: ThreadPoolExecutor, retries: list):
+        """
+        重试阶段。等待到期的作品凑成批次重新爬取，直到重试队列为空
+        遇到无法继续的错误时中止，尚未处理的作品留在重试队列中
+        """
+        while retries:
+            delay = retries[0][0] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.monotonic()
+            due = []
+            while retries and retries[0][0] <= now and len(due) < self.__batch_size * self.__concurrency:
+                due.append(heapq.heappop(retries))
+            batches = [due[i: i + self.__batch_size] for i in range(0, len(due), self.__batch_size)]
+            futures = [executor.submit(self.__scraper.scrape_metadata_many, [rjcode for _, rjcode, _, _ in batch])
+                       for batch in batches]
+            unhandled = [item for batch in batches for item in batch]
+            for batch, future in zip(batches, futures):
+                try:
+                    metadata_dict = future.result()
+                except RequestException as err:
+                    Renamer.__log_batch_error(err)
+                    for item in batch:
+                        unhandled.remove(item)
+                        _, rjcode, folder_path, attempt = item
+                        self.__defer_or_fail(retries, rjcode, folder_path, attempt, err)
+                    continue
+                for item in batch:
+                    unhandled.remove(item)
+                    _, rjcode, folder_path, attempt = item
+                    Renamer.logger.info(f'[{rjcode}] -> 重试（第 {attempt}/{self.__retry_attempts} 次尝试）：'
+                                        f'"{os.path.normpath(folder_path)}"')
+                    if not self.__handle_metadata(rjcode, folder_path, metadata_dict):
+                        for unhandled_item in unhandled:
+                            heapq.heappush(retries, unhandled_item)
+                        return
+
+    def __log_unresolved(self):
+        """
+        汇总本次运行中未能爬取元数据的作品
+        """
+        if self.__unresolved:
+            Renamer.logger.warning(f'以下 {len(self.__unresolved)} 个作品未能爬取元数据，可稍后重新运行：\n'
+                                   + '\n'.join(f'  [{rjcode}] "{os.path.normpath(folder_path)}"'
+                                                for rjcode, folder_path in self.__unresolved) + '\n')
+
+    def __resolve_paths(self, folder_path: str, metadata: WorkMetadata):
+        """
+        :return: (重命名后的文件夹, 实际写入的路径)。LINK 模式下前者为放置符号链接的文件夹，后者为符号链接本身
+        """
+        dirname, basename = os.path.split(folder_path)
+        new_basename = self.__compile_new_name(metadata)
+        if self.__mode == 'RENAME':
+            new_folder_path = os.path.join(dirname, new_basename)
+        else:
+            new_folder_path = os.path.join(self.__move_root, new_basename)
+        if self.__mode == 'LINK':
+            return new_folder_path, os.path.join(new_folder_path, basename)
+        return new_folder_path, new_folder_path
+
+    def __rename_work(self, rjcode: str, folder_path: str, metadata: WorkMetadata):
+        """
+        重命名单个作品的文件夹并修改封面
+        :return: 遇到无法继续的错误时返回 False
+        """
+        new_folder_path, target_path = self.__resolve_paths(folder_path, metadata)
+        return self.__apply_work(rjcode, folder_path, new_folder_path, target_path, metadata['cover_url'])
+
+    @staticmethod
+    def __log_move_progress(rjcode: str, copied: int, total: int, elapsed: float):
+        speed = copied / elapsed if elapsed > 0 else 0
+        Renamer.logger.info(f'[{rjcode}] -> 跨设备移动：{copied / 2 ** 20:.1f}/{total / 2 ** 20:.1f} MiB'
+                            f'（{speed / 2 ** 20:.1f} MiB/s）')
+
+    def __apply_work(self, rjcode: str, folder_path: str, new_folder_path: str, target_path: str, cover_url: str,
+                     entry_id: Optional[int] = None):
+        """
+        执行单个作品的文件系统操作：重命名文件夹并修改封面
+        :param entry_id: 操作日志中已记录的意图。为 None 时先记录意图再执行
+        :return: 遇到无法继续的错误时返回 False
+        """
+        if self.__journal and entry_id is None:
+            entry_id = self.__journal.record(self.__run_id, [{
+                'rjcode': rjcode,
+                'mode': self.__mode,
+                'old_path': folder_path,
+                'new_path': new_folder_path,
+                'target_path': target_path,
+                'cover_url': cover_url,
+            }])[0]
+        created_files = None
+        try:
+            with metrics.timer(STAGE_FILESYSTEM):
                 if self.__mode == 'MOVE':
                     # print('MOVE', folder_path, new_folder_path)
-                    move_folder(folder_path, new_folder_path)
+                    move_folder(folder_path, target_path,
+                                progress=lambda copied, total, elapsed: Renamer.__log_move_progress(rjcode, copied, total, elapsed))
                 elif self.__mode == 'LINK':
                     # print('LINK', folder_path, new_folder_path)
-                    copy_with_symlink(folder_path, os.path.join(new_folder_path, basename))
+                    copy_with_symlink(folder_path, target_path)
+                elif self.__mode == 'HARDLINK':
+                    counts, created_files = mirror_with_hardlinks(folder_path, target_path)
+                    Renamer.logger.info(f'[{rjcode}] -> 硬链接 {counts["linked"]} 个文件，reflink {counts["reflinked"]} 个，'
+                                        f'复制 {counts["copied"]} 个，符号链接 {counts["symlinked"]} 个，'
+                                        f'跳过 {counts["skipped"]} 个已存在的文件')
                 else:
-                    os.rename(folder_path, new_folder_path)
-                Renamer.logger.info(f'[{rjcode}] -> 重命名({self.__mode})成功："{os.path.normpath(new_folder_path)}"')
-            except FileExistsError as err:
-                filename2 = os.path.normpath(err.filename2)
-                Renamer.logger.warning(f'[{rjcode}] -> 重命名({self.__mode})失败[FileExistsError]：{err.strerror}目标路径："{filename2}"\n')
-                continue
-            except OSError as err:
-                err_msg = f'[{rjcode}] -> 重命名失败[OSError]：{str(err)}'
-                if err.winerror == 1314:
-                    err_msg = err_msg + "\n" + "Windows 下创建符号链接目录需要管理员权限，或启用 设置-系统-开发者选项-开发人员模式"
-                Renamer.logger.error(err_msg + "\n")
-                break
+                    os.rename(folder_path, target_path)
+            metrics.incr(COUNTER_RENAMED)
+            Renamer.logger.info(f'[{rjcode}] -> 重命名({self.__mode})成功："{os.path.normpath(new_folder_path)}"')
+            if self.__dir_index:
+                # LINK/HARDLINK 模式下源文件夹保持不变，记录源文件夹
+                done_path = folder_path if self.__mode in ('LINK', 'HARDLINK') else new_folder_path
+                self.__dir_index.mark_done(done_path, rjcode, self.__fingerprint)
+            if self.__journal:
+                self.__journal.mark(entry_id, OP_DONE, created_files=created_files)
+        except FileExistsError as err:
+            metrics.incr(COUNTER_FAILED)
+            if self.__journal:
+                self.__journal.mark(entry_id, OP_FAILED, str(err))
+            filename2 = os.path.normpath(err.filename2 or target_path)
+            Renamer.logger.warning(f'[{rjcode}] -> 重命名({self.__mode})失败[FileExistsError]：{err.strerror}目标路径："{filename2}"\n')
+            return True
+        except OSError as err:
+            metrics.incr(COUNTER_FAILED)
+            if self.__journal:
+                self.__journal.mark(entry_id, OP_FAILED, str(err))
+            err_msg = f'[{rjcode}] -> 重命名失败[OSError]：{str(err)}'
+            if getattr(err, 'winerror', None) == 1314:
+                err_msg = err_msg + "\n" + "Windows 下创建符号链接目录需要管理员权限，或启用 设置-系统-开发者选项-开发人员模式"
+            Renamer.logger.error(err_msg + "\n")
+            return False
+
+        # 修改封面。封面阶段启动时交给封面线程池，否则直接执行
+        if self.__make_folder_icon:
+            if self.__cover_executor:
+                future = self.__cover_executor.submit(self.__cover_task, rjcode, cover_url, new_folder_path)
+                self.__cover_futures.add(future)
+                future.add_done_callback(self.__cover_futures.discard)
+            else:
+                self.__cover_task(rjcode, cover_url, new_folder_path)
 
-            # 修改封面
-            if self.__make_folder_icon:
+        Renamer.logger.info(f'[{rjcode}] -> 处理结束\n')
+        return True
+
+    def __start_cover_stage(self):
+        if self.__make_folder_icon and not self.__cover_executor:
+            self.__cover_executor = ThreadPoolExecutor(max_workers=self.__cover_workers, thread_name_prefix='Cover')
+
+    def __finish_cover_stage(self):
+        """
+        等待所有封面任务完成，然后关闭线程池。进程池保留到 close()，监视模式下每次 rename() 不必重新启动子进程
+        """
+        if self.__cover_executor:
+            wait(list(self.__cover_futures))
+            self.__cover_executor.shutdown(wait=True)
+            self.__cover_executor = None
+        if self.__cover_cache:
+            self.__cover_cache.evict()
+
+    def __get_image_executor(self):
+        """
+        首次需要生成 .ico 时才创建进程池。PIL 的图片处理在子进程中执行，不与 GUI 线程、网络线程争抢 GIL
+        """
+        with self.__image_executor_lock:
+            if not self.__image_executor:
+                self.__image_executor = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2))
+            return self.__image_executor
+
+    def __cover_task(self, rjcode: str, cover_url: str, icon_dir: str):
+        try:
+            Renamer.changeIcon(self, rjcode, cover_url, icon_dir)  # 修改封面
+        except RequestException as err:
+            Renamer.__handle_request_exception(rjcode, '下载封面图', err)  # 下载封面图失败
+        except OSError as err:
+            Renamer.logger.error(f'[{rjcode}] -> 修改封面失败[OSError]：{str(err)}')
+        except Exception as err:
+            # 封面图损坏等 PIL 无法处理的情况
+            Renamer.logger.error(f'[{rjcode}] -> 修改封面失败[{type(err).__name__}]：{str(err)}')
+
+    def plan(self, *root_paths: str) -> list[PlanItem]:
+        """
+        生成重命名计划，不修改任何文件
+        先扫描出全部作品，再并发批量爬取元数据，最后在整个计划范围内检查目标路径冲突和重复的 RJ 号
+        """
+        with self.__instrumented_run('plan'):
+            works = []
+            for root_path in root_paths:
+                for rjcode, folder_path in metrics.timed_iter(STAGE_SCAN, self.__scaner.scan(root_path)):
+                    metrics.incr(COUNTER_WORKS)
+                    works.append((rjcode, folder_path))
+            done = self.__find_done(works)
+            skipped = len(done)
+            works = [(rjcode, folder_path) for rjcode, folder_path in works if folder_path not in done]
+            if skipped:
+                Renamer.logger.info(f'跳过 {skipped} 个已处理过的 RJ 文件夹')
+
+            batches = [works[i: i + self.__batch_size] for i in range(0, len(works), self.__batch_size)]
+            plan: list[PlanItem] = []
+            with ThreadPoolExecutor(max_workers=self.__concurrency, thread_name_prefix='Scraper') as executor:
+                futures = [executor.submit(self.__scraper.scrape_metadata_many, [rjcode for rjcode, _ in batch])
+                           for batch in batches]
+                for batch, future in zip(batches, futures):
+                    try:
+                        metadata_dict = future.result()
+                        error = None
+                    except RequestException as err:
+                        metadata_dict = {}
+                        error = err
+                    for rjcode, folder_path in batch:
+                        item: PlanItem = {
+                            'rjcode': rjcode,
+                            'mode': self.__mode,
+                            'old_path': os.path.normpath(folder_path),
+                            'new_path': '',
+                            'target_path': '',
+                            'cover_url': '',
+                            'status': PLAN_OK,
+                            'duplicate': False,
+                            'message': '',
+                        }
+                        metadata = metadata_dict.get(rjcode, None)
+                        if error is not None:
+                            item['status'] = PLAN_ERROR
+                            item['message'] = f'{type(error).__name__}: {str(error)}'
+                        elif rjcode not in metadata_dict:
+                            item['status'] = PLAN_ERROR
+                            item['message'] = '离线模式：元数据未缓存'
+                        elif metadata is None:
+                            item['status'] = PLAN_NOT_FOUND
+                            item['message'] = '404 Not Found'
+                        else:
+                            new_folder_path, target_path = self.__resolve_paths(folder_path, metadata)
+                            item['new_path'] = os.path.normpath(new_folder_path)
+                            item['target_path'] = os.path.normpath(target_path)
+                            item['cover_url'] = metadata['cover_url']
+                        plan.append(item)
+            check_plan(plan)
+
+            counter = Counter(item['status'] for item in plan)
+            Renamer.logger.info(f'计划完成：共 {len(plan)} 个作品，'
+                                + '，'.join(f'{status} {count}' for status, count in sorted(counter.items())))
+            for item in plan:
+                if item['status'] in (PLAN_COLLISION, PLAN_EXISTS, PLAN_ERROR, PLAN_NOT_FOUND):
+                    Renamer.logger.warning(f'[{item["rjcode"]}] -> 计划({item["status"]})：{item["message"]} "{item["old_path"]}"')
+                if item['duplicate']:
+                    Renamer.logger.warning(f'[{item["rjcode"]}] -> 重复的 RJ 号："{item["old_path"]}"')
+            return plan
+
+    def apply(self, plan: list[PlanItem]):
+        """
+        执行重命名计划。网络请求已在计划阶段完成（修改封面除外），此处只有文件系统操作
+        只执行状态为 ok 的条目，执行前不再重新检查
+        """
+        with self.__instrumented_run('apply'):
+            items = [item for item in plan if item['status'] == PLAN_OK]
+            for item in items:
+                if item['mode'] != self.__mode:
+                    raise ValueError(f'计划的工作模式（{item["mode"]}）与当前配置（{self.__mode}）不一致')
+            entry_ids = [None] * len(items)
+            if self.__journal:
+                # 一次性记录整个计划的意图
+                entry_ids = self.__journal.record(self.__run_id, [{
+                    'rjcode': item['rjcode'],
+                    'mode': item['mode'],
+                    'old_path': item['old_path'],
+                    'new_path': item['new_path'],
+                    'target_path': item['target_path'],
+                    'cover_url': item['cover_url'],
+                } for item in items])
+            self.__start_cover_stage()
+            try:
+                for item, entry_id in zip(items, entry_ids):
+                    if not self.__apply_work(item['rjcode'], item['old_path'], item['new_path'], item['target_path'],
+                                             item['cover_url'], entry_id):
+                        break
+            finally:
+                self.__finish_cover_stage()
+                if self.__dir_index:
+                    self.__dir_index.flush()
+                if self.__journal:
+                    self.__journal.flush()
+
+    def resume(self, run_id: Optional[str] = None):
+        """
+        继续执行被中断的运行：已完成的操作直接跳过，未确认完成的操作先根据文件系统核对，必要时重新执行
+        rename() 的运行中断后，还需对同一根文件夹再执行一次 rename() 以处理尚未扫描到的作品
+        :param run_id: 默认为最近一次运行
+        """
+        with self.__instrumented_run('resume'):
+            if not self.__journal:
+                raise ValueError('未启用操作日志')
+            run_id = run_id or self.__journal.last_run_id()
+            if run_id is None:
+                return
+            entries = self.__journal.entries(run_id, [OP_PENDING])
+            for entry in entries:
+                if entry.mode != self.__mode:
+                    raise ValueError(f'运行的工作模式（{entry.mode}）与当前配置（{self.__mode}）不一致')
+            Renamer.logger.info(f'继续执行 {run_id}：{len(entries)} 个未完成的操作\n')
+            self.__run_id = run_id
+            self.__start_cover_stage()
+            try:
+                for entry in entries:
+                    if Journal.reconcile(entry):
+                        Renamer.logger.info(f'[{entry.rjcode}] -> 已完成："{os.path.normpath(entry.new_path)}"')
+                        self.__journal.mark(entry.id, OP_DONE)
+                        continue
+                    if not self.__apply_work(entry.rjcode, entry.old_path, entry.new_path, entry.target_path,
+                                             entry.cover_url, entry.id):
+                        break
+            finally:
+                self.__finish_cover_stage()
+                if self.__dir_index:
+                    self.__dir_index.flush()
+                self.__journal.flush()
+
+    def undo(self, run_id: Optional[str] = None):
+        """
+        按相反的顺序撤销一次运行中所有已完成的操作
+        :param run_id: 默认为最近一次运行
+        """
+        if not self.__journal:
+            raise ValueError('未启用操作日志')
+        run_id = run_id or self.__journal.last_run_id()
+        if run_id is None:
+            return
+        entries = self.__journal.entries(run_id, [OP_DONE], reverse=True)
+        Renamer.logger.info(f'撤销 {run_id}：{len(entries)} 个操作\n')
+        try:
+            for entry in entries:
                 try:
-                    icon_name, _ = Renamer.changeIcon(self, rjcode, metadata['cover_url'], new_folder_path)  # 修改封面
-                except RequestException as err:
-                    Renamer.__handle_request_exception(rjcode, '下载封面图', err)  # 下载封面图失败
-                    continue
+                    Renamer.__undo_entry(entry)
                 except OSError as err:
-                    Renamer.logger.error(f'[{rjcode}] -> 修改封面失败[OSError]：{str(err)}')
+                    Renamer.logger.error(f'[{entry.rjcode}] -> 撤销失败[OSError]：{str(err)}\n')
                     continue
+                self.__journal.mark(entry.id, OP_UNDONE)
+                if self.__dir_index:
+                    self.__dir_index.unmark_done(entry.old_path if entry.mode in ('LINK', 'HARDLINK') else entry.new_path)
+                Renamer.logger.info(f'[{entry.rjcode}] -> 撤销({entry.mode})成功："{os.path.normpath(entry.old_path)}"')
+        finally:
+            if self.__dir_index:
+                self.__dir_index.flush()
+            self.__journal.flush()
+
+    @staticmethod
+    def __undo_entry(entry: JournalEntry):
+        if entry.mode == 'LINK':
+            # 只删除符号链接本身，源文件夹保持不变
+            if os.path.islink(entry.target_path):
+                os.unlink(entry.target_path)
+        elif entry.mode == 'HARDLINK':
+            if not entry.created_files:
+                # 旧版本的操作日志没有记录创建了哪些文件，无法区分目标文件夹中原有的文件
+                raise OSError(errno.ENOENT, '操作日志中没有记录创建的文件，请手动删除', entry.target_path)
+            remove_mirror(entry.target_path, json.loads(entry.created_files))
+        elif entry.mode == 'MOVE':
+            move_folder(entry.target_path, entry.old_path)
+        else:
+            if os.path.lexists(entry.old_path):
+                err = FileExistsError(errno.EEXIST, '源路径已被占用')
+                err.filename = entry.target_path
+                err.filename2 = entry.old_path
+                raise err
+            os.rename(entry.target_path, entry.old_path)
+
+    def __make_icon(self, data: bytes):
+        """
+        在进程池中生成包含多种尺寸的 .ico
+        """
+        with metrics.timer(STAGE_ICON_GENERATE):
+            if self.__cover_executor:
+                return self.__get_image_executor().submit(make_icon, data).result()
+            return make_icon(data)
+
+    def __load_cover(self, rjcode: str, cover_url: str):
+        """
+        获取封面图及其 .ico。优先使用封面图缓存，缓存过期时发送条件请求验证
+        :return: (封面图, .ico)
+        """
+        if not self.__cover_cache:
+            with metrics.timer(STAGE_COVER_DOWNLOAD):
+                data = self.__scraper.download_cover(cover_url)  # 封面图下载到内存中
+            return data, self.__make_icon(data)
+
+        cached = self.__cover_cache.get(rjcode, cover_url)
+        content_hash = cached.content_hash if cached else None
+        data = None
+        if cached is None or cached.stale:
+            with metrics.timer(STAGE_COVER_DOWNLOAD):
+                data, etag, last_modified = self.__scraper.fetch_cover(cover_url,
+                                                                       cached.etag if cached else '',
+                                                                       cached.last_modified if cached else '')
+            if data is None:
+                self.__cover_cache.mark_revalidated(rjcode, cover_url)  # 304 Not Modified
+            else:
+                content_hash = self.__cover_cache.put_image(rjcode, cover_url, data, etag, last_modified)
 
-            Renamer.logger.info(f'[{rjcode}] -> 处理结束\n')
+        if data is None:
+            data = self.__cover_cache.read_image(content_hash)
+        icon_data = self.__cover_cache.read_icon(content_hash)
+        if icon_data is None:
+            icon_data = self.__make_icon(data)
+            self.__cover_cache.put_icon(content_hash, icon_data)
+        return data, icon_data
 
     # 修改文件夹封面
     def changeIcon(self, rjcode: str, cover_url: str, icon_dir: str):
-        os.chmod(icon_dir, stat.S_IREAD)
-        icon_name, jpg_name = self.__scraper.scrape_icon(rjcode, cover_url, icon_dir)
+        if os.name == 'nt':
+            os.chmod(icon_dir, stat.S_IREAD)  # 只读的文件夹才会读取 desktop.ini
+        icon_name = f'@folder-icon-{rjcode}.ico'
+        jpg_name = 'cover.jpg'
+        icon_path = Path(os.path.join(icon_dir, icon_name))
+        if not os.path.exists(icon_path):
+            data, icon_data = self.__load_cover(rjcode, cover_url)
+            if not self.__remove_jpg_file:
+                Path(os.path.join(icon_dir, jpg_name)).write_bytes(data)
+            icon_path.write_bytes(icon_data)
 
         ini_file_path = Path(os.path.join(icon_dir, "desktop.ini"))
         if not os.path.exists(ini_file_path):
@@ -290,8 +846,10 @@ class Renamer(object):
                 inifile.close()
 
             # 隐藏 desktop.ini 文件 & .ico 文件
-            win32api.SetFileAttributes(str(ini_file_path), 38)
-            win32api.SetFileAttributes(os.path.join(icon_dir, icon_name), 38)
+            if os.name == 'nt':
+                import win32api  # 仅 Windows 下可用，延迟导入
+                win32api.SetFileAttributes(str(ini_file_path), 38)
+                win32api.SetFileAttributes(os.path.join(icon_dir, icon_name), 38)
             # cmd1 = icon_dir[0:2]
             # cmd2 = "cd " + '\"' + icon_dir + '\"'
             # cmd3 = "attrib +h +s " + 'desktop.ini'
@@ -1 +1,2 @@
+from scaner.dir_index import DirIndex
 from scaner.scaner import Scaner
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+from typing import Optional
+
+from peewee import *
+
+from scraper.db import db, SQLITE_MAX_VARIABLES
+
+
+class ScanIndexEntry(Model):
+    path = CharField(primary_key=True)
+    mtime_ns = IntegerField()  # 文件夹的修改时间。子文件夹增删、改名时会改变
+    sub_dirs = TextField()  # 子文件夹列表（json）：[[名称, 是否为符号链接]]
+
+    class Meta:
+        database = db
+
+
+class DoneIndexEntry(Model):
+    path = CharField(primary_key=True)  # 已处理的 RJ 文件夹
+    rjcode = CharField()
+    fingerprint = CharField()  # 处理时命名器配置的指纹。配置改变后需要重新处理
+
+    class Meta:
+        database = db
+
+
+def _normalize(path: str):
+    if not os.path.isabs(path):
+        path = os.path.abspath(path)
+    return os.path.normcase(path)
+
+
+class DirIndex(object):
+    """
+    持久化的文件夹索引，保存在 cache.db 中
+    - 记录每个扫描过的文件夹的修改时间和子文件夹列表。修改时间不变时，扫描器直接使用索引中的子文件夹列表，不再读取文件夹
+    - 记录已处理过的 RJ 文件夹。命名器配置不变时，这些文件夹不必再爬取元数据
+    读取在内存中进行，写入先缓冲，由 flush() 在一个事务中批量写入
+    """
+
+    def __init__(self):
+        db.connect(reuse_if_open=True)
+        db.create_tables([ScanIndexEntry, DoneIndexEntry])
+        self.__lock = threading.Lock()
+        self.__scan_index: Optional[dict[str, tuple[int, list]]] = None  # 首次使用时从数据库加载
+        self.__done_index: Optional[dict[str, tuple[str, str]]] = None
+        self.__scan_updates: dict[str, dict] = {}
+        self.__done_updates: dict[str, dict] = {}
+        self.__done_deletes: set[str] = set()
+
+    def __load(self):
+        with self.__lock:
+            if self.__scan_index is None:
+                self.__scan_index = {path: (mtime_ns, json.loads(sub_dirs))
+                                     for path, mtime_ns, sub_dirs in ScanIndexEntry.select().tuples()}
+                self.__done_index = {path: (rjcode, fingerprint)
+                                     for path, rjcode, fingerprint in DoneIndexEntry.select().tuples()}
+
+    def get_sub_dirs(self, dir_path: str, mtime_ns: int):
+        """
+        :return: 文件夹未修改时返回索引中的子文件夹列表 [(名称, 是否为符号链接)]，否则返回 None
+        """
+        self.__load()
+        entry = self.__scan_index.get(_normalize(dir_path), None)
+        if entry and entry[0] == mtime_ns:
+            return entry[1]
+        return None
+
+    def put_sub_dirs(self, dir_path: str, mtime_ns: int, sub_dirs: list):
+        self.__load()
+        key = _normalize(dir_path)
+        sub_dirs = [[name, is_symlink] for name, is_symlink in sub_dirs]
+        with self.__lock:
+            self.__scan_index[key] = (mtime_ns, sub_dirs)
+            self.__scan_updates[key] = {'path': key, 'mtime_ns': mtime_ns, 'sub_dirs': json.dumps(sub_dirs, ensure_ascii=False)}
+
+    def is_done(self, folder_path: str, rjcode: str, fingerprint: str):
+        self.__load()
+        return self.__done_index.get(_normalize(folder_path), None) == (rjcode, fingerprint)
+
+    def mark_done(self, folder_path: str, rjcode: str, fingerprint: str):
+        self.__load()
+        key = _normalize(folder_path)
+        with self.__lock:
+            self.__done_index[key] = (rjcode, fingerprint)
+            self.__done_deletes.discard(key)
+            self.__done_updates[key] = {'path': key, 'rjcode': rjcode, 'fingerprint': fingerprint}
+
+    def unmark_done(self, folder_path: str):
+        """
+        撤销重命名后，文件夹需要重新处理
+        """
+        self.__load()
+        key = _normalize(folder_path)
+        with self.__lock:
+            self.__done_index.pop(key, None)
+            self.__done_updates.pop(key, None)
+            self.__done_deletes.add(key)
+
+    def flush(self):
+        """
+        将缓冲的更新在一个事务中写入数据库
+        """
+        with self.__lock:
+            scan_rows = list(self.__scan_updates.values())
+            done_rows = list(self.__done_updates.values())
+            done_deletes = list(self.__done_deletes)
+            self.__scan_updates.clear()
+            self.__done_updates.clear()
+            self.__done_deletes.clear()
+        if not scan_rows and not done_rows and not done_deletes:
+            return
+        step = SQLITE_MAX_VARIABLES // 3  # 每行 3 个字段
+        with db.atomic():
+            for i in range(0, len(done_deletes), SQLITE_MAX_VARIABLES):
+                DoneIndexEntry.delete().where(DoneIndexEntry.path.in_(done_deletes[i: i + SQLITE_MAX_VARIABLES])).execute()
+            for model, rows in ((ScanIndexEntry, scan_rows), (DoneIndexEntry, done_rows)):
+                for i in range(0, len(rows), step):
+                    model.insert_many(rows[i: i + step]).on_conflict_replace().execute()
@@ -1,23 +1,98 @@
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
 
+from scaner.dir_index import DirIndex
 from scraper import Dlsite
 
 
 class Scaner(object):
-    def __init__(self, max_depth=5):
+    def __init__(self, max_depth=5, max_workers=8, index: Optional[DirIndex] = None):
+        """
+        :param max_depth: 最大扫描深度
+        :param max_workers: 并发读取文件夹的线程数。网络共享（SMB/NFS）上的文件夹树，并发读取可以显著减少等待时间
+        :param index: 文件夹索引。修改时间未改变的文件夹直接使用索引中的子文件夹列表，实现增量扫描
+        """
         self.__max_depth = max_depth
+        self.__max_workers = max(1, max_workers)
+        self.__index = index
+
+    def __list_dir(self, dir_path: str):
+        """
+        读取文件夹中的子文件夹。os.scandir 返回的 DirEntry 缓存了文件类型，不必再逐个调用 os.path.isdir
+        :return: [(子文件夹名称, 子文件夹路径, 是否为符号链接)]
+        """
+        if self.__index:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+            sub_dirs = self.__index.get_sub_dirs(dir_path, mtime_ns)
+            if sub_dirs is not None:
+                return [(name, os.path.join(dir_path, name), is_symlink) for name, is_symlink in sub_dirs]
+
+        sub_dirs = []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    sub_dirs.append((entry.name, entry.path, entry.is_symlink()))
+        if self.__index:
+            self.__index.put_sub_dirs(dir_path, mtime_ns, [(name, is_symlink) for name, _, is_symlink in sub_dirs])
+        return sub_dirs
 
-    def scan(self, root_path: str, _depth=0):
+    def scan(self, root_path: str):
         """
         生成器。深层遍历所有含 rjcode 的文件夹
+        兄弟文件夹由线程池并发读取，但结果仍按深度优先的顺序返回
         """
-        if os.path.isdir(root_path):  # 检查是否是文件夹
-            folder = os.path.basename(root_path)
-            rjcode = Dlsite.parse_workno(folder)
+        if not os.path.isdir(root_path):  # 检查是否是文件夹
+            return
+        rjcode = Dlsite.parse_workno(os.path.basename(root_path))
+        if rjcode:  # 检查文件夹名称中是否含RJ号
+            yield rjcode, root_path
+            return
+        if self.__max_depth <= 0:
+            return
+
+        if self.__index:
+            root_path = os.path.abspath(root_path)  # 索引以绝对路径为键，只需在根文件夹计算一次
+        real_root_path = os.path.realpath(root_path)
+        try:
+            with ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix='Scaner') as executor:
+                future = executor.submit(self.__list_dir, root_path)
+                yield from self.__walk(executor, future, real_root_path, 0, {real_root_path})
+        finally:
+            if self.__index:
+                self.__index.flush()
+
+    def __walk(self, executor: ThreadPoolExecutor, future: Future, real_path: str, depth: int, visited: set[str]):
+        """
+        :param future: 当前文件夹的读取结果
+        :param real_path: 当前文件夹的真实路径，用于检测符号链接循环
+        :param visited: 已经进入过的符号链接目标
+        """
+        sub_dirs = []  # [(rjcode, 子文件夹路径, 子文件夹真实路径, 子文件夹的读取结果)]
+        entries = future.result()
+        # 一次提取所有子文件夹名称中的 RJ 号
+        rjcodes = Dlsite.parse_worknos([name for name, _, _ in entries])
+        for (name, path, is_symlink), rjcode in zip(entries, rjcodes):
             if rjcode:  # 检查文件夹名称中是否含RJ号
-                yield rjcode, root_path
-            elif _depth < self.__max_depth:
-                dir_list = os.listdir(root_path)
-                for folder in dir_list:
-                    folder_path = os.path.join(root_path, folder)
-                    yield from self.scan(folder_path, _depth + 1)
+                sub_dirs.append((rjcode, path, None, None))
+                continue
+            if depth + 1 >= self.__max_depth:
+                continue
+            if is_symlink:
+                sub_real_path = os.path.realpath(path)
+                # 跳过指向祖先文件夹（会形成循环）或已经遍历过的符号链接
+                if sub_real_path in visited \
+                        or real_path == sub_real_path \
+                        or real_path.startswith(os.path.join(sub_real_path, '')):
+                    continue
+                visited.add(sub_real_path)
+            else:
+                sub_real_path = os.path.join(real_path, name)
+            # 提前提交所有兄弟文件夹的读取任务
+            sub_dirs.append((None, path, sub_real_path, executor.submit(self.__list_dir, path)))
+
+        for rjcode, path, sub_real_path, sub_future in sub_dirs:
+            if rjcode:
+                yield rjcode, path
+            else:
+                yield from self.__walk(executor, sub_future, sub_real_path, depth + 1, visited)
@@ -1,5 +1,7 @@
-from scraper.cached_scraper import CachedScraper
+from scraper.cached_scraper import CachedScraper, BACKEND_REQUESTS, BACKEND_AIOHTTP
+from scraper.cover_cache import CoverCache
 from scraper.dlsite import Dlsite
 from scraper.locale import Locale
+from scraper.rate_limiter import RateLimiter
 from scraper.scraper import Scraper
 from scraper.work_metadata import WorkMetadata
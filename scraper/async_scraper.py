@@ -0,0 +1,296 @@
+import asyncio
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from requests.exceptions import ConnectionError, JSONDecodeError, RequestException, Timeout
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp 是可选依赖，只有使用 AsyncScraper 时才需要
+    aiohttp = None
+
+from scraper.dlsite import Dlsite
+from scraper.locale import Locale
+from scraper.metrics import metrics, STAGE_RATE_LIMIT_WAIT, COUNTER_HTTP_REQUESTS, COUNTER_HTTP_THROTTLED
+from scraper.rate_limiter import RateLimiter, parse_retry_after
+from scraper.icon import make_icon
+from scraper.scraper import Scraper, _http_error, _parse_metadata, _parse_original_workno
+from scraper.work_metadata import WorkMetadata
+
+
+class AsyncScraper(object):
+    """
+    基于 aiohttp 的异步刮削器，接口与 Scraper 相同（scrape_metadata、scrape_metadata_many、scrape_icon）
+    所有请求共享一个事件循环中的连接池，同时进行的请求数由信号量限制，请求速率由限速器限制
+    抛出的异常与 Scraper 相同（requests.exceptions 中的异常）
+    """
+
+    def __init__(self, locale: Locale, proxy: Optional[str] = None, connect_timeout: int = 10, read_timeout: int = 10,
+                 sleep_interval=3, batch_size: int = 20, burst: int = 1, rate_limiter: Optional[RateLimiter] = None,
+                 max_in_flight: int = 100,
+                 original_metadata_lookup: Optional[Callable[[list[str]], dict[str, WorkMetadata]]] = None,
+                 cover_rate_limiter: Optional[RateLimiter] = None):
+        """
+        :param proxy: http 代理。为 None 时使用系统代理
+        :param max_in_flight: 同时进行的请求数上限
+        :param original_metadata_lookup: 查找已知的原作元数据，作用与 Scraper._lookup_original_metadata 相同
+        :param cover_rate_limiter: 下载封面图的限速器，与 Scraper 相同，为 None 时不限速，只在 429/503 时退避
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncScraper 需要安装 aiohttp：pip install aiohttp')
+        self.__locale = locale
+        self.__proxy = proxy
+        self.__connect_timeout = connect_timeout
+        self.__read_timeout = read_timeout
+        self.__batch_size = max(1, batch_size)
+        if not rate_limiter:
+            rate_limiter = RateLimiter(1 / sleep_interval if sleep_interval > 0 else 0, burst)
+        self.__rate_limiter = rate_limiter
+        self.__cover_rate_limiter = cover_rate_limiter or RateLimiter(0)
+        self.__max_in_flight = max(1, max_in_flight)
+        self.__original_metadata_lookup = original_metadata_lookup
+        # session 和信号量必须在事件循环中创建
+        self.__session: Optional['aiohttp.ClientSession'] = None
+        self.__semaphore: Optional[asyncio.Semaphore] = None
+
+    def __get_session(self):
+        if self.__session is None:
+            connector = aiohttp.TCPConnector(limit=self.__max_in_flight)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.__connect_timeout, sock_read=self.__read_timeout)
+            self.__session = aiohttp.ClientSession(connector=connector,
+                                                   timeout=timeout,
+                                                   trust_env=self.__proxy is None)  # 读取系统代理
+            self.__semaphore = asyncio.Semaphore(self.__max_in_flight)
+        return self.__session
+
+    @property
+    def locale(self):
+        return self.__locale
+
+    def _lookup_original_metadata(self, worknos: list[str]) -> dict[str, WorkMetadata]:
+        """
+        查找已知的原作元数据，用于补全翻译作品的社团、系列信息，找到的原作不再请求 dlsite.com
+        """
+        if self.__original_metadata_lookup is None:
+            return {}
+        return self.__original_metadata_lookup(worknos)
+
+    async def __lookup_original_metadata_async(self, worknos: list[str]) -> dict[str, WorkMetadata]:
+        """
+        在线程池中查找已知的原作元数据。CachedScraper 的查找会读取数据库，不应阻塞事件循环
+        """
+        if self.__original_metadata_lookup is None:
+            return {}
+        return await asyncio.get_running_loop().run_in_executor(None, self._lookup_original_metadata, worknos)
+
+    async def close(self):
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    async def __get(self, url: str, params=None, headers=None, read=None, rate_limiter: Optional[RateLimiter] = None):
+        """
+        经过限速器发送 GET 请求。遇到 429/503 时通知限速器退避后重试
+        :param read: 读取响应的协程函数，为 None 时按 json 解析
+        :param rate_limiter: 使用的限速器，为 None 时使用 api 的限速器
+        """
+        rate_limiter = rate_limiter or self.__rate_limiter
+        session = self.__get_session()
+        async with self.__semaphore:
+            for attempt in range(Scraper.MAX_THROTTLE_RETRIES + 1):
+                wait = rate_limiter.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    metrics.add_time(STAGE_RATE_LIMIT_WAIT, wait)
+                try:
+                    async with session.get(url, params=params, headers=headers, proxy=self.__proxy) as response:
+                        metrics.incr(COUNTER_HTTP_REQUESTS)
+                        if response.status in Scraper.THROTTLE_STATUS_CODES:
+                            metrics.incr(COUNTER_HTTP_THROTTLED)
+                        if response.status in Scraper.THROTTLE_STATUS_CODES and attempt < Scraper.MAX_THROTTLE_RETRIES:
+                            rate_limiter.penalize(parse_retry_after(response.headers.get('Retry-After', None)))
+                            continue
+                        if response.status >= 400:
+                            raise _http_error(str(response.url), response.status, response.reason)
+                        rate_limiter.reward()
+                        if read is None:
+                            try:
+                                return await response.json(content_type=None)
+                            except ValueError as err:
+                                # 响应不是 json（json.JSONDecodeError）或无法解码（UnicodeDecodeError）
+                                # 与 requests 的 Response.json() 一样抛出 requests.exceptions.JSONDecodeError
+                                raise JSONDecodeError(getattr(err, 'msg', str(err)), getattr(err, 'doc', ''),
+                                                      getattr(err, 'pos', 0)) from err
+                        return await read(response)
+                except asyncio.TimeoutError as err:
+                    raise Timeout(f'请求超时：{url}') from err
+                except aiohttp.ClientConnectionError as err:
+                    raise ConnectionError(str(err)) from err
+                except aiohttp.ClientError as err:
+                    raise RequestException(str(err)) from err
+
+    async def __request_product_api(self, workno: str):
+        url = Dlsite.compile_product_api_url(workno)
+        product_info_list = await self.__get(url, {'locale': self.__locale.name})
+        if len(product_info_list) == 0:
+            raise _http_error(url, 404, 'Not Found')
+        return product_info_list[0]
+
+    async def __request_product_api_batch(self, worknos: list[str]):
+        url = Dlsite.compile_product_api_batch_url(worknos)
+        product_info_list = await self.__get(url, {'locale': self.__locale.name})
+        return {product_info['workno'].upper(): product_info for product_info in product_info_list}
+
+    async def scrape_metadata(self, rjcode: str):
+        rjcode = rjcode.upper()
+        if not Dlsite.WORKNO_PATTERN.fullmatch(rjcode):
+            raise ValueError
+        product_info = await self.__request_product_api(rjcode)
+        original_workno = _parse_original_workno(product_info)
+        original_product_info = None
+        if original_workno:
+            original_metadata_dict = await self.__lookup_original_metadata_async([original_workno])
+            original_product_info = original_metadata_dict.get(original_workno, None) \
+                                    or await self.__request_product_api(original_workno)
+        return _parse_metadata(product_info, original_product_info)
+
+    async def __scrape_batch(self, batch: list[str]):
+        product_info_dict = await self.__request_product_api_batch(batch)
+
+        # 翻译作品需要原作的信息，缺少的原作信息再批量请求一次
+        original_worknos = []
+        for product_info in product_info_dict.values():
+            original_workno = _parse_original_workno(product_info)
+            if original_workno and original_workno not in product_info_dict and original_workno not in original_worknos:
+                original_worknos.append(original_workno)
+        original_product_info_dict = await self.__lookup_original_metadata_async(original_worknos) \
+            if original_worknos else {}
+        original_worknos = [workno for workno in original_worknos if workno not in original_product_info_dict]
+        if original_worknos:
+            original_product_info_dict.update(await self.__request_product_api_batch(original_worknos))
+
+        metadata_dict: dict[str, Optional[WorkMetadata]] = {}
+        for rjcode in batch:
+            product_info = product_info_dict.get(rjcode, None)
+            if product_info is None:
+                metadata_dict[rjcode] = None  # 作品不存在
+                continue
+            original_workno = _parse_original_workno(product_info)
+            original_product_info = None
+            if original_workno:
+                original_product_info = product_info_dict.get(original_workno, None) \
+                                        or original_product_info_dict.get(original_workno, None)
+                if original_product_info is None:
+                    # 原作不存在时无法补全社团、系列信息，与 scrape_metadata() 一致，视为作品不存在
+                    metadata_dict[rjcode] = None
+                    continue
+            metadata_dict[rjcode] = _parse_metadata(product_info, original_product_info)
+        return metadata_dict
+
+    async def scrape_metadata_many(self, rjcodes: Iterable[str]) -> dict[str, Optional[WorkMetadata]]:
+        """
+        批量爬取元数据，各批次并发请求
+        :return: rjcode -> metadata，dlsite.com 上不存在的作品对应 None
+        """
+        rjcodes = list(dict.fromkeys(rjcode.upper() for rjcode in rjcodes))  # 去重并保持顺序
+        for rjcode in rjcodes:
+            if not Dlsite.WORKNO_PATTERN.fullmatch(rjcode):
+                raise ValueError
+
+        batches = [rjcodes[i: i + self.__batch_size] for i in range(0, len(rjcodes), self.__batch_size)]
+        metadata_dict: dict[str, Optional[WorkMetadata]] = {}
+        for batch_metadata_dict in await asyncio.gather(*map(self.__scrape_batch, batches)):
+            metadata_dict.update(batch_metadata_dict)
+        return metadata_dict
+
+    async def download_cover(self, cover_url: str) -> bytes:
+        """
+        下载封面图到内存
+        """
+        data, _, _ = await self.fetch_cover(cover_url)
+        return data
+
+    async def fetch_cover(self, cover_url: str, etag: str = '', last_modified: str = ''):
+        """
+        下载封面图到内存。提供 etag/last_modified 时发送条件请求
+        :return: (封面图，服务器返回 304 Not Modified 时为 None, ETag, Last-Modified)
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        async def read(response: aiohttp.ClientResponse):
+            if response.status == 304:
+                return None, etag, last_modified
+            return await response.read(), response.headers.get('ETag', ''), response.headers.get('Last-Modified', '')
+
+        return await self.__get(cover_url, headers=headers, read=read, rate_limiter=self.__cover_rate_limiter)
+
+    async def scrape_icon(self, rjcode: str, cover_url: str, icon_dir: str):
+        """
+        下载图片并生成.ico文件
+        """
+        icon_name = f'@folder-icon-{rjcode}.ico'
+        jpg_name = 'cover.jpg'
+        icon_path = Path(os.path.join(icon_dir, icon_name))
+        jpg_path = Path(os.path.join(icon_dir, jpg_name))
+
+        if not os.path.exists(icon_path):
+            data = await self.download_cover(cover_url)  # 爬取作品图片
+            # 文件读写和图片处理放到线程池中执行，避免阻塞事件循环
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, jpg_path.write_bytes, data)
+            icon_data = await loop.run_in_executor(None, make_icon, data)
+            await loop.run_in_executor(None, icon_path.write_bytes, icon_data)
+
+        return icon_name, jpg_name  # 返回值用于后续删存操作
+
+
+class BlockingAsyncScraper(object):
+    """
+    AsyncScraper 的同步包装，接口与 Scraper 相同，可以直接交给 Renamer 使用
+    事件循环运行在后台线程中，多个调用线程共享同一个事件循环和连接池
+    """
+
+    def __init__(self, async_scraper: AsyncScraper):
+        self.__async_scraper = async_scraper
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, name='AsyncScraper', daemon=True)
+        self.__thread.start()
+
+    def __run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.__loop).result()
+
+    @property
+    def locale(self):
+        return self.__async_scraper.locale
+
+    def _lookup_original_metadata(self, worknos: list[str]) -> dict[str, WorkMetadata]:
+        return self.__async_scraper._lookup_original_metadata(worknos)
+
+    def scrape_metadata(self, rjcode: str):
+        return self.__run(self.__async_scraper.scrape_metadata(rjcode))
+
+    def scrape_metadata_many(self, rjcodes: Iterable[str]):
+        return self.__run(self.__async_scraper.scrape_metadata_many(list(rjcodes)))
+
+    def download_cover(self, cover_url: str):
+        return self.__run(self.__async_scraper.download_cover(cover_url))
+
+    def fetch_cover(self, cover_url: str, etag: str = '', last_modified: str = ''):
+        return self.__run(self.__async_scraper.fetch_cover(cover_url, etag, last_modified))
+
+    def scrape_icon(self, rjcode: str, cover_url: str, icon_dir: str):
+        return self.__run(self.__async_scraper.scrape_icon(rjcode, cover_url, icon_dir))
+
+    def close(self):
+        if self.__loop.is_closed():
+            return
+        self.__run(self.__async_scraper.close())
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__loop.close()
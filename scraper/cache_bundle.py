@@ -0,0 +1,91 @@
+import gzip
+import json
+from typing import Optional
+
+from peewee import EXCLUDED
+
+from scraper.db import db, init_db, WorkMetadataCache, STATUS_OK, STATUS_NOT_FOUND, SQLITE_MAX_VARIABLES
+from scraper.locale import Locale
+from scraper.work_metadata import METADATA_SCHEMA_VERSION
+
+# 元数据包：gzip 压缩的 JSON Lines。第一行为包头，之后每行一个缓存条目
+BUNDLE_FORMAT = 'dlsite-doujin-renamer/metadata-cache'
+BUNDLE_VERSION = 1
+BUNDLE_FIELDS = ('rjcode', 'locale', 'schema_version', 'metadata', 'status', 'fetched_at')
+IMPORT_BATCH_SIZE = SQLITE_MAX_VARIABLES // len(BUNDLE_FIELDS)
+
+
+def export_bundle(file_path: str, locale: Optional[str] = None, legacy_locale: str = Locale.ja_jp.name) -> int:
+    """
+    将元数据缓存流式导出为元数据包，不会一次性读入全部缓存
+    :param locale: 只导出该语言的缓存，为 None 时导出全部语言
+    :param legacy_locale: 旧版本（不区分语言）的缓存所属的语言，见 init_db
+    :return: 导出的条目数
+    """
+    init_db(legacy_locale)
+    query = WorkMetadataCache.select(*[getattr(WorkMetadataCache, field) for field in BUNDLE_FIELDS])
+    if locale is not None:
+        query = query.where(WorkMetadataCache.locale == locale)
+    count = 0
+    with gzip.open(file_path, 'wt', encoding='utf-8', newline='\n') as f:
+        f.write(json.dumps({'format': BUNDLE_FORMAT, 'version': BUNDLE_VERSION}) + '\n')
+        for row in query.tuples().iterator():
+            f.write(json.dumps(dict(zip(BUNDLE_FIELDS, row)), ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def _read_bundle(file_path: str):
+    with gzip.open(file_path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline() or '{}')
+        if header.get('format', None) != BUNDLE_FORMAT:
+            raise ValueError(f'不是元数据包："{file_path}"')
+        if header.get('version', 0) > BUNDLE_VERSION:
+            raise ValueError(f'元数据包的版本（{header["version"]}）高于当前支持的版本（{BUNDLE_VERSION}）')
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _merge_batch(rows: list[dict]) -> int:
+    """
+    写入一批条目。已有的条目只在包中的 fetched_at 更新时才被覆盖
+    :return: 实际写入的条目数
+    """
+    before = db.connection().total_changes
+    WorkMetadataCache.insert_many(rows).on_conflict(
+        conflict_target=[WorkMetadataCache.rjcode, WorkMetadataCache.locale],
+        preserve=[WorkMetadataCache.schema_version, WorkMetadataCache.metadata,
+                  WorkMetadataCache.status, WorkMetadataCache.fetched_at],
+        where=(EXCLUDED.fetched_at > WorkMetadataCache.fetched_at)).execute()
+    return db.connection().total_changes - before
+
+
+def import_bundle(file_path: str, legacy_locale: str = Locale.ja_jp.name) -> tuple[int, int]:
+    """
+    将元数据包合并到元数据缓存中，同一作品同一语言以抓取时间较新的为准
+    逐行读取，每批条目用一条 INSERT ... ON CONFLICT 写入，所有批次在同一个事务中提交
+    结构版本与当前不同的条目无法使用，直接跳过
+    :param legacy_locale: 旧版本（不区分语言）的缓存所属的语言，见 init_db
+    :return: (写入的条目数, 跳过的条目数)
+    """
+    init_db(legacy_locale)  # 旧版本的数据库先迁移，否则没有 locale 列
+    merged = skipped = 0
+    batch: list[dict] = []
+    with db.atomic():
+        for row in _read_bundle(file_path):
+            if row.get('schema_version', None) != METADATA_SCHEMA_VERSION \
+                    or row.get('status', None) not in (STATUS_OK, STATUS_NOT_FOUND):
+                skipped += 1
+                continue
+            batch.append({field: row[field] for field in BUNDLE_FIELDS})
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                written = _merge_batch(batch)
+                merged += written
+                skipped += len(batch) - written
+                batch.clear()
+        if batch:
+            written = _merge_batch(batch)
+            merged += written
+            skipped += len(batch) - written
+    return merged, skipped
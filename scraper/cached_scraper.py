@@ -1,29 +1,322 @@
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
 
-from scraper.db import db, WorkMetadataCache
+from requests.exceptions import ConnectionError, HTTPError, RequestException
+
+from scraper.db import db, init_db, WorkMetadataCache, PendingFetch, STATUS_OK, STATUS_NOT_FOUND, SQLITE_MAX_VARIABLES
+from scraper.dlsite import Dlsite
 from scraper.locale import Locale
-from scraper.scraper import Scraper
-from scraper.work_metadata import WorkMetadata
+from scraper.metrics import metrics, STAGE_CACHE_LOOKUP, COUNTER_CACHE_HIT, COUNTER_CACHE_MISS
+from scraper.rate_limiter import RateLimiter
+from scraper.scraper import Scraper, _http_error
+from scraper.work_metadata import WorkMetadata, METADATA_SCHEMA_VERSION
+
+# 访问 dlsite.com 的方式
+BACKEND_REQUESTS = 'requests'  # Scraper，每个爬取线程阻塞在一个请求上
+BACKEND_AIOHTTP = 'aiohttp'  # AsyncScraper，所有请求在同一个事件循环中并发进行
 
 
 class CachedScraper(Scraper):
-    def __init__(self, locale: Locale, proxies=None, connect_timeout: int = 10, read_timeout: int = 10, sleep_interval=3):
-        super().__init__(locale, proxies, connect_timeout, read_timeout, sleep_interval)
-        db.connect()
-        db.create_tables([WorkMetadataCache])
+    WRITE_BUFFER_SIZE = 200  # 写缓冲区中的条目数达到此值时，在一个事务中批量写入数据库
+    # 与 DEFAULT_CONFIG 中的默认值一致
+    DEFAULT_TTL = 90 * 86400
+    DEFAULT_NEGATIVE_TTL = 7 * 86400
+
+    def __init__(self, locale: Locale, proxies=None, connect_timeout: int = 10, read_timeout: int = 10, sleep_interval=3,
+                 batch_size: int = 20, burst: int = 1, rate_limiter: Optional[RateLimiter] = None,
+                 pool_size: int = 10, max_retries: int = 3, keep_alive: bool = True,
+                 ttl: float = DEFAULT_TTL, negative_ttl: float = DEFAULT_NEGATIVE_TTL, background_refresh: bool = True,
+                 offline: bool = False, backend: str = BACKEND_REQUESTS, max_in_flight: int = 100,
+                 cover_rate_limiter: Optional[RateLimiter] = None):
+        """
+        :param ttl: 缓存的有效期（秒），过期后重新抓取。为 0 时永不过期
+        :param negative_ttl: “作品不存在”的缓存有效期（秒）。为 0 时不缓存
+        :param background_refresh: 为 True 时，过期的缓存先照常返回，再由后台线程重新抓取
+        :param offline: 为 True 时只从缓存中查找（忽略有效期），不访问 dlsite.com。未命中的作品加入待抓取队列，
+                        scrape_metadata_many() 的返回值中不包含这些作品，可在联网后调用 fetch_pending() 抓取
+        :param backend: 未命中缓存时访问 dlsite.com 的方式（BACKEND_REQUESTS 或 BACKEND_AIOHTTP）
+        :param max_in_flight: BACKEND_AIOHTTP 同时进行的请求数上限
+        :param cover_rate_limiter: 下载封面图的限速器（与异步刮削器共享）。为 None 时不限速，只在 429/503 时退避
+        """
+        if not rate_limiter:
+            rate_limiter = RateLimiter(1 / sleep_interval if sleep_interval > 0 else 0, burst)  # 与异步刮削器共享
+        if not cover_rate_limiter:
+            cover_rate_limiter = RateLimiter(0)
+        super().__init__(locale, proxies, connect_timeout, read_timeout, sleep_interval, batch_size, burst, rate_limiter,
+                         pool_size, max_retries, keep_alive, cover_rate_limiter)
+        self.__async_scraper: Optional['BlockingAsyncScraper'] = None
+        if backend == BACKEND_AIOHTTP:
+            # 只有使用异步刮削器时才导入，不需要 aiohttp 的用户不必加载它
+            from scraper.async_scraper import AsyncScraper, BlockingAsyncScraper
+
+            proxy = (proxies.get('https', None) or proxies.get('http', None)) if proxies else None
+            self.__async_scraper = BlockingAsyncScraper(AsyncScraper(
+                locale, proxy, connect_timeout, read_timeout, sleep_interval, batch_size, burst, rate_limiter,
+                max_in_flight, original_metadata_lookup=self._lookup_original_metadata,
+                cover_rate_limiter=cover_rate_limiter))
+        self.__locale = locale.name
+        self.__batch_size = max(1, batch_size)
+        self.__ttl = ttl
+        self.__negative_ttl = negative_ttl
+        self.__background_refresh = background_refresh
+        self.__offline = offline
+        self.__refresh_lock = threading.Lock()
+        self.__refresh_pending: dict[str, None] = {}  # 等待后台刷新的 rjcode（有序集合）
+        self.__refresh_running = False
+        self.__refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='CacheRefresh')
+        self.__closed = False
+        self.__write_lock = threading.Lock()
+        self.__write_buffer: dict[str, dict] = {}  # 尚未写入数据库的缓存条目
+        init_db(legacy_locale=self.__locale)
+
+    def close(self):
+        """
+        等待正在进行的后台刷新结束，写入缓冲区中的条目，然后关闭连接池
+        使用完毕后必须调用，否则缓冲区中的条目会丢失
+        """
+        self.__closed = True
+        self.__refresh_executor.shutdown(wait=True)
+        self.flush()
+        if self.__async_scraper is not None:
+            self.__async_scraper.close()
+        super().close()
+
+    def flush(self):
+        """
+        将写缓冲区中的条目在一个事务中写入数据库
+        """
+        with self.__write_lock:
+            rows = list(self.__write_buffer.values())
+            if not rows:
+                return
+            step = SQLITE_MAX_VARIABLES // len(rows[0])  # 每行的每个字段占用一个参数
+            with db.atomic():
+                for i in range(0, len(rows), step):
+                    WorkMetadataCache.insert_many(rows[i: i + step]).on_conflict_replace().execute()
+            self.__write_buffer.clear()
+
+    def __save_result(self, rjcode: str, metadata: Optional[WorkMetadata]):
+        """
+        缓存抓取结果。metadata 为 None 表示作品不存在
+        结果先放入写缓冲区，攒够一批后再写入数据库
+        """
+        if not metadata and self.__negative_ttl <= 0:
+            return
+        row = {
+            'rjcode': rjcode,
+            'locale': self.__locale,
+            'schema_version': METADATA_SCHEMA_VERSION,
+            'metadata': json.dumps(metadata, indent=2, ensure_ascii=False) if metadata else '',
+            'status': STATUS_OK if metadata else STATUS_NOT_FOUND,
+            'fetched_at': time.time(),
+        }
+        with self.__write_lock:
+            self.__write_buffer[rjcode] = row
+            full = len(self.__write_buffer) >= CachedScraper.WRITE_BUFFER_SIZE
+        if full:
+            self.flush()
+
+    def __select_many(self, rjcodes: list[str]):
+        """
+        一次查询多个 rjcode 在当前语言下的缓存（写缓冲区优先）。结构版本不同的缓存视为未缓存
+        """
+        rows: dict[str, dict] = {}
+        with self.__write_lock:
+            for rjcode in rjcodes:
+                if rjcode in self.__write_buffer:
+                    rows[rjcode] = self.__write_buffer[rjcode]
+        rjcodes = [rjcode for rjcode in rjcodes if rjcode not in rows]
+        for i in range(0, len(rjcodes), SQLITE_MAX_VARIABLES):
+            query = WorkMetadataCache.select().where(
+                (WorkMetadataCache.locale == self.__locale)
+                & (WorkMetadataCache.schema_version == METADATA_SCHEMA_VERSION)
+                & WorkMetadataCache.rjcode.in_(rjcodes[i: i + SQLITE_MAX_VARIABLES]))
+            for row in query.dicts():
+                rows[row['rjcode']] = row
+        return rows
+
+    def __is_expired(self, row: dict, now: float):
+        ttl = self.__ttl if row['status'] == STATUS_OK else self.__negative_ttl
+        return ttl > 0 and now - row['fetched_at'] >= ttl
+
+    def __lookup_many(self, rjcodes: list[str]):
+        """
+        在数据库中查找
+        :return: rjcode -> metadata，只包含命中的 rjcode。命中“作品不存在”的缓存时 metadata 为 None
+        """
+        now = time.time()
+        hits: dict[str, Optional[WorkMetadata]] = {}
+        stale_rjcodes = []
+        for rjcode, row in self.__select_many(rjcodes).items():
+            if row['status'] == STATUS_NOT_FOUND and self.__negative_ttl <= 0:
+                continue
+            metadata = json.loads(row['metadata']) if row['status'] == STATUS_OK else None
+            if not self.__offline and self.__is_expired(row, now):
+                if not (self.__background_refresh and metadata):
+                    continue
+                stale_rjcodes.append(rjcode)  # 先返回旧的 metadata，后台重新抓取
+            hits[rjcode] = metadata
+        if stale_rjcodes:
+            self.__schedule_refresh(stale_rjcodes)
+        return hits
+
+    def __lookup_many_counted(self, rjcodes: list[str]):
+        """
+        查找作品本身的缓存，统计耗时与命中率（查找原作的缓存不计入）
+        """
+        with metrics.timer(STAGE_CACHE_LOOKUP):
+            hits = self.__lookup_many(rjcodes)
+        metrics.incr(COUNTER_CACHE_HIT, len(hits))
+        metrics.incr(COUNTER_CACHE_MISS, len(rjcodes) - len(hits))
+        return hits
+
+    def cached_metadata_many(self, rjcodes: Iterable[str]) -> dict[str, WorkMetadata]:
+        """
+        只在缓存中查找（有效期与离线模式的处理与 scrape_metadata_many() 相同），不访问 dlsite.com，未命中的作品不加入待抓取队列
+        """
+        rjcodes = list(dict.fromkeys(rjcode.upper() for rjcode in rjcodes))
+        return {rjcode: metadata for rjcode, metadata in self.__lookup_many(rjcodes).items() if metadata}
+
+    def _lookup_original_metadata(self, worknos: list[str]) -> dict[str, WorkMetadata]:
+        """
+        翻译作品的原作已在当前语言下缓存时，直接使用缓存中的社团、系列信息
+        """
+        return {workno: metadata for workno, metadata in self.__lookup_many(worknos).items() if metadata}
 
-    def __del__(self):
-        db.close()
+    def __queue_misses(self, rjcodes: list[str]):
+        """
+        离线模式下，将缓存未命中的作品加入待抓取队列
+        """
+        now = time.time()
+        rows = [{'rjcode': rjcode, 'locale': self.__locale, 'queued_at': now} for rjcode in rjcodes]
+        with db.atomic():
+            for i in range(0, len(rows), SQLITE_MAX_VARIABLES // 3):
+                PendingFetch.insert_many(rows[i: i + SQLITE_MAX_VARIABLES // 3]).on_conflict_ignore().execute()
+
+    def pending_count(self) -> int:
+        return PendingFetch.select().where(PendingFetch.locale == self.__locale).count()
+
+    def fetch_pending(self) -> tuple[int, int]:
+        """
+        抓取离线模式下加入队列的作品（即使处于离线模式），已缓存或抓取成功的作品移出队列
+        某一批抓取失败时停止，剩余的作品留在队列中
+        :return: (移出队列的作品数, 仍在队列中的作品数)
+        """
+        query = (PendingFetch.select(PendingFetch.rjcode)
+                 .where(PendingFetch.locale == self.__locale)
+                 .order_by(PendingFetch.queued_at))
+        rjcodes = [rjcode for rjcode, in query.tuples()]
+        resolved = []
+        try:
+            for i in range(0, len(rjcodes), self.__batch_size):
+                batch = rjcodes[i: i + self.__batch_size]
+                hits = self.__lookup_many(batch)
+                misses = [rjcode for rjcode in batch if rjcode not in hits]
+                if misses:
+                    for rjcode, metadata in self.__fetch_metadata_many(misses).items():
+                        self.__save_result(rjcode, metadata)
+                resolved.extend(batch)
+        except RequestException:
+            pass
+        finally:
+            self.flush()
+            with db.atomic():
+                for i in range(0, len(resolved), SQLITE_MAX_VARIABLES - 1):
+                    PendingFetch.delete().where(
+                        (PendingFetch.locale == self.__locale)
+                        & PendingFetch.rjcode.in_(resolved[i: i + SQLITE_MAX_VARIABLES - 1])).execute()
+        return len(resolved), len(rjcodes) - len(resolved)
 
     def scrape_metadata(self, rjcode: str):
-        # 在数据库中查找
-        metadata_cache = WorkMetadataCache.get_or_none(WorkMetadataCache.rjcode == rjcode)
-        if metadata_cache:
+        rjcode = rjcode.upper()
+        hits = self.__lookup_many_counted([rjcode])
+        if rjcode in hits:
+            metadata = hits[rjcode]
+            if metadata is None:
+                raise _http_error(Dlsite.compile_product_api_url(rjcode), 404, 'Not Found')
             # 已缓存，返回数据库中缓存的 metadata
-            metadata: WorkMetadata = json.loads(metadata_cache.metadata)
-            return metadata
-        else:
-            # 未缓存，从 scraper 抓取 metadata 并缓存到数据库
-            metadata = super().scrape_metadata(rjcode)
-            WorkMetadataCache.create(rjcode=rjcode, metadata=json.dumps(metadata, indent=2, ensure_ascii=False))
             return metadata
+        if self.__offline:
+            self.__queue_misses([rjcode])
+            raise ConnectionError(f'离线模式：{rjcode} 未缓存，已加入待抓取队列')
+
+        # 未缓存或已过期，从 scraper 抓取 metadata 并缓存到数据库
+        try:
+            if self.__async_scraper is not None:
+                metadata = self.__async_scraper.scrape_metadata(rjcode)
+            else:
+                metadata = super().scrape_metadata(rjcode)
+        except HTTPError as err:
+            if err.response is not None and err.response.status_code == 404:
+                self.__save_result(rjcode, None)
+            raise
+        self.__save_result(rjcode, metadata)
+        return metadata
+
+    def scrape_metadata_many(self, rjcodes: Iterable[str]) -> dict[str, Optional[WorkMetadata]]:
+        rjcodes = list(dict.fromkeys(rjcode.upper() for rjcode in rjcodes))
+        metadata_dict = self.__lookup_many_counted(rjcodes)  # 一次查询所有 rjcode
+        uncached_rjcodes = [rjcode for rjcode in rjcodes if rjcode not in metadata_dict]
+
+        if uncached_rjcodes and self.__offline:
+            # 离线模式下不抓取，返回值中不包含未命中的作品
+            self.__queue_misses(uncached_rjcodes)
+        elif uncached_rjcodes:
+            # 未缓存或已过期的作品批量抓取
+            for rjcode, metadata in self.__fetch_metadata_many(uncached_rjcodes).items():
+                self.__save_result(rjcode, metadata)
+                metadata_dict[rjcode] = metadata
+        return metadata_dict
+
+    def __fetch_metadata_many(self, rjcodes: list[str]) -> dict[str, Optional[WorkMetadata]]:
+        """
+        从 dlsite.com 批量抓取，不经过缓存
+        """
+        if self.__async_scraper is not None:
+            return self.__async_scraper.scrape_metadata_many(rjcodes)
+        return super().scrape_metadata_many(rjcodes)
+
+    def download_cover(self, cover_url: str) -> bytes:
+        if self.__async_scraper is not None:
+            return self.__async_scraper.download_cover(cover_url)
+        return super().download_cover(cover_url)
+
+    def fetch_cover(self, cover_url: str, etag: str = '', last_modified: str = ''):
+        if self.__async_scraper is not None:
+            return self.__async_scraper.fetch_cover(cover_url, etag, last_modified)
+        return super().fetch_cover(cover_url, etag, last_modified)
+
+    def scrape_icon(self, rjcode: str, cover_url: str, icon_dir: str):
+        if self.__async_scraper is not None:
+            return self.__async_scraper.scrape_icon(rjcode, cover_url, icon_dir)
+        return super().scrape_icon(rjcode, cover_url, icon_dir)
+
+    def __schedule_refresh(self, rjcodes: list[str]):
+        with self.__refresh_lock:
+            if self.__closed:
+                return
+            self.__refresh_pending.update(dict.fromkeys(rjcodes))
+            if not self.__refresh_running:
+                self.__refresh_running = True
+                self.__refresh_executor.submit(self.__refresh_worker)
+
+    def __refresh_worker(self):
+        """
+        后台刷新过期的缓存。每次取出一批 rjcode 批量抓取，抓取失败时保留旧的缓存
+        """
+        while True:
+            with self.__refresh_lock:
+                if self.__closed or not self.__refresh_pending:
+                    self.__refresh_running = False
+                    return
+                batch = list(self.__refresh_pending)[:self.__batch_size]
+                for rjcode in batch:
+                    del self.__refresh_pending[rjcode]
+            try:
+                for rjcode, metadata in self.__fetch_metadata_many(batch).items():
+                    self.__save_result(rjcode, metadata)
+            except RequestException:
+                pass
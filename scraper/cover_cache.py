@@ -0,0 +1,175 @@
+import hashlib
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from peewee import *
+
+from scraper.db import db, SQLITE_MAX_VARIABLES
+
+
+class CoverCacheEntry(Model):
+    rjcode = CharField()
+    url = TextField()
+    content_hash = CharField(index=True)  # 封面图内容的 sha256，相同的封面图只保存一份
+    etag = TextField(default='')
+    last_modified = TextField(default='')
+    fetched_at = FloatField(default=0)  # 上次从服务器获取或验证的时间
+    last_used = FloatField(default=0)  # 上次使用的时间，用于 LRU 淘汰
+
+    class Meta:
+        database = db
+        primary_key = CompositeKey('rjcode', 'url')
+
+
+class CachedCover(NamedTuple):
+    content_hash: str
+    etag: str
+    last_modified: str
+    stale: bool  # 超过验证周期，使用前应向服务器发送条件请求
+
+
+class CoverCache(object):
+    """
+    按内容寻址的封面图缓存，跨运行共享
+    - 索引保存在 cache.db 中，以 (rjcode, url) 为键；文件保存在 cache_dir 中，以内容的 sha256 命名
+    - 同时保存原始的 .jpg 与生成的 .ico，重新生成图标、重新镜像文件夹时都不必再下载
+    - 文件总大小超过 max_bytes 时，按最近使用时间淘汰
+    - 命中时的使用时间先记录在内存中，由 flush()/evict() 在一个事务中写入，命中不必写数据库
+    """
+
+    def __init__(self, cache_dir: str = 'covers', max_bytes: int = 512 * 2 ** 20, revalidate_after: float = 30 * 86400):
+        """
+        :param max_bytes: 缓存文件的总大小上限
+        :param revalidate_after: 验证周期（秒）。超过此时间的缓存使用 ETag/Last-Modified 向服务器发送条件请求。为 0 时不验证
+        """
+        self.__cache_dir = cache_dir
+        self.__max_bytes = max_bytes
+        self.__revalidate_after = revalidate_after
+        self.__lock = threading.Lock()
+        self.__touch_lock = threading.Lock()
+        self.__touched: dict[tuple[str, str], float] = {}  # {(rjcode, url): 尚未写入数据库的使用时间}
+        db.connect(reuse_if_open=True)
+        db.create_tables([CoverCacheEntry])
+
+    def __path(self, content_hash: str, ext: str):
+        return os.path.join(self.__cache_dir, content_hash[:2], content_hash + ext)
+
+    @staticmethod
+    def __write_file(path: str, data: bytes):
+        """
+        先写入临时文件再替换，其它线程不会读到不完整的文件
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, rjcode: str, url: str) -> Optional[CachedCover]:
+        entry = CoverCacheEntry.get_or_none((CoverCacheEntry.rjcode == rjcode) & (CoverCacheEntry.url == url))
+        if entry is None or not os.path.exists(self.__path(entry.content_hash, '.jpg')):
+            return None
+        with self.__touch_lock:
+            self.__touched[(rjcode, url)] = time.time()
+        stale = self.__revalidate_after > 0 and time.time() - entry.fetched_at > self.__revalidate_after
+        return CachedCover(entry.content_hash, entry.etag, entry.last_modified, stale)
+
+    def read_image(self, content_hash: str) -> bytes:
+        with open(self.__path(content_hash, '.jpg'), 'rb') as f:
+            return f.read()
+
+    def read_icon(self, content_hash: str) -> Optional[bytes]:
+        try:
+            with open(self.__path(content_hash, '.ico'), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_image(self, rjcode: str, url: str, data: bytes, etag: str = '', last_modified: str = '') -> str:
+        """
+        :return: 封面图内容的 sha256
+        """
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self.__path(content_hash, '.jpg')
+        if not os.path.exists(path):
+            CoverCache.__write_file(path, data)
+        now = time.time()
+        with self.__touch_lock:
+            self.__touched.pop((rjcode, url), None)  # 使用时间随条目一起写入
+        CoverCacheEntry.insert(rjcode=rjcode, url=url, content_hash=content_hash, etag=etag or '',
+                               last_modified=last_modified or '', fetched_at=now, last_used=now) \
+            .on_conflict_replace().execute()
+        return content_hash
+
+    def put_icon(self, content_hash: str, icon_data: bytes):
+        CoverCache.__write_file(self.__path(content_hash, '.ico'), icon_data)
+
+    def mark_revalidated(self, rjcode: str, url: str):
+        """
+        服务器返回 304 Not Modified 后，重新开始计算验证周期
+        """
+        CoverCacheEntry.update(fetched_at=time.time()) \
+            .where((CoverCacheEntry.rjcode == rjcode) & (CoverCacheEntry.url == url)).execute()
+
+    def flush(self):
+        """
+        将内存中记录的使用时间在一个事务中写入数据库
+        """
+        with self.__touch_lock:
+            touched, self.__touched = self.__touched, {}
+        if not touched:
+            return
+        with db.atomic():
+            for (rjcode, url), last_used in touched.items():
+                CoverCacheEntry.update(last_used=last_used) \
+                    .where((CoverCacheEntry.rjcode == rjcode) & (CoverCacheEntry.url == url)).execute()
+
+    def evict(self):
+        """
+        写入使用时间，然后在文件总大小超过上限时，从最久未使用的封面图开始删除
+        """
+        self.flush()
+        with self.__lock:
+            sizes: dict[str, int] = {}  # {content_hash: .jpg 与 .ico 的总大小}
+            total = 0
+            if not os.path.isdir(self.__cache_dir):
+                return
+            for dirpath, _, filenames in os.walk(self.__cache_dir):
+                for filename in filenames:
+                    if filename.endswith('.tmp'):
+                        os.unlink(os.path.join(dirpath, filename))  # 被中断的写入
+                        continue
+                    size = os.path.getsize(os.path.join(dirpath, filename))
+                    content_hash = filename.split('.', 1)[0]
+                    sizes[content_hash] = sizes.get(content_hash, 0) + size
+                    total += size
+            if total <= self.__max_bytes:
+                return
+
+            last_used = fn.MAX(CoverCacheEntry.last_used)
+            query = (CoverCacheEntry
+                     .select(CoverCacheEntry.content_hash, last_used.alias('last_used'))
+                     .group_by(CoverCacheEntry.content_hash)
+                     .order_by(last_used)
+                     .tuples())
+            # 没有索引的文件最先删除
+            indexed = [content_hash for content_hash, _ in query]
+            indexed_set = set(indexed)
+            victims = [content_hash for content_hash in sizes if content_hash not in indexed_set] + indexed
+            removed = []
+            for content_hash in victims:
+                if total <= self.__max_bytes:
+                    break
+                for ext in ('.jpg', '.ico'):
+                    try:
+                        os.unlink(self.__path(content_hash, ext))
+                    except FileNotFoundError:
+                        pass
+                total -= sizes.get(content_hash, 0)
+                removed.append(content_hash)
+            with db.atomic():
+                for i in range(0, len(removed), SQLITE_MAX_VARIABLES):
+                    CoverCacheEntry.delete() \
+                        .where(CoverCacheEntry.content_hash.in_(removed[i: i + SQLITE_MAX_VARIABLES])).execute()
@@ -1,11 +1,73 @@
+import time
+
 from peewee import *
 
-db = SqliteDatabase('cache.db')
+from scraper.work_metadata import METADATA_SCHEMA_VERSION
+
+# WAL 模式下读写互不阻塞；synchronous=normal 时提交事务不再每次 fsync
+db = SqliteDatabase('cache.db', pragmas={'journal_mode': 'wal', 'synchronous': 'normal'})
+
+SQLITE_MAX_VARIABLES = 500  # 单条 SQL 中参数的数量上限（保守取值，兼容旧版 SQLite）
+
+# 缓存条目的状态
+STATUS_OK = 'ok'  # 抓取成功
+STATUS_NOT_FOUND = 'not_found'  # dlsite.com 上不存在该作品（负缓存）
 
 
 class WorkMetadataCache(Model):
-    rjcode = CharField(primary_key=True)
-    metadata = TextField()
+    rjcode = CharField()
+    locale = CharField()  # 元数据的语言，同一作品的不同语言分别缓存
+    schema_version = IntegerField(default=METADATA_SCHEMA_VERSION)
+    metadata = TextField(default='')
+    status = CharField(default=STATUS_OK)
+    fetched_at = FloatField(default=0)  # 抓取时间（unix 时间戳）
 
     class Meta:
         database = db  # This model uses the "work_metadata_cache.db" database.
+        primary_key = CompositeKey('rjcode', 'locale')
+
+
+class PendingFetch(Model):
+    """
+    离线模式下缓存未命中的作品，等待联网后抓取
+    """
+    rjcode = CharField()
+    locale = CharField()
+    queued_at = FloatField(default=0)
+
+    class Meta:
+        database = db
+        primary_key = CompositeKey('rjcode', 'locale')
+
+
+def _migrate_legacy_table(table_name: str, legacy_locale: str):
+    """
+    旧版本的缓存表以 rjcode 为主键，且不区分语言。SQLite 无法修改主键，因此重建表后复制数据
+    旧版本要求修改语言后删除缓存，所以旧的缓存视为 legacy_locale 语言
+    """
+    legacy_table_name = f'{table_name}_legacy'
+    columns = {column.name for column in db.get_columns(table_name)}
+    status = 'status' if 'status' in columns else f"'{STATUS_OK}'"
+    fetched_at = 'fetched_at' if 'fetched_at' in columns else str(time.time())
+    with db.atomic():
+        db.execute_sql(f'ALTER TABLE "{table_name}" RENAME TO "{legacy_table_name}"')
+        db.create_tables([WorkMetadataCache])
+        db.execute_sql(
+            f'INSERT INTO "{table_name}" (rjcode, locale, schema_version, metadata, status, fetched_at) '
+            f'SELECT rjcode, ?, ?, metadata, {status}, {fetched_at} FROM "{legacy_table_name}"',
+            (legacy_locale, METADATA_SCHEMA_VERSION))
+        db.execute_sql(f'DROP TABLE "{legacy_table_name}"')
+
+
+def init_db(legacy_locale: str):
+    """
+    连接数据库并创建表。旧版本的数据库会自动迁移
+    :param legacy_locale: 旧版本（不区分语言）的缓存所属的语言
+    """
+    db.connect(reuse_if_open=True)
+    table_name = WorkMetadataCache._meta.table_name
+    if table_name in db.get_tables():
+        columns = {column.name for column in db.get_columns(table_name)}
+        if 'locale' not in columns:
+            _migrate_legacy_table(table_name, legacy_locale)
+    db.create_tables([WorkMetadataCache, PendingFetch])
@@ -1,6 +1,6 @@
 import re
-from typing import Final
-from urllib.parse import unquote
+from typing import Final, Sequence
+from urllib.parse import unquote, urljoin
 
 from scraper.locale import Locale
 from scraper.langs import EN_US, JA_JP, KO_KR, ZH_CN, ZH_TW
@@ -19,30 +19,85 @@ def _load_translations():
     return translations
 
 
+# 判断字符串中是否有 RJ/BJ/VJ 前缀（不区分大小写），没有前缀的字符串不可能含有 workno
+# 只查找 J/j 并检查前一个字符，不复制字符串，也不做正则匹配
+def _has_workno_prefix(string: str):
+    for j in 'Jj':
+        i = string.find(j, 1)
+        while i != -1:
+            if string[i - 1] in 'RBVrbv':
+                return True
+            i = string.find(j, i + 1)
+    return False
+
+
 class Dlsite(object):
     TRANSLATIONS: Final = _load_translations()
     WORKNO_PATTERN: Final = re.compile(r'[RBV]J(\d{6}|\d{8})(?!\d+)')
+    # 不区分大小写的 WORKNO_PATTERN（不捕获分组，findall 直接返回 workno），用于在文件夹名称中查找 workno，不必先复制一份大写的字符串
+    WORKNO_SEARCH_PATTERN: Final = re.compile(r'[RBV]J(?:\d{6}|\d{8})(?!\d+)', re.IGNORECASE)
     RJCODE_PATTERN: Final = re.compile(r'RJ(\d{6}|\d{8})(?!\d+)')
     RGCODE_PATTERN: Final = re.compile(r'RG(\d{5})(?!\d+)')
     SRICODE_PATTERN: Final = re.compile(r'SRI(\d{10})(?!\d+)')
+    BASE_URL = 'https://www.dlsite.com'  # 可替换为本地的模拟服务器，见 benchmarks/fake_dlsite.py
+
+    @staticmethod
+    def set_base_url(base_url: str):
+        Dlsite.BASE_URL = base_url.rstrip('/')
 
     # 提取字符串中的 workno
+    # 没有 RJ/BJ/VJ 前缀的字符串（音轨、CD 等子文件夹的名称大多如此）先快速排除，不做正则匹配
+    # 大部分名称连 J/j 都不含，先用 in 排除，省去函数调用
     @staticmethod
     def parse_workno(string: str):
-        match = Dlsite.WORKNO_PATTERN.search(string.upper())
+        if ('J' not in string and 'j' not in string) or not _has_workno_prefix(string):
+            return None
+        match = Dlsite.WORKNO_SEARCH_PATTERN.search(string)
         if match:
-            return match.group()
+            return match.group().upper()
         else:
             return None
 
+    # 提取字符串中的所有 workno（去重，按出现的顺序）
+    @staticmethod
+    def find_worknos(string: str) -> tuple[str, ...]:
+        if ('J' not in string and 'j' not in string) or not _has_workno_prefix(string):
+            return ()
+        return tuple(dict.fromkeys(workno.upper() for workno in Dlsite.WORKNO_SEARCH_PATTERN.findall(string)))
+
+    # 批量提取多个字符串中的 workno，结果与 names 一一对应
+    # find_all 为 False 时每个名称对应 parse_workno 的结果，为 True 时对应 find_worknos 的结果
+    # find_all 的结果用元组，不含 workno 的名称共用同一个空元组，不必为每个名称创建列表
+    @staticmethod
+    def parse_worknos(names: Sequence[str], find_all: bool = False) -> list:
+        if find_all:
+            findall = Dlsite.WORKNO_SEARCH_PATTERN.findall
+            return [tuple(dict.fromkeys(workno.upper() for workno in findall(name)))
+                    if ('J' in name or 'j' in name) and _has_workno_prefix(name) else ()
+                    for name in names]
+        search = Dlsite.WORKNO_SEARCH_PATTERN.search  # 绑定到局部变量，省去循环中的属性查找
+        return [(match.group().upper() if (match := search(name)) else None)
+                if ('J' in name or 'j' in name) and _has_workno_prefix(name) else None
+                for name in names]
+
     # 根据 rjcode 拼接出同人作品页面的 url
     @staticmethod
     def compile_work_page_url(rjcode: str):
-        return f'https://www.dlsite.com/maniax/work/=/product_id/{rjcode}.html'
+        return f'{Dlsite.BASE_URL}/maniax/work/=/product_id/{rjcode}.html'
 
     @staticmethod
     def compile_product_api_url(rjcode: str):
-        return f'https://www.dlsite.com/maniax/api/=/product.json?workno={rjcode}'
+        return f'{Dlsite.BASE_URL}/maniax/api/=/product.json?workno={rjcode}'
+
+    # product api 返回的图片地址不带协议（//img.dlsite.jp/...），协议与 BASE_URL 相同
+    @staticmethod
+    def compile_image_url(url: str):
+        return urljoin(Dlsite.BASE_URL + '/', url)
+
+    # 一次请求多个作品的信息，workno 之间以逗号分隔
+    @staticmethod
+    def compile_product_api_batch_url(worknos: list[str]):
+        return Dlsite.compile_product_api_url(','.join(worknos))
 
     # 解析 scraper 链接中携带的参数 (dlsite.com 服务端使用 mod_rewrite 优化 SEO)
     @staticmethod
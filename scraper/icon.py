@@ -0,0 +1,25 @@
+import io
+
+from PIL import Image as img
+
+# .ico 文件中包含的标准图标尺寸
+ICON_SIZES = [(16, 16), (24, 24), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)]
+
+
+def make_icon(image_data: bytes) -> bytes:
+    """
+    在内存中将封面图填充为正方形，并生成包含多种尺寸的 .ico 文件
+    封面图先一次性缩小到最大的图标尺寸，较小的尺寸由此生成，不再处理原图
+    该函数只依赖参数，可以交给进程池执行
+    """
+    image = img.open(io.BytesIO(image_data))
+    image.draft('RGB', ICON_SIZES[-1])  # JPEG 解码时直接按比例缩小，减少解码的像素数
+    image = image.convert('RGBA')
+    image.thumbnail(ICON_SIZES[-1], img.LANCZOS, reducing_gap=3.0)
+    x, y = image.size
+    size = max(x, y)
+    new_im = img.new('RGBA', (size, size), (255, 255, 255, 0))
+    new_im.paste(image, ((size - x) // 2, (size - y) // 2))
+    buf = io.BytesIO()
+    new_im.save(buf, format='ICO', sizes=[s for s in ICON_SIZES if s[0] <= size] or [(size, size)])
+    return buf.getvalue()
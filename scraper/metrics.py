@@ -0,0 +1,179 @@
+import contextlib
+import cProfile
+import threading
+import time
+import tracemalloc
+from typing import Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar('T')
+
+# 计时的阶段
+STAGE_SCAN = 'scan'  # 扫描文件夹
+STAGE_CACHE_LOOKUP = 'cache_lookup'  # 查询元数据缓存
+STAGE_HTTP = 'http'  # 请求 dlsite.com（不含限速等待）
+STAGE_RATE_LIMIT_WAIT = 'rate_limit_wait'  # 限速器的等待
+STAGE_NAME_COMPILE = 'name_compile'  # 编写新的文件名
+STAGE_FILESYSTEM = 'filesystem'  # 重命名、移动、链接等文件系统操作
+STAGE_COVER_DOWNLOAD = 'cover_download'  # 下载封面图
+STAGE_ICON_GENERATE = 'icon_generate'  # 生成 .ico
+
+# 计数器
+COUNTER_CACHE_HIT = 'cache_hit'
+COUNTER_CACHE_MISS = 'cache_miss'
+COUNTER_HTTP_REQUESTS = 'http_requests'
+COUNTER_HTTP_RETRIES = 'http_retries'  # 网络错误的重试（urllib3）
+COUNTER_HTTP_THROTTLED = 'http_throttled'  # 429/503 响应
+COUNTER_BYTES_DOWNLOADED = 'bytes_downloaded'
+COUNTER_WORKS = 'works'  # 发现的 RJ 文件夹
+COUNTER_RENAMED = 'renamed'
+COUNTER_FAILED = 'failed'
+COUNTER_RETRIED = 'retried'  # 暂时性的爬取失败后安排的重试
+
+PROFILE_NONE = 'none'
+PROFILE_CPROFILE = 'cprofile'
+PROFILE_TRACEMALLOC = 'tracemalloc'
+
+
+class Metrics(object):
+    """
+    线程安全的计时器与计数器，由各个阶段共同写入，运行结束时汇总
+    每次记录只是在锁内累加几个数字，可以放在热路径上
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__timers: dict[str, list[float]] = {}  # {阶段: [次数, 总耗时, 最长耗时]}
+        self.__counters: dict[str, int] = {}
+
+    def reset(self):
+        with self.__lock:
+            self.__timers.clear()
+            self.__counters.clear()
+
+    def add_time(self, stage: str, seconds: float):
+        with self.__lock:
+            timer = self.__timers.get(stage, None)
+            if timer is None:
+                self.__timers[stage] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    @contextlib.contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def timed_iter(self, stage: str, iterable: Iterable[T]) -> Iterator[T]:
+        """
+        统计生成器每次产出一个元素的耗时，不包括调用方处理元素的时间
+        """
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add_time(stage, time.perf_counter() - start)
+                return
+            self.add_time(stage, time.perf_counter() - start)
+            yield item
+
+    def incr(self, counter: str, n: int = 1):
+        with self.__lock:
+            self.__counters[counter] = self.__counters.get(counter, 0) + n
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            return {
+                'timers': {stage: {'count': int(count), 'total': total, 'mean': total / count if count else 0.0,
+                                   'max': longest}
+                           for stage, (count, total, longest) in self.__timers.items()},
+                'counters': dict(self.__counters),
+            }
+
+
+# 全局的统计，与 logging.getLogger() 类似，各个组件直接写入，不必逐层传递
+metrics = Metrics()
+
+
+@contextlib.contextmanager
+def profile_session(mode: str = PROFILE_NONE, profile_file: str = 'renamer.prof', top: int = 20):
+    """
+    可选的深入分析
+    - cprofile：用 cProfile 分析调用线程（工作线程中的耗时表现为等待），结果保存到 profile_file，可用 pstats/snakeviz 查看
+    - tracemalloc：记录内存分配，结束时将峰值内存与分配最多的 top 个位置写入 yield 出的 dict
+    :return: yield 一个 dict，结束后包含分析结果的摘要
+    """
+    result: dict = {'mode': mode}
+    if mode == PROFILE_CPROFILE:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+            result['profile_file'] = profile_file
+    elif mode == PROFILE_TRACEMALLOC:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            yield result
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            statistics = tracemalloc.take_snapshot().statistics('lineno')[:top]
+            if started:
+                tracemalloc.stop()
+            result['peak_bytes'] = peak
+            result['top_allocations'] = [{'location': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+                                         for stat in statistics]
+    else:
+        yield result
+
+
+def format_summary(report: dict) -> str:
+    """
+    将运行报告格式化为多行的摘要，用于日志
+    """
+    counters = report['counters']
+    elapsed = report['elapsed']
+    lines = [f'耗时 {elapsed:.2f} 秒，发现 {counters.get(COUNTER_WORKS, 0)} 个作品，'
+             f'重命名 {counters.get(COUNTER_RENAMED, 0)} 个（{report["renames_per_second"]:.2f} 个/秒），'
+             f'失败 {counters.get(COUNTER_FAILED, 0)} 个，重试 {counters.get(COUNTER_RETRIED, 0)} 次']
+    hits = counters.get(COUNTER_CACHE_HIT, 0)
+    misses = counters.get(COUNTER_CACHE_MISS, 0)
+    if hits or misses:
+        lines.append(f'缓存命中 {hits}，未命中 {misses}（命中率 {hits / (hits + misses):.1%}）')
+    if counters.get(COUNTER_HTTP_REQUESTS, 0):
+        lines.append(f'HTTP 请求 {counters[COUNTER_HTTP_REQUESTS]} 次，重试 {counters.get(COUNTER_HTTP_RETRIES, 0)} 次，'
+                     f'限流 {counters.get(COUNTER_HTTP_THROTTLED, 0)} 次，'
+                     f'下载 {counters.get(COUNTER_BYTES_DOWNLOADED, 0) / 2 ** 20:.1f} MiB')
+    # 各阶段的耗时在多个线程中累加，总和可能超过运行时间
+    for stage, timer in sorted(report['timers'].items(), key=lambda item: -item[1]['total']):
+        lines.append(f'  {stage:<16}{timer["total"]:>10.2f} 秒{timer["count"]:>8} 次'
+                     f'  平均 {timer["mean"] * 1000:.1f} 毫秒  最长 {timer["max"] * 1000:.1f} 毫秒')
+    return '\n'.join(lines)
+
+
+def build_report(kind: str, elapsed: float, profile: Optional[dict] = None) -> dict:
+    """
+    以当前的统计生成机器可读的运行报告
+    """
+    report = metrics.snapshot()
+    renamed = report['counters'].get(COUNTER_RENAMED, 0)
+    report.update({
+        'kind': kind,
+        'finished_at': time.time(),
+        'elapsed': elapsed,
+        'renames_per_second': renamed / elapsed if elapsed > 0 else 0.0,
+    })
+    if profile and profile['mode'] != PROFILE_NONE:
+        report['profile'] = profile
+    return report
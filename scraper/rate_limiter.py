@@ -0,0 +1,107 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from scraper.metrics import metrics, STAGE_RATE_LIMIT_WAIT
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 响应头，返回需要等待的秒数
+    Retry-After 可以是秒数，也可以是 HTTP 日期
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter(object):
+    """
+    线程安全的令牌桶限速器，可在多个爬取线程之间共享
+    遇到 429/503 时降低速率并暂停发放令牌，之后随着请求成功逐步恢复到设定的速率
+    """
+
+    MIN_RATE_FACTOR = 1 / 16  # 自适应降速的下限（相对于设定速率）
+    MAX_BACKOFF = 300  # 未提供 Retry-After 时，单次退避的最长时间（秒）
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: 每秒允许的请求数。<= 0 时不限速
+        :param burst: 令牌桶容量，即允许连续突发的请求数
+        """
+        self.__max_rate = rate
+        self.__rate = rate
+        self.__burst = max(1, burst)
+        self.__tokens = float(self.__burst)
+        self.__updated_at = time.monotonic()
+        self.__blocked_until = 0.0  # 退避期间不发放令牌
+        self.__backoff = 0.0
+        self.__lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.__rate
+
+    def __refill(self, now: float):
+        self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated_at) * self.__rate)
+        self.__updated_at = now
+
+    def reserve(self) -> float:
+        """
+        预约一个令牌（不阻塞）
+        :return: 令牌可用前需要等待的秒数
+        """
+        with self.__lock:
+            now = time.monotonic()
+            blocked = max(0.0, self.__blocked_until - now)
+            if self.__max_rate <= 0:
+                return blocked
+            self.__refill(now)
+            self.__tokens -= 1  # 令牌可以透支，透支的部分即为排队等待的时间
+            wait = -self.__tokens / self.__rate if self.__tokens < 0 else 0.0
+            return max(wait, blocked)
+
+    def acquire(self):
+        """
+        阻塞直到获得一个令牌
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+            metrics.add_time(STAGE_RATE_LIMIT_WAIT, wait)
+
+    def penalize(self, retry_after: Optional[float] = None):
+        """
+        服务端要求降速（HTTP 429/503）。速率减半，并在 Retry-After 或指数退避时间内暂停发放令牌
+        """
+        with self.__lock:
+            now = time.monotonic()
+            if self.__max_rate > 0:
+                self.__refill(now)
+                self.__rate = max(self.__max_rate * RateLimiter.MIN_RATE_FACTOR, self.__rate / 2)
+            if retry_after is None:
+                base = 1 / self.__rate if self.__max_rate > 0 else 1.0
+                self.__backoff = min(RateLimiter.MAX_BACKOFF, self.__backoff * 2 if self.__backoff else base)
+                retry_after = self.__backoff
+            self.__blocked_until = max(self.__blocked_until, now + retry_after)
+
+    def reward(self):
+        """
+        请求成功。重置退避时间，并逐步恢复速率
+        """
+        with self.__lock:
+            self.__backoff = 0.0
+            if self.__rate < self.__max_rate:
+                self.__refill(time.monotonic())
+                self.__rate = min(self.__max_rate, self.__rate + self.__max_rate * RateLimiter.MIN_RATE_FACTOR)
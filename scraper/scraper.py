@@ -1,19 +1,22 @@
 import os
 import contextlib
-import time
 from pathlib import Path
 from urllib.request import getproxies
-from typing import Union
+from typing import Iterable, Optional, Union
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pyquery import PyQuery as pq
 
 from scraper.dlsite import Dlsite
+from scraper.icon import make_icon
 from scraper.locale import Locale
+from scraper.metrics import (metrics, STAGE_HTTP, COUNTER_HTTP_REQUESTS, COUNTER_HTTP_RETRIES,
+                             COUNTER_HTTP_THROTTLED, COUNTER_BYTES_DOWNLOADED)
+from scraper.rate_limiter import RateLimiter, parse_retry_after
 from scraper.work_metadata import WorkMetadata
 
-from PIL import Image as img
-
 
 def _getproxies():
     """
@@ -28,45 +31,190 @@ def _getproxies():
     return proxies
 
 
+def _http_error(url: str, status: int, reason: Optional[str]):
+    """
+    构造 HTTPError，与 Response.raise_for_status() 抛出的异常一致
+    """
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response.url = url
+    return requests.HTTPError(f'{status} {reason} for url: {url}', response=response)
+
+
+def _parse_original_workno(product_info: dict):
+    translation_info = product_info.get('translation_info', None)
+    original_workno = translation_info.get('original_workno', None) if translation_info else None
+    return original_workno.upper() if original_workno else None
+
+
+def _parse_metadata(product_info: dict, original_product_info: Optional[dict]):
+    """
+    将 product api 返回的作品信息转换为元数据。翻译作品的社团、系列信息取自原作
+    original_product_info 可以是原作的 product info，也可以是原作的元数据（两者的社团、系列字段名相同）
+    """
+    metadata: WorkMetadata = {
+        'rjcode': product_info['workno'],
+        'work_name': product_info['work_name'],
+        'maker_id': original_product_info['maker_id'] if original_product_info else product_info['maker_id'],
+        'maker_name': original_product_info['maker_name'] if original_product_info else product_info['maker_name'],
+        'release_date': product_info['regist_date'][0:10],
+        'series_name': original_product_info['series_name'] if original_product_info else product_info['series_name'],
+        'series_id': original_product_info['series_id'] if original_product_info else product_info['series_id'],
+        'age_category': '',
+        'tags': [],
+        'cvs': [],
+        'cover_url': Dlsite.compile_image_url(product_info['image_main']['url'])
+    }
+
+    # tags
+    for genre in product_info['genres']:
+        metadata['tags'].append(genre['name'])
+    # cvs
+    if isinstance(product_info['creaters'], dict) and 'voice_by' in product_info['creaters']:
+        for cv in product_info['creaters']['voice_by']:
+            metadata['cvs'].append(cv['name'])
+
+    # age_category
+    if product_info['age_category'] == 1:
+        metadata['age_category'] = 'GEN'
+    elif product_info['age_category'] == 2:
+        metadata['age_category'] = 'R15'
+    else:  # product_info['age_category'] == 3
+        metadata['age_category'] = 'R18'
+
+    return metadata
+
+
 class Scraper(object):
-    def __init__(self, locale: Locale, proxies=None, connect_timeout: int = 10, read_timeout: int = 10, sleep_interval=3):
+    THROTTLE_STATUS_CODES = (429, 503)  # 服务端要求降速的状态码
+    MAX_THROTTLE_RETRIES = 3  # 被服务端限速时的最大重试次数
+
+    def __init__(self, locale: Locale, proxies=None, connect_timeout: int = 10, read_timeout: int = 10, sleep_interval=3,
+                 batch_size: int = 20, burst: int = 1, rate_limiter: Optional[RateLimiter] = None,
+                 pool_size: int = 10, max_retries: int = 3, keep_alive: bool = True,
+                 cover_rate_limiter: Optional[RateLimiter] = None):
+        """
+        :param sleep_interval: 平均请求间隔（秒），用于创建默认的限速器
+        :param burst: 允许连续突发的请求数，用于创建默认的限速器
+        :param rate_limiter: 共享的限速器。为 None 时按 sleep_interval 和 burst 创建
+        :param pool_size: 每个主机的连接池大小，应不小于并发爬取的线程数
+        :param max_retries: 连接错误、读取错误等暂时性网络错误的重试次数
+        :param keep_alive: 是否复用 TCP/TLS 连接
+        :param cover_rate_limiter: 下载封面图（图片 CDN）的限速器，不占用 api 的令牌。为 None 时不限速，只在 429/503 时退避
+        """
         self.__locale = locale
+        self.__batch_size = max(1, batch_size)  # 批量请求 product api 时，每次请求的作品数上限
         self.__connect_timeout = connect_timeout
         self.__read_timeout = read_timeout
-        self.__sleep_interval = sleep_interval
+        if not rate_limiter:
+            rate_limiter = RateLimiter(1 / sleep_interval if sleep_interval > 0 else 0, burst)
+        self.__rate_limiter = rate_limiter
+        self.__cover_rate_limiter = cover_rate_limiter or RateLimiter(0)
         if not proxies:
             # 获取系统代理
             proxies = _getproxies()
         self.__proxies = proxies
+        self.__session = Scraper.__create_session(pool_size, max_retries, keep_alive)
+
+    @staticmethod
+    def __create_session(pool_size: int, max_retries: int, keep_alive: bool):
+        """
+        创建带连接池的 Session。urllib3 的连接池是线程安全的，pool_block=True 时连接数不会超过 pool_size
+        """
+        retry = Retry(total=max_retries,
+                      connect=max_retries,
+                      read=max_retries,
+                      status=0,  # 429/503 交给限速器处理
+                      backoff_factor=0.5,
+                      allowed_methods=frozenset(['GET']),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    @property
+    def locale(self):
+        return self.__locale
+
+    def close(self):
+        """
+        关闭连接池
+        """
+        self.__session.close()
+
+    @staticmethod
+    def __record_response(response: requests.Response):
+        """
+        统计请求数、下载的字节数，以及 urllib3 因网络错误重试的次数
+        """
+        metrics.incr(COUNTER_HTTP_REQUESTS)
+        metrics.incr(COUNTER_BYTES_DOWNLOADED, len(response.content))
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            metrics.incr(COUNTER_HTTP_RETRIES, len(retries.history))
+        if response.status_code in Scraper.THROTTLE_STATUS_CODES:
+            metrics.incr(COUNTER_HTTP_THROTTLED)
+
+    def __get(self, url: str, params=None, headers=None, rate_limiter: Optional[RateLimiter] = None):
+        """
+        经过限速器发送 GET 请求。遇到 429/503 时通知限速器退避，并按 Retry-After 等待后重试
+        :param rate_limiter: 使用的限速器，为 None 时使用 api 的限速器
+        """
+        rate_limiter = rate_limiter or self.__rate_limiter
+        for _ in range(Scraper.MAX_THROTTLE_RETRIES + 1):
+            rate_limiter.acquire()
+            with metrics.timer(STAGE_HTTP):
+                response = self.__session.get(url,
+                                              params=params,
+                                              headers=headers,
+                                              timeout=(self.__connect_timeout, self.__read_timeout),
+                                              proxies=self.__proxies)
+            Scraper.__record_response(response)
+            if response.status_code not in Scraper.THROTTLE_STATUS_CODES:
+                rate_limiter.reward()
+                return response
+            rate_limiter.penalize(parse_retry_after(response.headers.get('Retry-After', None)))
+        return response  # 重试次数用尽，由调用方抛出 HTTPError
 
     def __request_work_page(self, rjcode: str):
         url = Dlsite.compile_work_page_url(rjcode)
         params = {'locale': self.__locale.name}
-        response = requests.get(url,
-                                params,
-                                timeout=(self.__connect_timeout, self.__read_timeout),
-                                proxies=self.__proxies)
+        response = self.__get(url, params)
         response.raise_for_status()  # 如果返回了不成功的状态码，Response.raise_for_status() 会抛出一个 HTTPError 异常
         html = response.text
-        time.sleep(self.__sleep_interval)
         return html
 
     def __request_product_api(self, rjcode: str):
         url = Dlsite.compile_product_api_url(rjcode)
         params = {'locale': self.__locale.name}
-        response = requests.get(url,
-                                params,
-                                timeout=(self.__connect_timeout, self.__read_timeout),
-                                proxies=self.__proxies)
+        response = self.__get(url, params)
+        response.raise_for_status()  # 如果返回了不成功的状态码，Response.raise_for_status() 会抛出一个 HTTPError 异常
         if len(response.json()) == 0:
             response.status_code = 404
             response.reason = 'Not Found'
-        response.raise_for_status()  # 如果返回了不成功的状态码，Response.raise_for_status() 会抛出一个 HTTPError 异常
+            response.raise_for_status()
 
         product_info = response.json()[0]
-        time.sleep(self.__sleep_interval)
         return product_info
 
+    def __request_product_api_batch(self, worknos: list[str]):
+        """
+        一次请求多个作品的信息
+        :return: workno -> product_info，响应中不存在的作品不会出现在返回值中
+        """
+        url = Dlsite.compile_product_api_batch_url(worknos)
+        params = {'locale': self.__locale.name}
+        response = self.__get(url, params)
+        response.raise_for_status()  # 如果返回了不成功的状态码，Response.raise_for_status() 会抛出一个 HTTPError 异常
+
+        product_info_list = response.json()
+        return {product_info['workno'].upper(): product_info for product_info in product_info_list}
+
     def scrape_metadata(self, rjcode: str):
         rjcode = rjcode.upper()
         if not Dlsite.WORKNO_PATTERN.fullmatch(rjcode):
@@ -74,45 +222,75 @@ class Scraper(object):
         metadata = self.__scrape_metadata_from_product_api(rjcode)
         return metadata
 
+    def scrape_metadata_many(self, rjcodes: Iterable[str]) -> dict[str, Optional[WorkMetadata]]:
+        """
+        批量爬取元数据。每次请求 product api 时携带多个 workno
+        :return: rjcode -> metadata，dlsite.com 上不存在的作品对应 None
+        """
+        rjcodes = list(dict.fromkeys(rjcode.upper() for rjcode in rjcodes))  # 去重并保持顺序
+        for rjcode in rjcodes:
+            if not Dlsite.WORKNO_PATTERN.fullmatch(rjcode):
+                raise ValueError
+
+        metadata_dict: dict[str, Optional[WorkMetadata]] = {}
+        for i in range(0, len(rjcodes), self.__batch_size):
+            batch = rjcodes[i: i + self.__batch_size]
+            product_info_dict = self.__request_product_api_batch(batch)
+
+            # 翻译作品需要原作的信息，缺少的原作信息再批量请求一次
+            original_worknos = []
+            for product_info in product_info_dict.values():
+                original_workno = _parse_original_workno(product_info)
+                if original_workno and original_workno not in product_info_dict and original_workno not in original_worknos:
+                    original_worknos.append(original_workno)
+            original_product_info_dict = self._lookup_original_metadata(original_worknos) if original_worknos else {}
+            original_worknos = [workno for workno in original_worknos if workno not in original_product_info_dict]
+            if original_worknos:
+                original_product_info_dict.update(self.__request_product_api_batch(original_worknos))
+
+            for rjcode in batch:
+                product_info = product_info_dict.get(rjcode, None)
+                if product_info is None:
+                    metadata_dict[rjcode] = None  # 作品不存在
+                    continue
+                original_workno = _parse_original_workno(product_info)
+                original_product_info = None
+                if original_workno:
+                    original_product_info = product_info_dict.get(original_workno, None) \
+                                            or original_product_info_dict.get(original_workno, None)
+                    if original_product_info is None:
+                        # 原作不存在时无法补全社团、系列信息，与 scrape_metadata() 一致，视为作品不存在
+                        metadata_dict[rjcode] = None
+                        continue
+                metadata_dict[rjcode] = _parse_metadata(product_info, original_product_info)
+
+        return metadata_dict
+
     def __scrape_metadata_from_product_api(self, workno: str):
         product_info = self.__request_product_api(workno)
 
-        translation_info = product_info.get('translation_info', None)
-        original_workno = translation_info.get('original_workno', None) if translation_info else None
-        original_product_info = self.__request_product_api(original_workno) if original_workno else None
-
-        metadata: WorkMetadata = {
-            'rjcode': product_info['workno'],
-            'work_name': product_info['work_name'],
-            'maker_id': original_product_info['maker_id'] if original_product_info else product_info['maker_id'],
-            'maker_name': original_product_info['maker_name'] if original_product_info else product_info['maker_name'],
-            'release_date': product_info['regist_date'][0:10],
-            'series_name': original_product_info['series_name'] if original_product_info else product_info['series_name'],
-            'series_id': original_product_info['series_id'] if original_product_info else product_info['series_id'],
-            'age_category': '',
-            'tags': [],
-            'cvs': [],
-            'cover_url': 'https:' + product_info['image_main']['url']
-        }
-
-        # tags
-        for genre in product_info['genres']:
-            metadata['tags'].append(genre['name'])
-        # cvs
-        if isinstance(product_info['creaters'], dict) and 'voice_by' in product_info['creaters']:
-            for cv in product_info['creaters']['voice_by']:
-                metadata['cvs'].append(cv['name'])
-
-        # age_category
-        if product_info['age_category'] == 1:
-            metadata['age_category'] = 'GEN'
-        elif product_info['age_category'] == 2:
-            metadata['age_category'] = 'R15'
-        else:  # product_info['age_category'] == 3
-            metadata['age_category'] = 'R18'
+        original_workno = _parse_original_workno(product_info)
+        original_product_info = None
+        if original_workno:
+            original_product_info = self._lookup_original_metadata([original_workno]).get(original_workno, None) \
+                                    or self.__request_product_api(original_workno)
+
+        return _parse_metadata(product_info, original_product_info)
+
+    def cached_metadata_many(self, rjcodes: Iterable[str]) -> dict[str, WorkMetadata]:
+        """
+        只查找已知的元数据，不访问 dlsite.com
+        :return: rjcode -> metadata，只包含找到的作品。Scraper 没有缓存，总是返回空的 dict
+        """
+        return {}
+
+    def _lookup_original_metadata(self, worknos: list[str]) -> dict[str, WorkMetadata]:
+        """
+        查找已知的原作元数据，用于补全翻译作品的社团、系列信息，找到的原作不再请求 dlsite.com
+        子类可以覆盖此方法（例如从缓存中查找）
+        """
+        return {}
 
-        return metadata
-    
     # 获取封面图片链接
     @staticmethod
     def __parse_icon(html: str):
@@ -127,7 +305,10 @@ class Scraper(object):
         """"
         https://gist.github.com/xflr6/f29ed682f23fd27b6a0b1241f244e6c9
         """
-        with contextlib.closing(requests.get(url, stream=True, proxies=self.__proxies)) as r:
+        with contextlib.closing(self.__session.get(url,
+                                                   stream=True,
+                                                   timeout=(self.__connect_timeout, self.__read_timeout),
+                                                   proxies=self.__proxies)) as r:
             r.raise_for_status()
             with open(filename, 'wb') as f:
                 for chunk in r.iter_content(chunk_size=8_192):
@@ -135,6 +316,29 @@ class Scraper(object):
 
         return filename, r.headers
 
+    def download_cover(self, cover_url: str) -> bytes:
+        """
+        下载封面图到内存
+        """
+        data, _, _ = self.fetch_cover(cover_url)
+        return data
+
+    def fetch_cover(self, cover_url: str, etag: str = '', last_modified: str = ''):
+        """
+        下载封面图到内存。提供 etag/last_modified 时发送条件请求
+        :return: (封面图，服务器返回 304 Not Modified 时为 None, ETag, Last-Modified)
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        r = self.__get(cover_url, headers=headers, rate_limiter=self.__cover_rate_limiter)
+        if r.status_code == 304:
+            return None, etag, last_modified
+        r.raise_for_status()
+        return r.content, r.headers.get('ETag', ''), r.headers.get('Last-Modified', '')
+
     def scrape_icon(self, rjcode: str, cover_url: str, icon_dir: str):
         """
         下载图片并生成.ico文件
@@ -145,14 +349,8 @@ class Scraper(object):
         jpg_path = Path(os.path.join(icon_dir, jpg_name))
 
         if not os.path.exists(icon_path):
-            self.urlretrieve(cover_url, jpg_path)  # 爬取作品图片
-
-            # 用 .jpg 文件生成 .ico 文件
-            image = img.open(jpg_path)
-            x, y = image.size
-            size = max(x, y)
-            new_im = img.new('RGBA', (size, size), (255, 255, 255, 0))
-            new_im.paste(image, ((size - x) // 2, (size - y) // 2))
-            new_im.save(icon_path)
+            data = self.download_cover(cover_url)  # 爬取作品图片
+            jpg_path.write_bytes(data)
+            icon_path.write_bytes(make_icon(data))  # 在内存中生成 .ico 文件
 
         return icon_name, jpg_name  # 返回值用于后续删存操作
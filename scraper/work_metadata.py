@@ -1,5 +1,8 @@
 from typing import TypedDict
 
+# WorkMetadata 的结构版本。修改 WorkMetadata 的字段或取值方式时递增，旧版本的缓存将被视为未缓存
+METADATA_SCHEMA_VERSION = 1
+
 
 # 同人作品元数据
 class WorkMetadata(TypedDict):
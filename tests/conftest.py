@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+from scraper import Dlsite
+from scraper.db import db
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_db(tmp_path, monkeypatch):
+    """
+    cache.db 以相对路径打开，每个测试在自己的临时文件夹中运行，互不影响，也不会写入仓库
+    """
+    db.close()
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    db.close()
+
+
+@pytest.fixture
+def fake_dlsite():
+    """
+    本地的 dlsite.com 模拟服务器，见 benchmarks/fake_dlsite.py
+    """
+    from fake_dlsite import FakeDlsiteServer
+
+    base_url = Dlsite.BASE_URL
+    with FakeDlsiteServer() as server:
+        Dlsite.set_base_url(server.base_url)
+        try:
+            yield server
+        finally:
+            Dlsite.set_base_url(base_url)
+
+
+@pytest.fixture
+def make_renamer(fake_dlsite):
+    """
+    按 DEFAULT_CONFIG（可覆盖部分配置）创建访问模拟服务器的 Renamer，测试结束时关闭
+    与 create_renamer 相同，返回 (renamer, cached_scraper)
+    """
+    from config_file import DEFAULT_CONFIG
+    from factory import create_renamer
+
+    created = []
+
+    def make(**config):
+        renamer, cached_scraper = create_renamer({
+            **DEFAULT_CONFIG,
+            'scraper_sleep_interval': 0,
+            'renamer_make_folder_icon': False,
+            'renamer_cover_cache_max_mb': 0,
+            **config,
+        })
+        created.append((renamer, cached_scraper))
+        return renamer, cached_scraper
+
+    yield make
+    for renamer, cached_scraper in created:
+        renamer.close()
+        cached_scraper.close()
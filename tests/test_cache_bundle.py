@@ -0,0 +1,73 @@
+import gzip
+import json
+import sqlite3
+
+from scraper import Locale
+from scraper.cache_bundle import export_bundle, import_bundle, BUNDLE_FORMAT, BUNDLE_VERSION
+from scraper.db import init_db, WorkMetadataCache, STATUS_NOT_FOUND, STATUS_OK
+from scraper.work_metadata import METADATA_SCHEMA_VERSION
+
+
+def make_row(rjcode, fetched_at, locale=Locale.ja_jp.name, status=STATUS_OK):
+    return {
+        'rjcode': rjcode,
+        'locale': locale,
+        'schema_version': METADATA_SCHEMA_VERSION,
+        'metadata': json.dumps({'rjcode': rjcode, 'fetched_at': fetched_at}) if status == STATUS_OK else '',
+        'status': status,
+        'fetched_at': fetched_at,
+    }
+
+
+def cached_rows():
+    query = WorkMetadataCache.select().order_by(WorkMetadataCache.rjcode, WorkMetadataCache.locale)
+    return [(row['rjcode'], row['locale'], row['fetched_at']) for row in query.dicts()]
+
+
+def test_export_import_round_trip(tmp_path):
+    init_db(legacy_locale=Locale.ja_jp.name)
+    WorkMetadataCache.insert_many([
+        make_row('RJ000001', 100),
+        make_row('RJ000001', 100, locale=Locale.zh_cn.name),
+        make_row('RJ000002', 100),
+        make_row('RJ000009', 100, status=STATUS_NOT_FOUND),
+    ]).execute()
+    bundle_path = str(tmp_path / 'bundle.jsonl.gz')
+    assert export_bundle(bundle_path) == 4
+    assert export_bundle(str(tmp_path / 'ja_jp.jsonl.gz'), locale=Locale.ja_jp.name) == 3
+
+    # 本地的 RJ000001 比包中的更新，RJ000002 比包中的旧，RJ000009 不在本地
+    WorkMetadataCache.update(fetched_at=200).where(WorkMetadataCache.rjcode == 'RJ000001').execute()
+    WorkMetadataCache.update(fetched_at=50).where(WorkMetadataCache.rjcode == 'RJ000002').execute()
+    WorkMetadataCache.delete().where(WorkMetadataCache.rjcode == 'RJ000009').execute()
+    assert import_bundle(bundle_path) == (2, 2)
+    assert cached_rows() == [('RJ000001', Locale.ja_jp.name, 200), ('RJ000001', Locale.zh_cn.name, 200),
+                             ('RJ000002', Locale.ja_jp.name, 100), ('RJ000009', Locale.ja_jp.name, 100)]
+    assert json.loads(WorkMetadataCache.get(WorkMetadataCache.rjcode == 'RJ000002').metadata)['fetched_at'] == 100
+    assert import_bundle(bundle_path) == (0, 4)  # 再次导入不做任何事
+
+
+def test_import_skips_other_schema_versions(tmp_path):
+    bundle_path = str(tmp_path / 'bundle.jsonl.gz')
+    with gzip.open(bundle_path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps({'format': BUNDLE_FORMAT, 'version': BUNDLE_VERSION}) + '\n')
+        f.write(json.dumps(make_row('RJ000001', 100)) + '\n')
+        f.write(json.dumps({**make_row('RJ000002', 100), 'schema_version': METADATA_SCHEMA_VERSION - 1}) + '\n')
+    assert import_bundle(bundle_path) == (1, 1)  # 新安装，还没有 cache.db
+    assert cached_rows() == [('RJ000001', Locale.ja_jp.name, 100)]
+
+
+def test_import_migrates_legacy_cache(tmp_path):
+    connection = sqlite3.connect('cache.db')  # 旧版本的表结构：以 rjcode 为主键，不区分语言
+    connection.execute('CREATE TABLE "workmetadatacache" ("rjcode" VARCHAR(255) NOT NULL PRIMARY KEY, '
+                       '"metadata" TEXT NOT NULL)')
+    connection.execute('INSERT INTO "workmetadatacache" VALUES (?, ?)',
+                       ('RJ000002', json.dumps({'rjcode': 'RJ000002'})))
+    connection.commit()
+    connection.close()
+    bundle_path = str(tmp_path / 'bundle.jsonl.gz')
+    with gzip.open(bundle_path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps({'format': BUNDLE_FORMAT, 'version': BUNDLE_VERSION}) + '\n')
+        f.write(json.dumps(make_row('RJ000001', 100, locale=Locale.zh_cn.name)) + '\n')
+    assert import_bundle(bundle_path, legacy_locale=Locale.zh_cn.name) == (1, 0)
+    assert [row[:2] for row in cached_rows()] == [('RJ000001', Locale.zh_cn.name), ('RJ000002', Locale.zh_cn.name)]
@@ -0,0 +1,243 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from requests.exceptions import ConnectionError, HTTPError
+
+from config_file import DEFAULT_CONFIG
+from scraper import CachedScraper, Locale, BACKEND_AIOHTTP
+from scraper.db import db, init_db, WorkMetadataCache, SQLITE_MAX_VARIABLES, STATUS_NOT_FOUND, STATUS_OK
+from scraper.work_metadata import METADATA_SCHEMA_VERSION
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MISSING = 'RJ000009'  # 模拟服务器中编号以 9 结尾的作品不存在
+EXISTING = 'RJ000001'
+
+
+def make_scraper(**kwargs):
+    return CachedScraper(Locale.ja_jp, sleep_interval=0, **kwargs)
+
+
+def test_defaults_match_config():
+    assert CachedScraper.DEFAULT_TTL == DEFAULT_CONFIG['scraper_cache_ttl_days'] * 86400
+    assert CachedScraper.DEFAULT_NEGATIVE_TTL == DEFAULT_CONFIG['scraper_cache_negative_ttl_days'] * 86400
+
+
+def test_missing_work_is_negatively_cached(fake_dlsite):
+    scraper = make_scraper()
+    try:
+        for _ in range(2):
+            with pytest.raises(HTTPError) as exc_info:
+                scraper.scrape_metadata(MISSING)
+            assert exc_info.value.response.status_code == 404
+        assert scraper.scrape_metadata_many([MISSING]) == {MISSING: None}
+        assert fake_dlsite.counters['product_api'] == 1  # 之后都命中“作品不存在”的缓存
+    finally:
+        scraper.close()
+    row = WorkMetadataCache.get(WorkMetadataCache.rjcode == MISSING)
+    assert row.status == STATUS_NOT_FOUND
+
+
+def test_negative_ttl_zero_disables_negative_cache(fake_dlsite):
+    scraper = make_scraper(negative_ttl=0)
+    try:
+        assert scraper.scrape_metadata_many([MISSING, EXISTING])[MISSING] is None
+        assert scraper.scrape_metadata_many([MISSING, EXISTING])[MISSING] is None
+        assert fake_dlsite.counters['product_api'] == 2  # 只有存在的作品命中缓存
+    finally:
+        scraper.close()
+    assert WorkMetadataCache.select().where(WorkMetadataCache.rjcode == MISSING).count() == 0
+
+
+def test_expired_negative_entry_is_refetched(fake_dlsite):
+    scraper = make_scraper(negative_ttl=60, background_refresh=True)
+    try:
+        scraper.scrape_metadata_many([MISSING])
+        scraper.flush()
+        WorkMetadataCache.update(fetched_at=WorkMetadataCache.fetched_at - 61) \
+            .where(WorkMetadataCache.rjcode == MISSING).execute()
+        # “作品不存在”没有旧的 metadata 可以先返回，即使开启后台刷新也立即重新抓取
+        assert scraper.scrape_metadata_many([MISSING]) == {MISSING: None}
+        assert fake_dlsite.counters['product_api'] == 2
+    finally:
+        scraper.close()
+
+
+def test_expired_entry_is_refreshed_in_background(fake_dlsite):
+    scraper = make_scraper(ttl=60, background_refresh=True)
+    try:
+        metadata = scraper.scrape_metadata(EXISTING)
+        scraper.flush()
+        WorkMetadataCache.update(fetched_at=0).execute()
+        assert scraper.scrape_metadata(EXISTING) == metadata  # 先返回旧的 metadata
+        deadline = time.monotonic() + 5
+        while fake_dlsite.counters['product_api'] < 2:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        scraper.close()
+    assert WorkMetadataCache.get(WorkMetadataCache.rjcode == EXISTING).fetched_at > 0
+
+
+def test_write_buffer(fake_dlsite, monkeypatch):
+    monkeypatch.setattr(CachedScraper, 'WRITE_BUFFER_SIZE', 3)
+    scraper = make_scraper(batch_size=2)
+    try:
+        scraper.scrape_metadata_many(['RJ000001', 'RJ000002'])
+        assert WorkMetadataCache.select().count() == 0  # 还在写缓冲区中
+        assert scraper.scrape_metadata('RJ000002')['rjcode'] == 'RJ000002'  # 但已经可以命中
+        assert fake_dlsite.counters['product_api'] == 1
+        scraper.scrape_metadata('RJ000003')
+        assert WorkMetadataCache.select().count() == 3  # 缓冲区满时写入数据库
+    finally:
+        scraper.close()
+
+
+def test_flush_respects_variable_limit(fake_dlsite, monkeypatch):
+    monkeypatch.setattr(CachedScraper, 'WRITE_BUFFER_SIZE', 1000)
+    rjcodes = [f'RJ{n:06d}' for n in range(1, 201)]
+    scraper = make_scraper()
+    db.connection().setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, SQLITE_MAX_VARIABLES)
+    try:
+        scraper.scrape_metadata_many(rjcodes)
+    finally:
+        scraper.close()
+    assert WorkMetadataCache.select().count() == len(rjcodes)
+
+
+def test_bulk_lookup_above_variable_limit(fake_dlsite):
+    rjcodes = [f'RJ{n:06d}' for n in range(1, SQLITE_MAX_VARIABLES + 200) if n % 10 != 9]
+    init_db(legacy_locale=Locale.ja_jp.name)
+    for i in range(0, len(rjcodes), 100):
+        WorkMetadataCache.insert_many([
+            {'rjcode': rjcode, 'locale': Locale.ja_jp.name, 'metadata': json.dumps({'rjcode': rjcode}),
+             'status': STATUS_OK, 'fetched_at': time.time()}
+            for rjcode in rjcodes[i: i + 100]
+        ]).execute()
+    scraper = make_scraper()
+    try:
+        metadata_dict = scraper.scrape_metadata_many(rjcodes)
+    finally:
+        scraper.close()
+    assert metadata_dict == {rjcode: {'rjcode': rjcode} for rjcode in rjcodes}
+    assert fake_dlsite.counters['product_api'] == 0
+
+
+def test_cache_is_keyed_by_locale(fake_dlsite):
+    for locale in (Locale.ja_jp, Locale.zh_cn, Locale.ja_jp):
+        scraper = CachedScraper(locale, sleep_interval=0)
+        try:
+            scraper.scrape_metadata(EXISTING)
+        finally:
+            scraper.close()
+    assert fake_dlsite.counters['product_api'] == 2  # 切换回原来的语言时命中缓存
+    assert WorkMetadataCache.select().count() == 2
+
+
+def test_translation_reuses_cached_original(fake_dlsite):
+    scraper = make_scraper()
+    try:
+        scraper.scrape_metadata('RJ000013')
+        assert scraper.scrape_metadata_many(['RJ000014'])['RJ000014']['maker_name'] == 'サークル13'
+        assert fake_dlsite.counters['product_api'] == 2  # 原作已缓存，不再请求原作
+    finally:
+        scraper.close()
+
+
+def test_migrate_legacy_cache(isolated_cache_db):
+    db.close()
+    connection = sqlite3.connect('cache.db')  # 旧版本的表结构：以 rjcode 为主键，不区分语言
+    connection.execute('CREATE TABLE "workmetadatacache" ("rjcode" VARCHAR(255) NOT NULL PRIMARY KEY, '
+                       '"metadata" TEXT NOT NULL)')
+    connection.executemany('INSERT INTO "workmetadatacache" VALUES (?, ?)',
+                           [(rjcode, json.dumps({'rjcode': rjcode})) for rjcode in ('RJ000001', 'RJ000002')])
+    connection.commit()
+    connection.close()
+
+    for _ in range(2):  # 第二次运行不做任何事
+        init_db(legacy_locale=Locale.zh_cn.name)
+        rows = list(WorkMetadataCache.select().order_by(WorkMetadataCache.rjcode).dicts())
+        assert [(row['rjcode'], row['locale'], row['status'], json.loads(row['metadata'])) for row in rows] == [
+            ('RJ000001', Locale.zh_cn.name, STATUS_OK, {'rjcode': 'RJ000001'}),
+            ('RJ000002', Locale.zh_cn.name, STATUS_OK, {'rjcode': 'RJ000002'}),
+        ]
+        assert all(row['schema_version'] == METADATA_SCHEMA_VERSION for row in rows)
+        db.close()
+
+
+def test_offline_mode_queues_misses(fake_dlsite):
+    scraper = make_scraper(ttl=60)
+    try:
+        scraper.scrape_metadata_many([EXISTING])
+    finally:
+        scraper.close()
+    WorkMetadataCache.update(fetched_at=0).execute()  # 已过期
+
+    scraper = make_scraper(ttl=60, offline=True)
+    try:
+        metadata_dict = scraper.scrape_metadata_many([EXISTING, 'RJ000002', 'RJ000003'])
+        assert list(metadata_dict) == [EXISTING]  # 离线模式忽略有效期，未命中的作品不在返回值中
+        with pytest.raises(ConnectionError):
+            scraper.scrape_metadata('RJ000004')
+        scraper.scrape_metadata_many(['RJ000002'])  # 已在队列中
+        assert scraper.pending_count() == 3
+        assert fake_dlsite.counters['product_api'] == 1
+
+        assert scraper.fetch_pending() == (3, 0)  # 即使处于离线模式也抓取队列中的作品
+        assert scraper.pending_count() == 0
+        assert set(scraper.scrape_metadata_many(['RJ000002', 'RJ000003', 'RJ000004'])) == {'RJ000002', 'RJ000003',
+                                                                                           'RJ000004'}
+    finally:
+        scraper.close()
+
+
+def test_fetch_pending_keeps_queue_when_offline(fake_dlsite):
+    scraper = make_scraper(offline=True, max_retries=0, connect_timeout=1)
+    try:
+        scraper.scrape_metadata_many(['RJ000002', 'RJ000003'])
+        fake_dlsite.stop()  # 仍然无法连接
+        assert scraper.fetch_pending() == (0, 2)
+        assert scraper.pending_count() == 2
+    finally:
+        scraper.close()
+
+
+def test_aiohttp_backend_is_cached(fake_dlsite):
+    scraper = make_scraper(backend=BACKEND_AIOHTTP)
+    try:
+        metadata_dict = scraper.scrape_metadata_many(['RJ000001', 'RJ000002'])
+        assert scraper.scrape_metadata_many(['RJ000001', 'RJ000002']) == metadata_dict
+        assert scraper.scrape_metadata('RJ000001') == metadata_dict['RJ000001']
+        assert fake_dlsite.counters['product_api'] == 1
+    finally:
+        scraper.close()
+
+
+def test_aiohttp_backend_looks_up_originals_off_the_event_loop(fake_dlsite, monkeypatch):
+    threads = []
+    lookup_original_metadata = CachedScraper._lookup_original_metadata
+
+    def recording_lookup(self, worknos):
+        threads.append(threading.current_thread().name)
+        return lookup_original_metadata(self, worknos)
+
+    monkeypatch.setattr(CachedScraper, '_lookup_original_metadata', recording_lookup)
+    scraper = make_scraper(backend=BACKEND_AIOHTTP)
+    try:
+        assert scraper.scrape_metadata_many(['RJ000014'])['RJ000014']['maker_name'] == 'サークル13'
+        assert scraper.scrape_metadata('RJ000021')['maker_name'] == 'サークル20'
+    finally:
+        scraper.close()
+    assert threads and 'AsyncScraper' not in threads  # 读取数据库不阻塞事件循环所在的线程
+
+
+def test_async_scraper_is_imported_only_for_aiohttp_backend():
+    code = ('import sys; import config_file, scraper; scraper.CachedScraper(scraper.Locale.ja_jp).close(); '
+            'assert "scraper.async_scraper" not in sys.modules and "aiohttp" not in sys.modules')
+    subprocess.run([sys.executable, '-c', code], cwd=os.getcwd(), check=True,
+                   env={**os.environ, 'PYTHONPATH': ROOT_DIR})
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+
+import pytest
+
+import cli
+from renamer import Renamer
+
+TEMPLATE = '[rjcode] work_name'
+
+
+@pytest.fixture(autouse=True)
+def restore_logger():
+    """
+    cli.main 会修改 Renamer.logger 的处理器
+    """
+    logger = Renamer.logger
+    handlers = [(handler, handler.level) for handler in logger.handlers]
+    yield
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    for handler, level in handlers:
+        handler.setLevel(level)
+        logger.addHandler(handler)
+
+
+def write_config(tmp_path, **config):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({
+        'scraper_sleep_interval': 0,
+        'scaner_incremental': False,
+        'renamer_make_folder_icon': False,
+        'renamer_cover_cache_max_mb': 0,
+        'renamer_template': TEMPLATE,
+        **config,
+    }), encoding='utf-8')
+    return str(path)
+
+
+def test_bad_config(tmp_path, capsys):
+    path = tmp_path / 'config.json'
+    path.write_text('{"scaner_max_depth": ', encoding='utf-8')
+    assert cli.main(['-c', str(path), 'rename', str(tmp_path)]) == cli.EXIT_USAGE
+    assert cli.main(['-c', write_config(tmp_path, renamer_template='work_name'), 'rename', str(tmp_path)]) \
+           == cli.EXIT_USAGE  # 模板中缺少 rjcode
+    assert '配置文件' in capsys.readouterr().err
+
+
+def test_partial_failure(tmp_path, fake_dlsite):
+    for rjcode in ('RJ000001', 'RJ000009'):  # 模拟服务器中编号以 9 结尾的作品不存在
+        os.makedirs(tmp_path / 'library' / rjcode)
+    assert cli.main(['-c', write_config(tmp_path), 'rename', str(tmp_path / 'library')]) == cli.EXIT_FAILURES
+    assert sorted(os.listdir(tmp_path / 'library')) == ['RJ000009', '[RJ000001] テスト作品 RJ000001']
+
+    assert cli.main(['-c', write_config(tmp_path), 'rename', str(tmp_path / 'library')]) == cli.EXIT_FAILURES
+    os.rename(tmp_path / 'library' / 'RJ000009', tmp_path / 'library' / 'RJ000002')
+    assert cli.main(['-c', write_config(tmp_path), 'rename', str(tmp_path / 'library')]) == cli.EXIT_OK
+
+
+def test_jsonl_output(tmp_path, fake_dlsite, capsys):
+    os.makedirs(tmp_path / 'library' / 'RJ000001')
+    assert cli.main(['-c', write_config(tmp_path), '--jsonl', 'rename', str(tmp_path / 'library')]) == cli.EXIT_OK
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert records
+    assert all(set(record) == {'time', 'level', 'rjcode', 'message'} for record in records)
+    assert any(record['rjcode'] == 'RJ000001' and record['level'] == logging.getLevelName(logging.INFO)
+               for record in records)
@@ -0,0 +1,123 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scraper import CachedScraper, CoverCache, Locale, Scraper, BACKEND_AIOHTTP, BACKEND_REQUESTS
+from scraper.async_scraper import AsyncScraper, BlockingAsyncScraper
+from scraper.cover_cache import CoverCacheEntry
+from scraper.rate_limiter import RateLimiter
+
+
+def test_put_and_get(tmp_path):
+    cache = CoverCache(cache_dir=str(tmp_path / 'covers'))
+    content_hash = cache.put_image('RJ000001', 'url', b'jpg', etag='"e"')
+    cached = cache.get('RJ000001', 'url')
+    assert cached.content_hash == content_hash and cached.etag == '"e"' and not cached.stale
+    assert cache.read_image(content_hash) == b'jpg'
+    assert cache.read_icon(content_hash) is None
+    cache.put_icon(content_hash, b'ico')
+    assert cache.read_icon(content_hash) == b'ico'
+    assert cache.put_image('RJ000002', 'url', b'jpg') == content_hash  # 相同的封面图只保存一份
+    assert cache.get('RJ000003', 'url') is None
+
+
+def test_hits_are_touched_in_memory_until_flush(tmp_path):
+    cache = CoverCache(cache_dir=str(tmp_path / 'covers'))
+    content_hash = cache.put_image('RJ000001', 'url', b'jpg')
+    put_at = CoverCacheEntry.get().last_used
+    time.sleep(0.01)
+    cached = cache.get('RJ000001', 'url')
+    assert cached.content_hash == content_hash and not cached.stale
+    assert cache.read_image(content_hash) == b'jpg'
+    assert CoverCacheEntry.get().last_used == put_at  # 命中不写数据库
+    cache.flush()
+    assert CoverCacheEntry.get().last_used > put_at
+    assert cache.get('RJ000002', 'url') is None
+
+
+def test_stale_entry_is_revalidated(tmp_path):
+    cache = CoverCache(cache_dir=str(tmp_path / 'covers'), revalidate_after=60)
+    cache.put_image('RJ000001', 'url', b'jpg')
+    CoverCacheEntry.update(fetched_at=CoverCacheEntry.fetched_at - 61).execute()
+    assert cache.get('RJ000001', 'url').stale
+    cache.mark_revalidated('RJ000001', 'url')
+    assert not cache.get('RJ000001', 'url').stale
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = CoverCache(cache_dir=str(tmp_path / 'covers'), max_bytes=250)
+    hashes = [cache.put_image(f'RJ00000{i}', 'url', bytes([i]) * 100) for i in range(3)]
+    time.sleep(0.01)
+    cache.get('RJ000000', 'url')  # 最早放入，但最近使用
+    cache.evict()
+    paths = [tmp_path / 'covers' / content_hash[:2] / f'{content_hash}.jpg' for content_hash in hashes]
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
+    assert cache.get('RJ000001', 'url') is None
+
+
+@pytest.mark.parametrize('scraper_type', ['scraper', 'async'])
+def test_fetch_cover_sends_conditional_request(fake_dlsite, scraper_type):
+    if scraper_type == 'scraper':
+        scraper = Scraper(Locale.ja_jp, sleep_interval=0)
+    else:
+        scraper = BlockingAsyncScraper(AsyncScraper(Locale.ja_jp, sleep_interval=0))
+    try:
+        cover_url = scraper.scrape_metadata('RJ000001')['cover_url']
+        data, etag, _ = scraper.fetch_cover(cover_url)
+        assert data and etag
+        assert scraper.fetch_cover(cover_url, etag=etag) == (None, etag, '')  # 304 Not Modified
+        assert scraper.download_cover(cover_url) == data
+    finally:
+        scraper.close()
+    assert fake_dlsite.counters['cover'] == 2
+    assert fake_dlsite.counters['not_modified'] == 1
+
+
+class CountingRateLimiter(RateLimiter):
+    def __init__(self):
+        super().__init__(0)
+        self.count = 0
+
+    def reserve(self):
+        self.count += 1
+        return super().reserve()
+
+
+@pytest.mark.parametrize('backend', [None, BACKEND_AIOHTTP])
+def test_covers_use_their_own_rate_limiter(fake_dlsite, backend):
+    limiter = CountingRateLimiter()
+    cover_limiter = CountingRateLimiter()
+    if backend:
+        scraper = CachedScraper(Locale.ja_jp, rate_limiter=limiter, backend=backend, cover_rate_limiter=cover_limiter)
+    else:
+        scraper = Scraper(Locale.ja_jp, rate_limiter=limiter, cover_rate_limiter=cover_limiter)
+    try:
+        cover_url = scraper.scrape_metadata('RJ000001')['cover_url']
+        count = limiter.count
+        data, etag, _ = scraper.fetch_cover(cover_url)
+        assert scraper.fetch_cover(cover_url, etag=etag) == (None, etag, '')  # 304 Not Modified
+        assert scraper.download_cover(cover_url) == data
+        assert limiter.count == count  # 不占用 api 的令牌
+        assert cover_limiter.count == 3
+        assert fake_dlsite.counters['not_modified'] == 1
+    finally:
+        scraper.close()
+
+
+@pytest.mark.parametrize('backend', [None, BACKEND_AIOHTTP])
+def test_covers_are_not_throttled_by_api_interval(fake_dlsite, backend):
+    interval = 0.25
+    scraper = CachedScraper(Locale.ja_jp, sleep_interval=interval, backend=backend or BACKEND_REQUESTS)
+    try:
+        cover_urls = [metadata['cover_url'] for metadata in scraper.scrape_metadata_many(
+            [f'RJ00000{i}' for i in range(1, 9)]).values()]
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(cover_urls)) as executor:
+            covers = list(executor.map(scraper.download_cover, cover_urls))
+        elapsed = time.monotonic() - start
+    finally:
+        scraper.close()
+    assert all(covers)
+    assert elapsed < len(cover_urls) * interval / 2  # 经过 api 的限速器至少需要 (N - 1) * interval
@@ -0,0 +1,37 @@
+import os
+
+from scaner import Scaner, DirIndex
+
+
+def test_unchanged_folders_are_not_listed_again(tmp_path, monkeypatch):
+    for path in ('RJ000001', 'a/RJ000002', 'a/b/RJ000003'):
+        os.makedirs(tmp_path / 'library' / path)
+    library = str(tmp_path / 'library')
+    expected = sorted(Scaner().scan(library))
+    assert sorted(Scaner(index=DirIndex()).scan(library)) == expected
+
+    listed = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        listed.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', counting_scandir)
+    assert sorted(Scaner(index=DirIndex()).scan(library)) == expected  # 从数据库中读取索引
+    assert listed == []
+
+    os.makedirs(tmp_path / 'library' / 'a' / 'RJ000004')  # 修改了 a 的修改时间
+    result = sorted(Scaner(index=DirIndex()).scan(library))
+    assert [rjcode for rjcode, _ in result] == ['RJ000001', 'RJ000002', 'RJ000003', 'RJ000004']
+    assert listed == [os.path.join(library, 'a')]
+
+
+def test_done_entries_depend_on_fingerprint(tmp_path):
+    index = DirIndex()
+    index.mark_done(str(tmp_path / 'RJ000001'), 'RJ000001', 'abc')
+    index.flush()
+    index = DirIndex()
+    assert index.is_done(str(tmp_path / 'RJ000001'), 'RJ000001', 'abc')
+    assert not index.is_done(str(tmp_path / 'RJ000001'), 'RJ000001', 'def')
+    assert not index.is_done(str(tmp_path / 'RJ000002'), 'RJ000002', 'abc')
@@ -0,0 +1,40 @@
+import pytest
+
+from bench_parse_workno import legacy_parse_workno, make_corpus
+from scraper import Dlsite
+
+NAMES = [
+    ('RJ123456', 'RJ123456'),
+    ('rj123456 作品名', 'RJ123456'),
+    ('[サークル][Bj01234567] 作品', 'BJ01234567'),
+    ('【作品名】vJ000001', 'VJ000001'),
+    ('RJ1234567', None),  # 7 位数字
+    ('RJ123456789', None),  # 9 位数字
+    ('RJ12345678', 'RJ12345678'),
+    ('XJ123456 jj 123456', None),  # 没有 RJ/BJ/VJ 前缀
+    ('J123456', None),
+    ('CD1', None),
+    ('', None),
+    ('RJ12 RJ654321 RJ111111', 'RJ654321'),
+    ('ＲＪ123456', None),  # 全角字符
+]
+
+
+@pytest.mark.parametrize('name, expected', NAMES)
+def test_parse_workno(name, expected):
+    assert Dlsite.parse_workno(name) == expected
+    assert Dlsite.parse_worknos([name]) == [expected]
+
+
+def test_find_worknos():
+    assert Dlsite.find_worknos('RJ123456 rj123456 VJ000002 (CV) RJ1234567 BJ00000003') == ('RJ123456', 'VJ000002',
+                                                                                           'BJ00000003')
+    assert Dlsite.find_worknos('CD1') == ()
+    assert Dlsite.parse_worknos(['CD1', 'rj000001 RJ000002', 'BJ1'], find_all=True) == [(), ('RJ000001', 'RJ000002'),
+                                                                                         ()]
+
+
+def test_matches_legacy_parse_workno():
+    names = make_corpus(20000, 0.2) + [name for name, _ in NAMES]
+    assert Dlsite.parse_worknos(names) == [legacy_parse_workno(name) for name in names]
+    assert Dlsite.parse_worknos(names, find_all=True) == [Dlsite.find_worknos(name) for name in names]
@@ -0,0 +1,22 @@
+import io
+
+from PIL import Image
+
+from scraper.icon import make_icon, ICON_SIZES
+
+
+def make_jpeg(size):
+    buf = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+def test_make_icon_contains_all_sizes():
+    icon = Image.open(io.BytesIO(make_icon(make_jpeg((560, 420)))))  # 作品封面通常不是正方形
+    assert icon.format == 'ICO'
+    assert sorted(icon.info['sizes']) == ICON_SIZES
+
+
+def test_make_icon_small_cover():
+    icon = Image.open(io.BytesIO(make_icon(make_jpeg((40, 30)))))  # 不放大，只包含不超过封面的尺寸
+    assert sorted(icon.info['sizes']) == [size for size in ICON_SIZES if size[0] <= 40]
@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+from journal import Journal, JournalEntry, OP_DONE, OP_FAILED, OP_PENDING, OP_UNDONE
+
+
+def make_entry(mode, old_path, target_path, target_existed=False):
+    return JournalEntry(run_id='run', rjcode='RJ000001', mode=mode, old_path=str(old_path),
+                        new_path=str(target_path), target_path=str(target_path), target_existed=target_existed)
+
+
+def write_file(path, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_reconcile_rename(tmp_path):
+    old_path, target_path = tmp_path / 'old', tmp_path / 'new'
+    os.makedirs(old_path)
+    assert not Journal.reconcile(make_entry('RENAME', old_path, target_path))  # 尚未执行
+    os.rename(old_path, target_path)
+    assert Journal.reconcile(make_entry('RENAME', old_path, target_path))  # 已执行，状态未写入
+    os.makedirs(old_path)
+    assert not Journal.reconcile(make_entry('RENAME', old_path, target_path))  # 两者都存在，无法确认
+
+
+def test_reconcile_move_removes_source_after_complete_copy(tmp_path):
+    old_path, target_path = tmp_path / 'old', tmp_path / 'new'
+    for root in (old_path, target_path):
+        write_file(root / 'a.wav', b'a' * 100)
+        write_file(root / 'sub' / 'b.wav', b'b' * 10)
+    assert Journal.reconcile(make_entry('MOVE', old_path, target_path))
+    assert not os.path.exists(old_path)
+    assert os.path.exists(target_path / 'sub' / 'b.wav')
+
+
+def test_reconcile_move_removes_partial_copy(tmp_path):
+    old_path, target_path = tmp_path / 'old', tmp_path / 'new'
+    write_file(old_path / 'a.wav', b'a' * 100)
+    write_file(old_path / 'sub' / 'b.wav', b'b' * 10)
+    write_file(target_path / 'a.wav', b'a' * 40)  # 复制时中断
+    assert not Journal.reconcile(make_entry('MOVE', old_path, target_path))
+    assert not os.path.exists(target_path)
+    assert os.path.getsize(old_path / 'a.wav') == 100
+
+
+def test_reconcile_move_keeps_unrelated_target(tmp_path):
+    old_path, target_path = tmp_path / 'old', tmp_path / 'new'
+    write_file(old_path / 'a.wav', b'a')
+    write_file(target_path / 'other.wav', b'other')  # 不是本次复制留下的文件夹
+    assert not Journal.reconcile(make_entry('MOVE', old_path, target_path))
+    assert os.path.exists(target_path / 'other.wav')
+    assert os.path.exists(old_path / 'a.wav')
+
+
+@pytest.mark.parametrize('target_existed', [True, None])
+def test_reconcile_move_keeps_preexisting_target(tmp_path, target_existed):
+    old_path, target_path = tmp_path / 'old', tmp_path / 'new'
+    write_file(old_path / 'a.wav', b'a' * 100)
+    os.makedirs(target_path)  # 操作前已存在（None：旧版本的记录，未知）
+    assert not Journal.reconcile(make_entry('MOVE', old_path, target_path, target_existed))
+    assert os.path.exists(target_path)
+    write_file(target_path / 'a.wav', b'a' * 100)
+    assert not Journal.reconcile(make_entry('MOVE', old_path, target_path, target_existed))
+    assert os.path.exists(old_path / 'a.wav')
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason='需要符号链接')
+def test_reconcile_link(tmp_path):
+    old_path, target_path = tmp_path / 'old', tmp_path / 'links' / 'new'
+    os.makedirs(old_path)
+    os.makedirs(target_path.parent)
+    assert not Journal.reconcile(make_entry('LINK', old_path, target_path))
+    os.symlink(old_path, target_path, target_is_directory=True)
+    assert Journal.reconcile(make_entry('LINK', old_path, target_path))
+
+
+def test_status_is_buffered_until_flush():
+    journal = Journal()
+    entry_id, = journal.record('run', [{'rjcode': 'RJ000001', 'mode': 'RENAME', 'old_path': 'a', 'new_path': 'b',
+                                        'target_path': 'b', 'cover_url': ''}])
+    journal.mark(entry_id, OP_DONE)
+    assert JournalEntry.get_by_id(entry_id).status == OP_PENDING
+    assert [entry.id for entry in journal.entries('run', [OP_DONE])] == [entry_id]  # 查询前先写入缓冲的状态
+
+
+def test_resume_reconciles_and_finishes_interrupted_run(tmp_path, make_renamer):
+    library = tmp_path / 'library'
+    for rjcode in ('RJ000001', 'RJ000002'):
+        os.makedirs(library / rjcode)
+    renamer, _ = make_renamer(renamer_journal=True, renamer_template='[rjcode] work_name')
+    plan = renamer.plan(str(library))
+    # 模拟中断：记录了两个操作的意图，只完成了第一个，且完成状态没有写入
+    journal = Journal()
+    run_id = Journal.new_run_id()
+    journal.record(run_id, [{key: item[key] for key in ('rjcode', 'mode', 'old_path', 'new_path', 'target_path',
+                                                        'cover_url')} for item in plan])
+    os.rename(plan[0]['old_path'], plan[0]['target_path'])
+
+    renamer.resume()
+    assert sorted(os.listdir(library)) == ['[RJ000001] テスト作品 RJ000001', '[RJ000002] テスト作品 RJ000002']
+    assert [entry.status for entry in journal.entries(run_id, [OP_DONE, OP_PENDING])] == [OP_DONE, OP_DONE]
+
+
+def test_resume_keeps_preexisting_target(tmp_path, make_renamer):
+    library, move_root = tmp_path / 'library', tmp_path / 'sorted'
+    write_file(library / 'RJ000001' / 'a.wav', b'a' * 100)
+    renamer, _ = make_renamer(renamer_journal=True, renamer_mode='MOVE', renamer_move_root=str(move_root),
+                              renamer_move_template='[rjcode] work_name')
+    plan = renamer.plan(str(library))
+    target_path = plan[0]['target_path']
+    write_file(os.path.join(target_path, 'a.wav'), b'mine')  # 用户已有的同名文件夹
+    # 模拟中断：记录了意图，操作因目标已存在而失败，但失败状态没有写入
+    journal = Journal()
+    run_id = Journal.new_run_id()
+    journal.record(run_id, [{key: plan[0][key] for key in ('rjcode', 'mode', 'old_path', 'new_path', 'target_path',
+                                                           'cover_url')}])
+
+    renamer.resume()
+    with open(os.path.join(target_path, 'a.wav'), 'rb') as f:
+        assert f.read() == b'mine'
+    assert os.path.getsize(library / 'RJ000001' / 'a.wav') == 100
+    assert [entry.status for entry in journal.entries(run_id, [OP_FAILED, OP_PENDING, OP_DONE])] == [OP_FAILED]
+
+
+def test_undo_restores_folders(tmp_path, make_renamer):
+    library = tmp_path / 'library'
+    for rjcode in ('RJ000001', 'RJ000002', 'RJ000009'):
+        os.makedirs(library / rjcode)
+    renamer, _ = make_renamer(renamer_journal=True, renamer_template='[rjcode] work_name')
+    renamer.rename(str(library))
+    assert sorted(os.listdir(library)) == ['RJ000009', '[RJ000001] テスト作品 RJ000001',
+                                           '[RJ000002] テスト作品 RJ000002']
+
+    undo_renamer, _ = make_renamer(renamer_journal=True)  # 另一个 Renamer（例如下一次启动）撤销最近一次运行
+    undo_renamer.undo()
+    assert sorted(os.listdir(library)) == ['RJ000001', 'RJ000002', 'RJ000009']
+    journal = Journal()
+    assert [entry.status for entry in journal.entries(renamer.run_id, [OP_DONE, OP_UNDONE])] == [OP_UNDONE] * 2
@@ -0,0 +1,89 @@
+import pytest
+
+from bench_name_template import legacy_compile_new_name, OPTIONS, TEMPLATE
+from name_template import NameCompiler, NameTemplate
+
+METADATA_LIST = [
+    {
+        'rjcode': 'RJ01234567',
+        'work_name': '【お耳かき】作品名：副題？ <ASMR>【バイノーラル】',
+        'maker_id': 'RG12345',
+        'maker_name': 'サークル/名',
+        'release_date': '2023-01-02',
+        'series_id': 'SRI001',
+        'series_name': 'シリーズ|1',
+        'age_category': 'GEN',
+        'tags': ['标签3', '耳かき', '标签2', '癒し', 'バイノーラル/ダミヘ', '标签1'],
+        'cvs': ['声優A', '声優*B'],
+        'cover_url': '',
+    },
+    {
+        'rjcode': 'RJ000002',
+        'work_name': '  作品名  ',
+        'maker_id': 'RG00002',
+        'maker_name': 'サークル',
+        'release_date': '2009-12-31',
+        'series_id': '',
+        'series_name': '',
+        'age_category': 'R18',
+        'tags': [],
+        'cvs': [],
+        'cover_url': '',
+    },
+    {
+        'rjcode': 'RJ000003',
+        'work_name': 'Work "3"',
+        'maker_id': 'RG00003',
+        'maker_name': 'Circle?',
+        'release_date': '2015-06-15',
+        'series_id': '',
+        'series_name': '',
+        'age_category': 'R15',
+        'tags': ['标签2'],
+        'cvs': ['CV'],
+        'cover_url': '',
+    },
+]
+
+OPTION_VARIANTS = [
+    {},
+    {'illegal_character_to_full_width_flag': False},
+    {'exclude_square_brackets_in_work_name_flag': False},
+    {'age_cat_ignore_r18': True},
+    {'release_date_format': '%Y年%m月%d日', 'delimiter': '、', 'tags_option': {'ordered_list': [], 'max_number': 2}},
+]
+
+TEMPLATES = [
+    TEMPLATE,
+    '[maker_id][rjcode] work_name',
+    'rjcode: work_name <maker_name>',
+    'work_name cv_list_str release_date',
+]
+
+
+@pytest.mark.parametrize('options', OPTION_VARIANTS)
+@pytest.mark.parametrize('template', TEMPLATES)
+def test_matches_legacy_compile(template, options):
+    options = {**OPTIONS, **options}
+    compiler = NameCompiler(template=template, keep_slash=False, **options)
+    for metadata in METADATA_LIST:
+        assert compiler.compile(metadata) == legacy_compile_new_name(template, metadata, options)
+
+
+def test_substituted_values_are_not_substituted_again():
+    compiler = NameCompiler(template='[rjcode] work_name', keep_slash=False, **OPTIONS)
+    metadata = {**METADATA_LIST[1], 'work_name': 'rjcode と maker_name'}
+    # 旧版逐个 str.replace，会把作品名中的 maker_name 替换为社团名
+    assert compiler.compile(metadata) == '[RJ000002] rjcode と maker_name'
+
+
+def test_keep_slash_builds_nested_path():
+    compiler = NameCompiler(template='maker_name/ rjcode work_name', keep_slash=True, **OPTIONS)
+    # 字段中的 "/" 转为全角，模板中的 "/" 保留为目录分隔符，各级目录名两端的空白被去除
+    assert compiler.compile({**METADATA_LIST[2], 'maker_name': 'Circle/?'}) == 'Circle／？/RJ000003 Work ＂3＂'
+
+
+def test_template_tokens():
+    template = NameTemplate('[maker_name][rjcode] work_name series_name')
+    assert template.placeholders == {'maker_name', 'rjcode', 'work_name', 'series_name'}
+    assert template.render({'maker_name': 'M', 'rjcode': 'R', 'work_name': 'W', 'series_name': ''}) == '[M][R] W '
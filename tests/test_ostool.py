@@ -0,0 +1,124 @@
+import errno
+import os
+
+import pytest
+
+import ostool
+from ostool import mirror_with_hardlinks, move_folder, remove_mirror, MIRROR_MARKER
+
+
+def make_tree(root):
+    files = {'a.wav': b'a' * 300000, os.path.join('sub', 'b.jpg'): b'b' * 100, os.path.join('sub', 'deep', 'c.txt'): b''}
+    for path, data in files.items():
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        with open(os.path.join(root, path), 'wb') as f:
+            f.write(data)
+    return files
+
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    """
+    让 move_folder 按跨设备的方式复制
+    """
+    monkeypatch.setattr(ostool, '_is_same_device', lambda src, dst: False)
+
+
+def test_move_folder_same_device(tmp_path):
+    files = make_tree(tmp_path / 'src')
+    move_folder(str(tmp_path / 'src'), str(tmp_path / 'new' / 'dst'))
+    assert not os.path.exists(tmp_path / 'src')
+    for path, data in files.items():
+        assert (tmp_path / 'new' / 'dst' / path).read_bytes() == data
+
+
+def test_move_folder_cross_device(tmp_path, cross_device):
+    files = make_tree(tmp_path / 'src')
+    if hasattr(os, 'symlink'):
+        os.symlink('a.wav', tmp_path / 'src' / 'link.wav')
+    reports = []
+    move_folder(str(tmp_path / 'src'), str(tmp_path / 'dst'), progress=lambda *args: reports.append(args))
+    assert not os.path.exists(tmp_path / 'src')
+    for path, data in files.items():
+        assert (tmp_path / 'dst' / path).read_bytes() == data
+    if hasattr(os, 'symlink'):
+        assert os.readlink(tmp_path / 'dst' / 'link.wav') == 'a.wav'  # 符号链接原样复制
+    copied, total, _ = reports[-1]
+    assert copied == total == sum(map(len, files.values()))
+
+
+def test_move_folder_removes_partial_copy_on_failure(tmp_path, cross_device, monkeypatch):
+    files = make_tree(tmp_path / 'src')
+    copy_file = ostool._copy_file
+
+    def failing_copy_file(src, dst, on_copied):
+        if src.endswith('b.jpg'):
+            raise OSError(errno.ENOSPC, '磁盘空间不足', dst)
+        copy_file(src, dst, on_copied)
+
+    monkeypatch.setattr(ostool, '_copy_file', failing_copy_file)
+    with pytest.raises(OSError) as exc_info:
+        move_folder(str(tmp_path / 'src'), str(tmp_path / 'dst'))
+    assert exc_info.value.errno == errno.ENOSPC
+    assert not os.path.exists(tmp_path / 'dst')  # 不完整的副本已删除
+    for path, data in files.items():  # 源文件夹保持不变
+        assert (tmp_path / 'src' / path).read_bytes() == data
+
+
+def test_move_folder_refuses_existing_target(tmp_path):
+    os.makedirs(tmp_path / 'src')
+    os.makedirs(tmp_path / 'dst')
+    with pytest.raises(FileExistsError):
+        move_folder(str(tmp_path / 'src'), str(tmp_path / 'dst'))
+    with pytest.raises(FileNotFoundError):
+        move_folder(str(tmp_path / 'missing'), str(tmp_path / 'other'))
+    assert os.path.isdir(tmp_path / 'src')
+
+
+def test_mirror_with_hardlinks(tmp_path):
+    files = make_tree(tmp_path / 'src')
+    if hasattr(os, 'symlink'):
+        os.symlink('a.wav', tmp_path / 'src' / 'link.wav')
+    counts, created = mirror_with_hardlinks(str(tmp_path / 'src'), str(tmp_path / 'mirror'))
+    assert counts['linked'] + counts['reflinked'] + counts['copied'] == len(files)
+    assert sorted(created) == sorted(list(files) + (['link.wav'] if hasattr(os, 'symlink') else []))
+    for path, data in files.items():
+        assert (tmp_path / 'mirror' / path).read_bytes() == data
+    if hasattr(os, 'symlink'):
+        assert counts['symlinked'] == 1
+        assert os.readlink(tmp_path / 'mirror' / 'link.wav') == 'a.wav'
+    assert os.path.exists(tmp_path / 'mirror' / MIRROR_MARKER)
+
+    counts, created = mirror_with_hardlinks(str(tmp_path / 'src'), str(tmp_path / 'mirror'))  # 重复执行是幂等的
+    assert created == []
+    assert counts['skipped'] == len(files) + (1 if hasattr(os, 'symlink') else 0)
+
+
+def test_mirror_refuses_to_merge_other_sources(tmp_path):
+    make_tree(tmp_path / 'src')
+    make_tree(tmp_path / 'other')
+    mirror_with_hardlinks(str(tmp_path / 'src'), str(tmp_path / 'mirror'))
+    with pytest.raises(FileExistsError):  # 两个文件夹含有相同的 RJ 号，镜像到同一个位置
+        mirror_with_hardlinks(str(tmp_path / 'other'), str(tmp_path / 'mirror'))
+    os.makedirs(tmp_path / 'taken')
+    (tmp_path / 'taken' / 'mine.txt').write_bytes(b'mine')
+    with pytest.raises(FileExistsError):  # 不是镜像的文件夹
+        mirror_with_hardlinks(str(tmp_path / 'src'), str(tmp_path / 'taken'))
+    assert os.listdir(tmp_path / 'taken') == ['mine.txt']
+
+
+def test_remove_mirror_only_removes_created_files(tmp_path):
+    make_tree(tmp_path / 'src')
+    _, first_created = mirror_with_hardlinks(str(tmp_path / 'src'), str(tmp_path / 'mirror'))
+    (tmp_path / 'src' / 'sub' / 'new.wav').write_bytes(b'new')
+    _, created = mirror_with_hardlinks(str(tmp_path / 'src'), str(tmp_path / 'mirror'))
+    assert created == [os.path.join('sub', 'new.wav')]
+
+    remove_mirror(str(tmp_path / 'mirror'), created)  # 撤销第二次运行，第一次运行创建的文件保留
+    assert not os.path.exists(tmp_path / 'mirror' / 'sub' / 'new.wav')
+    assert os.path.exists(tmp_path / 'mirror' / 'sub' / 'b.jpg')
+    assert os.path.exists(tmp_path / 'mirror' / MIRROR_MARKER)
+
+    remove_mirror(str(tmp_path / 'mirror'), first_created)
+    assert not os.path.exists(tmp_path / 'mirror')
+    assert os.path.exists(tmp_path / 'src' / 'sub' / 'b.jpg')
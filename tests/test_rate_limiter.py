@@ -0,0 +1,62 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+from scraper.rate_limiter import RateLimiter, parse_retry_after
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None),
+    ('', None),
+    ('0', 0.0),
+    (' 120 ', 120.0),
+    ('not a date', None),
+])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    assert 25 <= parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0  # 已经过去的时间不必等待
+
+
+def test_reserve_overdraws_tokens():
+    limiter = RateLimiter(10, burst=2)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == pytest.approx(0.1, abs=0.02)
+    assert limiter.reserve() == pytest.approx(0.2, abs=0.02)
+
+
+def test_penalize_halves_rate_and_honors_retry_after():
+    limiter = RateLimiter(8)
+    limiter.penalize(5)
+    assert limiter.rate == 4
+    assert limiter.reserve() == pytest.approx(5, abs=0.05)  # 退避期间不发放令牌
+    for _ in range(10):
+        limiter.penalize(0)
+    assert limiter.rate == 8 * RateLimiter.MIN_RATE_FACTOR  # 降速有下限
+
+
+def test_penalize_without_retry_after_backs_off_exponentially():
+    limiter = RateLimiter(0)  # 不限速时仍然遵守退避
+    limiter.penalize()
+    assert limiter.reserve() == pytest.approx(1, abs=0.05)
+    limiter.penalize()
+    assert limiter.reserve() == pytest.approx(2, abs=0.05)
+    limiter.reward()  # 请求成功后重置退避时间
+    limiter.penalize()
+    assert limiter.reserve() == pytest.approx(2, abs=0.05)  # 已在退避中的时间不会缩短
+
+
+def test_reward_restores_rate_gradually():
+    limiter = RateLimiter(16)
+    limiter.penalize(0)
+    assert limiter.rate == 8
+    limiter.reward()
+    assert limiter.rate == 9
+    for _ in range(20):
+        limiter.reward()
+    assert limiter.rate == 16
@@ -0,0 +1,63 @@
+import os
+
+from rename_plan import (check_plan, load_plan, save_plan,
+                         PLAN_COLLISION, PLAN_ERROR, PLAN_EXISTS, PLAN_NOT_FOUND, PLAN_OK, PLAN_UNCHANGED)
+
+
+def make_item(rjcode, old_path, target_path, status=PLAN_OK, mode='RENAME'):
+    return {
+        'rjcode': rjcode,
+        'mode': mode,
+        'old_path': old_path,
+        'new_path': target_path,
+        'target_path': target_path,
+        'cover_url': '',
+        'status': status,
+        'duplicate': False,
+        'message': '',
+    }
+
+
+def test_check_plan(tmp_path):
+    os.makedirs(tmp_path / 'taken')
+    os.makedirs(tmp_path / 'mirror')
+    plan = check_plan([
+        make_item('RJ000001', str(tmp_path / 'a'), str(tmp_path / 'same')),
+        make_item('RJ000002', str(tmp_path / 'b'), str(tmp_path / 'same')),
+        make_item('RJ000003', str(tmp_path / 'c'), str(tmp_path / 'c')),
+        make_item('RJ000004', str(tmp_path / 'd'), str(tmp_path / 'taken')),
+        make_item('RJ000005', str(tmp_path / 'e'), str(tmp_path / 'mirror'), mode='HARDLINK'),  # 补充已存在的镜像
+        make_item('RJ000006', str(tmp_path / 'f'), '', status=PLAN_NOT_FOUND),
+        make_item('RJ000006', str(tmp_path / 'g'), '', status=PLAN_ERROR),
+    ])
+    assert [item['status'] for item in plan] == [PLAN_COLLISION, PLAN_COLLISION, PLAN_UNCHANGED, PLAN_EXISTS,
+                                                 PLAN_OK, PLAN_NOT_FOUND, PLAN_ERROR]
+    assert [item['duplicate'] for item in plan] == [False] * 5 + [True] * 2
+
+
+def test_plan_reports_not_found_and_collisions(tmp_path, make_renamer):
+    library = tmp_path / 'library'
+    for path in ('RJ000001', 'RJ000009', 'a/RJ000002', 'b/RJ000002'):
+        os.makedirs(library / path)
+    renamer, _ = make_renamer(renamer_mode='MOVE', renamer_move_root=str(tmp_path / 'sorted'),
+                           renamer_move_template='[rjcode] work_name')
+    plan = {os.path.relpath(item['old_path'], library): item for item in renamer.plan(str(library))}
+
+    assert plan['RJ000001']['status'] == PLAN_OK
+    assert plan['RJ000001']['target_path'] == str(tmp_path / 'sorted' / '[RJ000001] テスト作品 RJ000001')
+    assert plan['RJ000009']['status'] == PLAN_NOT_FOUND  # 模拟服务器中编号以 9 结尾的作品不存在
+    for path in (os.path.join('a', 'RJ000002'), os.path.join('b', 'RJ000002')):
+        assert plan[path]['status'] == PLAN_COLLISION
+        assert plan[path]['duplicate']
+    assert sorted(os.listdir(library)) == ['RJ000001', 'RJ000009', 'a', 'b']  # 计划阶段不修改任何文件
+
+    renamer.apply(list(plan.values()))  # 只执行状态为 ok 的条目
+    assert os.listdir(tmp_path / 'sorted') == ['[RJ000001] テスト作品 RJ000001']
+    assert sorted(os.listdir(library)) == ['RJ000009', 'a', 'b']
+
+
+def test_save_and_load_plan(tmp_path):
+    plan = check_plan([make_item('RJ000001', 'a', 'b'), make_item('RJ000001', 'c', 'd', status=PLAN_NOT_FOUND)])
+    for file_name in ('plan.csv', 'plan.json'):
+        save_plan(plan, str(tmp_path / file_name))
+        assert load_plan(str(tmp_path / file_name)) == plan
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from renamer import Renamer
+from scraper import CachedScraper
+
+TEMPLATE = '[rjcode] work_name'
+
+
+def make_library(root, *rjcodes):
+    for rjcode in rjcodes:
+        os.makedirs(root / rjcode)
+    return str(root)
+
+
+@pytest.fixture
+def flaky_scrape(monkeypatch):
+    """
+    让 CachedScraper.scrape_metadata_many 的前 failures[0] 次调用失败
+    """
+    failures = [0]
+    calls = []
+    scrape_metadata_many = CachedScraper.scrape_metadata_many
+
+    def flaky(self, rjcodes):
+        calls.append(list(rjcodes))
+        if len(calls) <= failures[0]:
+            raise ConnectionError(f'Max retries exceeded with url: /product.json?workno={",".join(rjcodes)}')
+        return scrape_metadata_many(self, rjcodes)
+
+    monkeypatch.setattr(CachedScraper, 'scrape_metadata_many', flaky)
+    return failures, calls
+
+
+def test_transient_failure_is_retried(tmp_path, make_renamer, flaky_scrape):
+    failures, calls = flaky_scrape
+    failures[0] = 1
+    library = make_library(tmp_path / 'library', 'RJ000001', 'RJ000002')
+    renamer, _ = make_renamer(renamer_template=TEMPLATE, renamer_retry_backoff=0)
+    renamer.rename(library)
+    assert sorted(os.listdir(library)) == ['[RJ000001] テスト作品 RJ000001', '[RJ000002] テスト作品 RJ000002']
+    assert renamer.unresolved == []
+    assert len(calls) == 2
+
+
+def test_unresolved_after_all_attempts(tmp_path, make_renamer, flaky_scrape, caplog):
+    failures, calls = flaky_scrape
+    failures[0] = 100
+    library = make_library(tmp_path / 'library', 'RJ000001', 'RJ000002')
+    renamer, _ = make_renamer(renamer_template=TEMPLATE, renamer_retry_backoff=0, renamer_retry_attempts=3)
+    with caplog.at_level(logging.INFO, logger='Renamer'):
+        renamer.rename(library)
+    assert sorted(os.listdir(library)) == ['RJ000001', 'RJ000002']
+    assert sorted(rjcode for rjcode, _ in renamer.unresolved) == ['RJ000001', 'RJ000002']
+    assert len(calls) == 3  # 同一批作品一起重试
+    assert any('未能爬取元数据' in record.message and 'RJ000002' in record.message for record in caplog.records)
+    # 每一批只记录一次包含 url 的错误信息
+    url_messages = [record.message for record in caplog.records if 'workno=' in record.message]
+    assert len(url_messages) == len(calls)
+
+
+def test_fatal_error_in_retry_stage_still_reports_unresolved(tmp_path, make_renamer, flaky_scrape, monkeypatch):
+    failures, _ = flaky_scrape
+    failures[0] = 1
+    library = make_library(tmp_path / 'library', 'RJ000001', 'RJ000002', 'RJ000003')
+    renamer, _ = make_renamer(renamer_template=TEMPLATE, renamer_retry_backoff=0)
+    monkeypatch.setattr(Renamer, '_Renamer__rename_work', lambda self, rjcode, folder_path, metadata: False)
+    renamer.rename(library)
+    # 重试阶段处理第一个作品时遇到无法继续的错误，其余作品计入未能爬取元数据的作品
+    assert len(renamer.unresolved) == 2
+
+
+def test_processed_folders_are_skipped(tmp_path, make_renamer, fake_dlsite):
+    library = make_library(tmp_path / 'library', 'RJ000001', 'RJ000002')
+    renamer, cached_scraper = make_renamer(renamer_template=TEMPLATE, scaner_incremental=True)
+    renamer.rename(library)
+    cached_scraper.close()
+    assert sorted(os.listdir(library)) == ['[RJ000001] テスト作品 RJ000001', '[RJ000002] テスト作品 RJ000002']
+    os.makedirs(os.path.join(library, 'RJ000003'))
+    requests_before = fake_dlsite.counters['product_api']
+
+    renamer, _ = make_renamer(renamer_template=TEMPLATE, scaner_incremental=True, scraper_batch_size=1)
+    renamer.rename(library)
+    assert fake_dlsite.counters['product_api'] == requests_before + 1  # 只爬取新的文件夹
+    assert '[RJ000003] テスト作品 RJ000003' in os.listdir(library)
+
+    renamer, _ = make_renamer(renamer_template='rjcode work_name', scaner_incremental=True)
+    renamer.rename(library)  # 配置改变后重新处理
+    assert sorted(os.listdir(library)) == ['RJ000001 テスト作品 RJ000001', 'RJ000002 テスト作品 RJ000002',
+                                           'RJ000003 テスト作品 RJ000003']
+
+
+def test_already_named_folders_are_skipped(tmp_path, make_renamer, fake_dlsite):
+    library = make_library(tmp_path / 'library', 'RJ000001', 'RJ000002')
+    renamer, cached_scraper = make_renamer(renamer_template=TEMPLATE)
+    renamer.rename(library)
+    cached_scraper.close()  # 写入缓存的元数据
+    os.makedirs(os.path.join(library, 'RJ000003'))
+    requests_before = fake_dlsite.counters['product_api']
+
+    renamer, _ = make_renamer(renamer_template=TEMPLATE, scaner_incremental=True)
+    plan = renamer.plan(library)  # 名称已与模板一致的文件夹不需要再爬取
+    assert [item['rjcode'] for item in plan] == ['RJ000003']
+    assert fake_dlsite.counters['product_api'] == requests_before + 1
+
+
+def test_run_report(tmp_path, make_renamer):
+    library = make_library(tmp_path / 'library', 'RJ000001', 'RJ000002', 'RJ000009')
+    report_file = tmp_path / 'run_report.json'
+    renamer, _ = make_renamer(renamer_template=TEMPLATE, renamer_report_file=str(report_file))
+    renamer.rename(library)
+    report = json.loads(report_file.read_text(encoding='utf-8'))
+    assert {'kind', 'finished_at', 'elapsed', 'renames_per_second', 'timers', 'counters'} <= set(report)
+    assert report['counters']['works'] == 3
+    assert report['counters']['renamed'] == 2
+    assert report['counters']['http_requests'] >= 1
+    for stage in ('scan', 'cache_lookup', 'http', 'name_compile', 'filesystem'):
+        assert set(report['timers'][stage]) == {'count', 'total', 'mean', 'max'}
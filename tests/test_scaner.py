@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from scaner import Scaner
+
+
+def make_dirs(root, *paths):
+    for path in paths:
+        os.makedirs(os.path.join(root, path))
+
+
+def scan(root, **kwargs):
+    return sorted((rjcode, os.path.relpath(path, root)) for rjcode, path in Scaner(**kwargs).scan(str(root)))
+
+
+def test_root_folder_with_rjcode(tmp_path):
+    make_dirs(tmp_path, 'RJ123456/RJ654321')
+    assert list(Scaner().scan(str(tmp_path / 'RJ123456'))) == [('RJ123456', str(tmp_path / 'RJ123456'))]
+
+
+def test_finds_rjcode_folders_without_descending_into_them(tmp_path):
+    make_dirs(tmp_path, 'RJ000001 作品/RJ000002', 'a/rj000003', 'a/b/[サークル][VJ01000004] 作品', 'a/CD1')
+    assert scan(tmp_path) == [('RJ000001', 'RJ000001 作品'),
+                              ('RJ000003', os.path.join('a', 'rj000003')),
+                              ('VJ01000004', os.path.join('a', 'b', '[サークル][VJ01000004] 作品'))]
+
+
+@pytest.mark.parametrize('max_depth, expected', [
+    (0, []),
+    (1, ['RJ000001']),
+    (2, ['RJ000001', 'RJ000002']),
+    (3, ['RJ000001', 'RJ000002', 'RJ000003']),
+])
+def test_max_depth(tmp_path, max_depth, expected):
+    make_dirs(tmp_path, 'RJ000001', 'a/RJ000002', 'a/b/RJ000003')
+    assert [rjcode for rjcode, _ in scan(tmp_path, max_depth=max_depth)] == expected
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason='需要符号链接')
+def test_symlink_loops_are_skipped(tmp_path):
+    make_dirs(tmp_path, 'lib/a/RJ000001', 'other/RJ000002')
+    os.symlink(tmp_path / 'lib', tmp_path / 'lib' / 'a' / 'loop', target_is_directory=True)  # 指向祖先文件夹
+    os.symlink(tmp_path / 'other', tmp_path / 'lib' / 'link1', target_is_directory=True)
+    os.symlink(tmp_path / 'other', tmp_path / 'lib' / 'link2', target_is_directory=True)  # 同一目标只遍历一次
+    result = scan(tmp_path / 'lib', max_depth=10)
+    assert [rjcode for rjcode, _ in result] == ['RJ000001', 'RJ000002']
+    assert result[1][1] in (os.path.join('link1', 'RJ000002'), os.path.join('link2', 'RJ000002'))
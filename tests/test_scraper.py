@@ -0,0 +1,79 @@
+import pytest
+from requests.exceptions import HTTPError, JSONDecodeError
+from urllib3.connection import HTTPConnection
+
+from scraper import CachedScraper, Dlsite, Locale, Scraper, BACKEND_AIOHTTP, BACKEND_REQUESTS
+
+TRANSLATION = 'RJ000014'  # 模拟服务器中编号能被 7 整除的作品是前一个作品的翻译
+ORPHAN_TRANSLATION = 'RJ000070'  # 原作 RJ000069 不存在
+
+
+@pytest.fixture(params=['scraper', BACKEND_REQUESTS, BACKEND_AIOHTTP])
+def scraper(request, fake_dlsite):
+    if request.param == 'scraper':
+        scraper = Scraper(Locale.ja_jp, sleep_interval=0)
+    else:
+        scraper = CachedScraper(Locale.ja_jp, sleep_interval=0, backend=request.param)
+    yield scraper
+    scraper.close()
+
+
+def test_batch_matches_single(scraper):
+    rjcodes = ['RJ000001', 'RJ000009', TRANSLATION, 'RJ000013', 'BJ000002']
+    metadata_dict = scraper.scrape_metadata_many(rjcodes)
+    assert list(metadata_dict) == rjcodes
+    assert metadata_dict['RJ000009'] is None  # 编号个位为 9 的作品不存在
+    for rjcode in ('RJ000001', TRANSLATION, 'RJ000013', 'BJ000002'):
+        assert metadata_dict[rjcode] == scraper.scrape_metadata(rjcode)
+    with pytest.raises(HTTPError):
+        scraper.scrape_metadata('RJ000009')
+
+
+def test_translation_uses_original_maker(scraper):
+    metadata = scraper.scrape_metadata_many([TRANSLATION])[TRANSLATION]  # 原作不在同一批中
+    assert metadata['rjcode'] == TRANSLATION
+    assert metadata['maker_name'] == 'サークル13'
+
+
+def test_translation_without_original_is_not_found(scraper):
+    with pytest.raises(HTTPError) as exc_info:
+        scraper.scrape_metadata(ORPHAN_TRANSLATION)
+    assert exc_info.value.response.status_code == 404
+    assert scraper.scrape_metadata_many([ORPHAN_TRANSLATION, 'RJ000001'])[ORPHAN_TRANSLATION] is None
+
+
+def test_invalid_json_raises_json_decode_error(scraper, monkeypatch):
+    # 让 product api 的地址指向封面图，响应不是 json
+    monkeypatch.setattr(Dlsite, 'compile_product_api_url',
+                        staticmethod(lambda rjcode: f'{Dlsite.BASE_URL}/img/RJ000001.jpg'))
+    with pytest.raises(JSONDecodeError):
+        scraper.scrape_metadata('RJ000001')
+    with pytest.raises(JSONDecodeError):
+        scraper.scrape_metadata_many(['RJ000002'])
+
+
+def test_batches(fake_dlsite):
+    scraper = Scraper(Locale.ja_jp, sleep_interval=0, batch_size=2)
+    metadata_dict = scraper.scrape_metadata_many(['RJ000001', 'rj000002', 'RJ000001', 'RJ000003', 'RJ000004'])
+    assert list(metadata_dict) == ['RJ000001', 'RJ000002', 'RJ000003', 'RJ000004']  # 去重并保持顺序
+    assert fake_dlsite.counters['product_api'] == 2
+    with pytest.raises(ValueError):
+        scraper.scrape_metadata_many(['RJ1'])
+
+
+@pytest.mark.parametrize('keep_alive, connections', [(True, 1), (False, 3)])
+def test_session_reuses_connections(fake_dlsite, monkeypatch, keep_alive, connections):
+    connect = HTTPConnection.connect
+    opened = []
+
+    def counting_connect(self):
+        opened.append(self.host)
+        return connect(self)
+
+    monkeypatch.setattr(HTTPConnection, 'connect', counting_connect)
+    scraper = Scraper(Locale.ja_jp, sleep_interval=0, keep_alive=keep_alive)
+    for rjcode in ('RJ000001', 'RJ000002', 'RJ000003'):
+        scraper.scrape_metadata(rjcode)
+    scraper.close()
+    assert fake_dlsite.counters['product_api'] == 3
+    assert len(opened) == connections
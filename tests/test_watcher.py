@@ -0,0 +1,50 @@
+import os
+import threading
+import time
+
+from watcher import FolderWatchService, PollingWatcher
+
+
+class RecordingRenamer(object):
+    def __init__(self):
+        self.calls = []
+
+    def rename(self, root_path: str):
+        self.calls.append((root_path, time.monotonic()))
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def test_polling_watcher_reports_changed_entries(tmp_path):
+    os.makedirs(tmp_path / 'old')
+    watcher = PollingWatcher([str(tmp_path)], interval=0.05)
+    assert watcher.read(timeout=0.2) == set()
+    os.makedirs(tmp_path / 'new')
+    assert watcher.read(timeout=0.2) == {str(tmp_path / 'new')}
+    assert watcher.read(timeout=0.2) == set()
+
+
+def test_service_renames_folder_after_quiet_period(tmp_path):
+    renamer = RecordingRenamer()
+    service = FolderWatchService(renamer, [str(tmp_path)], quiet_seconds=0.2, use_inotify=False, poll_interval=0.05)
+    thread = threading.Thread(target=service.run)
+    thread.start()
+    try:
+        time.sleep(0.1)
+        os.makedirs(tmp_path / 'RJ000001')
+        for i in range(3):  # 持续写入时不处理
+            (tmp_path / 'RJ000001' / f'{i}.wav').write_bytes(b'x' * (i + 1))
+            time.sleep(0.1)
+        last_write = time.monotonic()
+        wait_until(lambda: renamer.calls)
+        time.sleep(0.5)
+    finally:
+        service.stop()
+        thread.join()
+    assert [path for path, _ in renamer.calls] == [str(tmp_path / 'RJ000001')]  # 只处理一次
+    assert renamer.calls[0][1] - last_write >= 0.2
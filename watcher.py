@@ -0,0 +1,242 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Iterable, Optional
+
+# inotify 事件，见 <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+def _top_level_entry(roots: list[str], path: str) -> Optional[str]:
+    """
+    :return: path 所在的根文件夹的直接子项。新到达的作品以此为单位处理
+    """
+    for root in roots:
+        rel_path = os.path.relpath(path, root)
+        if rel_path == '.' or rel_path.startswith(os.pardir):
+            continue
+        return os.path.join(root, rel_path.split(os.sep, 1)[0])
+    return None
+
+
+class PollingWatcher(object):
+    """
+    轮询根文件夹的直接子项，新出现或修改时间改变的子项视为有变动
+    适用于不支持 inotify 的平台，以及 inotify 无法感知远端修改的网络共享（SMB/NFS）
+    """
+
+    def __init__(self, roots: list[str], interval: float = 5):
+        self.__roots = roots
+        self.__interval = interval
+        self.__snapshot = self.__take_snapshot()
+        self.__next_poll = time.monotonic() + interval
+
+    def __take_snapshot(self):
+        snapshot: dict[str, int] = {}
+        for root in self.__roots:
+            try:
+                with os.scandir(root) as it:
+                    for entry in it:
+                        try:
+                            snapshot[entry.path] = entry.stat(follow_symlinks=False).st_mtime_ns
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return snapshot
+
+    def read(self, timeout: float) -> set[str]:
+        wait = self.__next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return set()
+        if wait > 0:
+            time.sleep(wait)
+        self.__next_poll = time.monotonic() + self.__interval
+        snapshot = self.__take_snapshot()
+        changed = {path for path, mtime_ns in snapshot.items() if self.__snapshot.get(path, None) != mtime_ns}
+        self.__snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    基于 Linux inotify（通过 ctypes 调用 libc）的文件夹监视器
+    监视根文件夹及其下所有子文件夹，新建或移入的子文件夹会被自动加入监视
+    """
+
+    def __init__(self, roots: list[str]):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self.__libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.__libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.__fd = self.__libc.inotify_init1(IN_CLOEXEC)
+        if self.__fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.__roots = roots
+        self.__watches: dict[int, str] = {}  # {wd: 文件夹路径}
+        for root in roots:
+            self.__add_watch_tree(root)
+
+    def __add_watch(self, dir_path: str):
+        wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, 'inotify 监视数量达到上限（fs.inotify.max_user_watches）', dir_path)
+            return  # 文件夹已被删除等
+        self.__watches[wd] = dir_path
+
+    def __add_watch_tree(self, dir_path: str):
+        self.__add_watch(dir_path)
+        for dirpath, dirnames, _ in os.walk(dir_path):
+            for name in dirnames:
+                self.__add_watch(os.path.join(dirpath, name))
+
+    def read(self, timeout: float) -> set[str]:
+        readable, _, _ = select.select([self.__fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.__fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset: offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，丢失的事件无从得知，只能把所有直接子项视为有变动
+                for root in self.__roots:
+                    with os.scandir(root) as it:
+                        changed.update(entry.path for entry in it)
+                continue
+            if mask & IN_IGNORED:
+                self.__watches.pop(wd, None)
+                continue
+            dir_path = self.__watches.get(wd, None)
+            if dir_path is None or not name:
+                continue
+            path = os.path.join(dir_path, name)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.__add_watch_tree(path)
+            entry = _top_level_entry(self.__roots, path)
+            if entry:
+                changed.add(entry)
+        return changed
+
+    def close(self):
+        os.close(self.__fd)
+
+
+def create_watcher(roots: list[str], use_inotify: bool = True, poll_interval: float = 5):
+    """
+    优先使用 inotify，不可用时改为轮询
+    """
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError):
+            pass  # libc 不支持 inotify
+    return PollingWatcher(roots, poll_interval)
+
+
+def _tree_signature(path: str):
+    """
+    (文件数, 总大小, 最大修改时间)。在静默期前后不变，说明文件夹已写入完成
+    """
+    count = total = latest = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+            count += 1
+            total += st.st_size
+            latest = max(latest, st.st_mtime_ns)
+    return count, total, latest
+
+
+class FolderWatchService(object):
+    """
+    监视收件文件夹，新到达的文件夹静默 quiet_seconds 秒（没有新的写入）后交给 Renamer 处理
+    只处理有变动的直接子项，不重新扫描整个根文件夹；Renamer 及其刮削器在整个运行期间保持，连接与缓存始终可用
+    """
+    logger = logging.getLogger('Renamer')
+
+    def __init__(self, renamer, roots: Iterable[str], quiet_seconds: float = 3, use_inotify: bool = True,
+                 poll_interval: float = 5):
+        self.__renamer = renamer
+        self.__roots = [os.path.abspath(root) for root in roots]
+        self.__quiet_seconds = quiet_seconds
+        self.__use_inotify = use_inotify
+        self.__poll_interval = poll_interval
+        self.__stop_event = threading.Event()
+
+    def stop(self):
+        self.__stop_event.set()
+
+    def run(self):
+        watcher = create_watcher(self.__roots, self.__use_inotify, self.__poll_interval)
+        FolderWatchService.logger.info(f'开始监视（{type(watcher).__name__}）：'
+                                       + '，'.join(f'"{root}"' for root in self.__roots))
+        pending: dict[str, tuple[float, Optional[tuple]]] = {}  # {路径: (最后一次变动的时间, 文件夹签名)}
+        try:
+            while not self.__stop_event.is_set():
+                changed = watcher.read(timeout=min(1.0, self.__quiet_seconds))
+                now = time.monotonic()
+                for path in changed:
+                    pending[path] = (now, None)
+
+                ready = []
+                now = time.monotonic()
+                for path, (last_changed, signature) in list(pending.items()):
+                    if now - last_changed < self.__quiet_seconds:
+                        continue
+                    if not os.path.isdir(path):
+                        del pending[path]  # 已被移走、删除，或不是文件夹
+                        continue
+                    new_signature = _tree_signature(path)
+                    if new_signature != signature:
+                        # 监视器可能感知不到深层的写入，签名在一个静默期前后不变才视为写入完成
+                        pending[path] = (now, new_signature)
+                        continue
+                    del pending[path]
+                    ready.append(path)
+
+                for path in ready:
+                    try:
+                        self.__renamer.rename(path)
+                    except Exception as err:
+                        # 守护进程不因单个文件夹的意外错误退出
+                        FolderWatchService.logger.exception(f'[Unexpected exception] {str(err)}')
+        finally:
+            watcher.close()
+            FolderWatchService.logger.info('停止监视')
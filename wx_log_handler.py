@@ -1,41 +1,110 @@
+import collections
 import logging
 
 import wx
-import wx.lib.newevent
-
-# create event type
-wxLogEvent, EVT_WX_LOG_EVENT = wx.lib.newevent.NewEvent()
 
 
 class WxLogHandler(logging.Handler):
     """
-    A handler class which sends log strings to a wx object
+    A handler class which sends log strings to a wx.TextCtrl
     https://stackoverflow.com/a/2820928
+
+    Records are queued by emit() (from any thread) and written to the control in coalesced batches by a
+    wx.Timer on the GUI thread, so a fast worker thread cannot flood the GUI event queue.
+    The control keeps at most max_lines lines; older lines are removed from the top.
     """
+    FLUSH_INTERVAL_MS = 100
 
-    def __init__(self, wx_dest: wx.Window):
+    def __init__(self, wx_dest: wx.TextCtrl, max_lines: int = 5000, flush_interval_ms: int = FLUSH_INTERVAL_MS):
         """
-        Initialize the handler
-        @param wx_dest: the destination object to post the event to
+        Initialize the handler. Must be called on the GUI thread
+        @param wx_dest: the text control to write to
+        @param max_lines: the maximum number of lines kept in the control
+        @param flush_interval_ms: how often queued records are written to the control
         """
         logging.Handler.__init__(self)
         self.__wxDest = wx_dest
+        self.__max_lines = max_lines
+        self.__queue: collections.deque[tuple[int, str]] = collections.deque()  # append/popleft are thread-safe
         self.level = logging.DEBUG
+        self.__timer = wx.Timer(wx_dest)
+        wx_dest.Bind(wx.EVT_TIMER, self.__on_timer, self.__timer)
+        self.__timer.Start(flush_interval_ms)
+
+    def write(self, levelno: int, message: str):
+        """
+        Queue a message that is not a log record (can be called from any thread)
+        """
+        self.__queue.append((levelno, message.strip('\r') + '\n'))
 
     def flush(self):
         """
-        does nothing for this handler
+        does nothing for this handler, records are written by the timer
         """
 
+    def close(self):
+        self.__timer.Stop()
+        logging.Handler.close(self)
+
     def emit(self, record):
         """
         Emit a record.
         """
         try:
-            msg = self.format(record)
-            evt = wxLogEvent(message=msg, levelno=record.levelno)
-            wx.PostEvent(self.__wxDest, evt)
+            self.write(record.levelno, self.format(record))
         except (KeyboardInterrupt, SystemExit) as err:
             raise err
         except Exception:
             self.handleError(record)
+
+    @staticmethod
+    def __text_color(levelno: int):
+        if levelno <= logging.INFO:
+            return wx.BLACK
+        elif levelno <= logging.WARNING:
+            return wx.BLUE
+        else:
+            return wx.RED
+
+    def __on_timer(self, event):
+        """
+        Write all queued records to the control. Consecutive records of the same color are appended at once
+        """
+        count = len(self.__queue)
+        if not count:
+            return
+        records = [self.__queue.popleft() for _ in range(count)]
+        dropped = 0
+        if len(records) > self.__max_lines:
+            # only the last max_lines lines would stay visible anyway
+            dropped = len(records) - self.__max_lines
+            records = records[dropped:]
+
+        text_ctrl = self.__wxDest
+        text_ctrl.Freeze()
+        try:
+            if dropped:
+                text_ctrl.SetDefaultStyle(wx.TextAttr(wx.BLUE))
+                text_ctrl.AppendText(f'...（省略 {dropped} 条日志，完整日志见日志文件）\n')
+            chunk: list[str] = []
+            chunk_color = None
+            for levelno, message in records:
+                color = WxLogHandler.__text_color(levelno)
+                if color != chunk_color and chunk:
+                    text_ctrl.SetDefaultStyle(wx.TextAttr(chunk_color))
+                    text_ctrl.AppendText(''.join(chunk))
+                    chunk.clear()
+                chunk_color = color
+                chunk.append(message)
+            if chunk:
+                text_ctrl.SetDefaultStyle(wx.TextAttr(chunk_color))
+                text_ctrl.AppendText(''.join(chunk))
+
+            # trim with some slack so that lines are not removed on every flush
+            excess = text_ctrl.GetNumberOfLines() - self.__max_lines
+            if excess > self.__max_lines // 10:
+                text_ctrl.Remove(0, text_ctrl.XYToPosition(0, excess))
+                text_ctrl.SetInsertionPointEnd()
+        finally:
+            text_ctrl.Thaw()
+        text_ctrl.ShowPosition(text_ctrl.GetLastPosition())